@@ -0,0 +1,88 @@
+"""
+Compares the ways of encoding a list of transactions (as GET /user/<id>/transactions
+returns them) to JSON:
+  - datetimes formatted by marshmallow and jsonify with sorted keys (as the API used to do)
+  - datetimes left to the response encoder, with the stdlib json
+  - the response encoder (with simplejson if installed, see service/encoder.py)
+
+    python -m miniverse.benchmark.encoding --transactions 100000
+"""
+import argparse
+import datetime
+import json
+import time
+from flask.json import JSONEncoder
+from marshmallow.utils import isoformat
+from miniverse.model.model import TransactionType
+from miniverse.model.money import to_major_units
+from miniverse.model.schemas import transaction_row_to_dict
+from miniverse.service.encoder import dumps, ResponseEncoder, BACKEND
+from miniverse.service.urldefines import USER_GET_URI
+
+
+def create_rows(transactions):
+    """
+    Rows with the TRANSACTION_COLUMNS of 'transactions' transactions.
+    """
+    created = datetime.datetime.utcnow()
+    return [(i, 100 * i, TransactionType.FUNDS_DEPOSIT, "0000", created + datetime.timedelta(seconds=i))
+            for i in range(1, transactions + 1)]
+
+
+def formatted_row_to_dict(row):
+    transaction_id, amount, transaction_type, user_phone, created = row
+    return {
+        "id": transaction_id,
+        "amount": to_major_units(amount),
+        "type": transaction_type,
+        "user": USER_GET_URI.format(user_id=user_phone),
+        "created": isoformat(created)
+    }
+
+
+def sorted_jsonify(rows):
+    return json.dumps([formatted_row_to_dict(row) for row in rows], cls=JSONEncoder, sort_keys=True,
+                      separators=(",", ":"))
+
+
+def stdlib_encoder(rows):
+    return json.dumps([transaction_row_to_dict(row) for row in rows], default=ResponseEncoder().default,
+                      separators=(",", ":"))
+
+
+def response_encoder(rows):
+    return dumps([transaction_row_to_dict(row) for row in rows])
+
+
+def time_encoder(encoder, rows, repetitions):
+    """
+    Best time (in s) of converting the rows to dicts and encoding them.
+    """
+    best = None
+    for _ in range(repetitions):
+        start = time.time()
+        encoder(rows)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Benchmarks the JSON encoding of transaction lists.")
+    arg_parser.add_argument("--transactions", type=int, default=100000)
+    arg_parser.add_argument("--repetitions", type=int, default=3)
+    options = arg_parser.parse_args()
+
+    transaction_rows = create_rows(options.transactions)
+    assert json.loads(sorted_jsonify(transaction_rows)) == json.loads(response_encoder(transaction_rows))
+
+    encoders = [("isoformat + sorted jsonify", sorted_jsonify),
+                ("encoder (json)", stdlib_encoder)]
+    if BACKEND != "json":
+        encoders.append(("encoder ({0})".format(BACKEND), response_encoder))
+    baseline = None
+    print "{0:<28}{1:>12}{2:>10}".format("encoder", "time (s)", "speedup")
+    for name, encoder in encoders:
+        elapsed = time_encoder(encoder, transaction_rows, options.repetitions)
+        baseline = baseline or elapsed
+        print "{0:<28}{1:>12.3f}{2:>9.1f}x".format(name, elapsed, baseline / elapsed)
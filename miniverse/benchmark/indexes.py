@@ -0,0 +1,119 @@
+"""
+Measures the query time of the main access paths of the transaction and transfer
+tables before and after the indexes of the model are created (by the same migration
+existing DBs get). It fills a DB with synthetic data, so it may take a while
+for the default 10M transactions:
+
+    python -m miniverse.benchmark.indexes --transactions 10000000
+"""
+import argparse
+import datetime
+import os
+import random
+import time
+from sqlalchemy import event
+from sqlalchemy.engine import create_engine
+from sqlalchemy.orm.session import sessionmaker
+from miniverse.control.operations import get_user_transactions
+from miniverse.model.migrations import add_access_path_indexes
+from miniverse.model.model import Base, User, Transaction, Transfer, TransactionType, TransferType
+
+CHUNK_SIZE = 10000
+
+
+def user_phone(user_number):
+    return "{0:010d}".format(user_number)
+
+
+def fast_sqlite_connection(dbapi_connection, connection_record):
+    """
+    We do not care about durability while filling the DB.
+    """
+    dbapi_connection.execute("PRAGMA journal_mode = OFF")
+    dbapi_connection.execute("PRAGMA synchronous = OFF")
+
+
+def fill_db(engine, users, transactions):
+    """
+    Stores 'users' users and 'transactions' transactions (half of them belonging
+    to a transfer) without any secondary index.
+    """
+    Base.metadata.create_all(engine)
+    for index_name in ["ix_transaction_user_phone_id", "ix_transfer_withdrawal_id", "ix_transfer_deposit_id"]:
+        engine.execute("DROP INDEX " + index_name)
+
+    created = datetime.datetime.utcnow()
+    for start in range(0, users, CHUNK_SIZE):
+        engine.execute(User.__table__.insert(), [
+            {"phone_number": user_phone(i), "name": "user", "pass_hash": "-", "funds": 0., "created": created}
+            for i in range(start, min(start + CHUNK_SIZE, users))
+        ])
+
+    # Transactions come in pairs (withdrawal, deposit) and each pair is a transfer
+    for start in range(0, transactions, CHUNK_SIZE):
+        ids = range(start + 1, min(start + CHUNK_SIZE, transactions) + 1)
+        engine.execute(Transaction.__table__.insert(), [
+            {"id": i, "user_phone": user_phone(random.randrange(users)), "amount": 100 if i % 2 == 0 else -100,
+             "type": TransactionType.TRANSFER_DEPOSIT if i % 2 == 0 else TransactionType.TRANSFER_WITHDRAWAL,
+             "created": created}
+            for i in ids
+        ])
+        engine.execute(Transfer.__table__.insert(), [
+            {"id": i // 2, "withdrawal_id": i - 1, "deposit_id": i, "comment": "",
+             "type": TransferType.PUBLIC, "created": created}
+            for i in ids if i % 2 == 0
+        ])
+
+
+def time_queries(session, users, transactions, queries, page_size):
+    """
+    Returns the mean time (in ms) of getting a page of transactions of a user
+    and of finding the transfer of a transaction.
+    """
+    random.seed(0)
+    start = time.time()
+    for _ in range(queries):
+        get_user_transactions(session, user_phone(random.randrange(users)), limit=page_size)
+    user_transactions_time = (time.time() - start) * 1000 / queries
+
+    start = time.time()
+    for _ in range(queries):
+        transaction_id = random.randrange(1, transactions + 1)
+        session.query(Transfer.id).filter((Transfer.withdrawal_id == transaction_id) |
+                                          (Transfer.deposit_id == transaction_id)).first()
+    transfer_time = (time.time() - start) * 1000 / queries
+    return user_transactions_time, transfer_time
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Benchmarks the indexes of the transaction and transfer tables.")
+    arg_parser.add_argument("--db", default="index_benchmark.db", help="Sqlite DB file (it will be overwritten).")
+    arg_parser.add_argument("--transactions", type=int, default=10000000)
+    arg_parser.add_argument("--users", type=int, default=100000)
+    arg_parser.add_argument("--queries", type=int, default=20, help="Queries of each type to time.")
+    arg_parser.add_argument("--page-size", type=int, default=50)
+    options = arg_parser.parse_args()
+
+    if os.path.exists(options.db):
+        os.remove(options.db)
+    engine = create_engine("sqlite:///" + options.db)
+    event.listen(engine, "connect", fast_sqlite_connection)
+
+    start = time.time()
+    fill_db(engine, options.users, options.transactions)
+    print "DB filled in {0:.1f} s".format(time.time() - start)
+
+    session = sessionmaker(bind=engine)()
+    before = time_queries(session, options.users, options.transactions, options.queries, options.page_size)
+
+    start = time.time()
+    with engine.begin() as connection:
+        add_access_path_indexes(connection)
+    print "Indexes created in {0:.1f} s".format(time.time() - start)
+
+    after = time_queries(session, options.users, options.transactions, options.queries, options.page_size)
+
+    print "{0:<24}{1:>14}{2:>14}{3:>10}".format("query (mean ms)", "no index", "index", "speedup")
+    for name, no_index_time, index_time in zip(["user transactions page", "transfer of transaction"], before, after):
+        print "{0:<24}{1:>14.3f}{2:>14.3f}{3:>9.0f}x".format(name, no_index_time, index_time,
+                                                           no_index_time / max(index_time, 1e-6))
@@ -0,0 +1,243 @@
+"""
+Measures the wall time and the number of SQL statements of each operation of
+control/operations.py, on in-memory and file sqlite DBs filled with several
+numbers of users (each one with TRANSFERS_PER_USER transfers):
+
+    python -m miniverse.benchmark.operations --sizes 100 10000 --save baseline.json
+
+Results can be compared with a saved baseline. Operations slower than the
+baseline by more than --threshold, or running more statements, are flagged as
+regressions (and the exit code is 1). Slowdowns under MIN_SLOWDOWN_MS are ignored
+as noise:
+
+    python -m miniverse.benchmark.operations --sizes 100 10000 --compare baseline.json
+
+The balance cache is disabled, so reads always hit the DB. File DBs are created
+in a temporary directory, which is deleted after the run.
+"""
+import argparse
+import datetime
+import json
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from sqlalchemy import event
+from sqlalchemy.engine import create_engine
+from sqlalchemy.orm.session import sessionmaker
+from tabulate import tabulate
+from miniverse.control.cache import set_balance_cache, NullCache
+from miniverse.control.operations import create_user, bulk_create_users, get_user, get_user_balance, \
+    create_transaction, get_transaction, get_user_transactions, iter_user_transactions, create_transfer, \
+    execute_transfer, execute_transfers, get_transfer, get_transfers
+from miniverse.model.migrations import upgrade
+from miniverse.model.model import User, Transaction, Transfer, TransactionType, TransferType
+
+CHUNK_SIZE = 10000
+TRANSFERS_PER_USER = 10
+USER_FUNDS = 10 ** 9 # cents
+MIN_SLOWDOWN_MS = 0.1
+# Urls of the DBs; {directory} is a temporary directory
+DBS = {
+    "memory": "sqlite://",
+    "file": "sqlite:///{directory}/operations_benchmark_{users}.db"
+}
+
+
+def user_id(user_number):
+    return "{0:010d}".format(user_number)
+
+
+def user_uri(user_number):
+    return "/user/" + user_id(user_number)
+
+
+def fill_db(engine, users):
+    """
+    Stores 'users' users and TRANSFERS_PER_USER transfers for each one (between
+    consecutive users).
+    """
+    created = datetime.datetime.utcnow()
+    for start in range(0, users, CHUNK_SIZE):
+        engine.execute(User.__table__.insert(), [
+            {"phone_number": user_id(i), "name": "user", "pass_hash": "-", "funds": USER_FUNDS, "created": created}
+            for i in range(start, min(start + CHUNK_SIZE, users))
+        ])
+
+    transactions = 2 * TRANSFERS_PER_USER * users
+    for start in range(0, transactions, CHUNK_SIZE):
+        ids = range(start + 1, min(start + CHUNK_SIZE, transactions) + 1)
+        engine.execute(Transaction.__table__.insert(), [
+            {"id": i, "user_phone": user_id((i // 2 + i % 2) % users), "amount": 100 if i % 2 == 0 else -100,
+             "type": TransactionType.TRANSFER_DEPOSIT if i % 2 == 0 else TransactionType.TRANSFER_WITHDRAWAL,
+             "created": created}
+            for i in ids
+        ])
+        engine.execute(Transfer.__table__.insert(), [
+            {"id": i // 2, "withdrawal_id": i - 1, "deposit_id": i, "comment": "",
+             "type": TransferType.PUBLIC, "created": created}
+            for i in ids if i % 2 == 0
+        ])
+
+
+class StatementCounter(object):
+    """
+    Counts the statements executed by an engine.
+    """
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self.on_execute)
+
+    def on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+
+def transaction_pair(session, i, users):
+    """
+    Creates (uncommitted) the two transactions of a transfer, as create_transfer expects.
+    """
+    withdrawal_uri = create_transaction(session, user_uri(i % users), -1, TransactionType.TRANSFER_WITHDRAWAL,
+                                        commit=False)
+    deposit_uri = create_transaction(session, user_uri((i + 1) % users), 1, TransactionType.TRANSFER_DEPOSIT,
+                                     commit=False)
+    return withdrawal_uri, deposit_uri
+
+
+def transfer_batch(i, users, transfers=10):
+    return [{"sender": user_uri((i + j) % users), "receiver": user_uri((i + j + 1) % users), "amount": 1,
+             "comment": "", "type": TransferType.PUBLIC} for j in range(transfers)]
+
+
+# Each operation gets the session, the number of the call and the number of
+# users. Setups (not measured) prepare the arguments of the call.
+OPERATIONS = [
+    ("create_user", None, lambda session, i, users, args:
+        create_user(session, "new{0:07d}".format(i), "user", "-", 10.)),
+    ("bulk_create_users (100)", None, lambda session, i, users, args:
+        bulk_create_users(session, [{"phone_number": "bulk{0:06d}{1:03d}".format(i, j), "name": "user",
+                                     "pass_hash": "-"} for j in range(100)])),
+    ("get_user", None, lambda session, i, users, args: get_user(session, user_id(i % users))),
+    ("get_user_balance", None, lambda session, i, users, args: get_user_balance(session, user_id(i % users))),
+    ("create_transaction", None, lambda session, i, users, args:
+        create_transaction(session, user_uri(i % users), 1, TransactionType.FUNDS_DEPOSIT)),
+    ("get_transaction", None, lambda session, i, users, args: get_transaction(session, i + 1)),
+    ("get_transaction(expand)", None, lambda session, i, users, args: get_transaction(session, i + 1, expand=True)),
+    ("get_user_transactions", None, lambda session, i, users, args:
+        get_user_transactions(session, user_id(i % users))),
+    ("get_user_transactions(expand)", None, lambda session, i, users, args:
+        get_user_transactions(session, user_id(i % users), expand=True)),
+    ("iter_user_transactions(expand)", None, lambda session, i, users, args:
+        list(iter_user_transactions(session, user_id(i % users), expand=True))),
+    ("create_transfer", transaction_pair, lambda session, i, users, args:
+        create_transfer(session, args[0], args[1], "", TransferType.PUBLIC)),
+    ("execute_transfer", None, lambda session, i, users, args:
+        execute_transfer(session, user_uri(i % users), user_uri((i + 1) % users), 1, "", TransferType.PUBLIC)),
+    ("execute_transfers (10)", None, lambda session, i, users, args:
+        execute_transfers(session, transfer_batch(i, users))),
+    ("get_transfer", None, lambda session, i, users, args: get_transfer(session, i + 1)),
+    ("get_transfer(expand)", None, lambda session, i, users, args: get_transfer(session, i + 1, expand=True)),
+    ("get_transfers(expand) (10)", None, lambda session, i, users, args:
+        get_transfers(session, range(10 * i + 1, 10 * i + 11), expand=True))
+]
+
+
+def benchmark_operations(db_url, users, repeat):
+    """
+    Returns the median time (in ms) and the mean number of statements of each
+    operation, called 'repeat' times on a DB with 'users' users. Every call gets
+    a new session, as a request does.
+    """
+    engine = create_engine(db_url)
+    upgrade(engine)
+    fill_db(engine, users)
+    Session = sessionmaker(bind=engine)
+    counter = StatementCounter(engine)
+
+    results = {}
+    for name, setup, operation in OPERATIONS:
+        times = []
+        statements = 0
+        for i in range(repeat):
+            session = Session()
+            args = setup(session, i, users) if setup is not None else None
+            counter.count = 0
+            start = time.time()
+            operation(session, i, users, args)
+            times.append((time.time() - start) * 1000)
+            statements += counter.count
+            session.close()
+        times.sort()
+        results[name] = {"ms": times[len(times) // 2], "statements": statements / float(repeat)}
+    engine.dispose()
+    return results
+
+
+def run_benchmarks(dbs, sizes, repeat):
+    """
+    Returns the results of every operation, keyed by "db/users/operation".
+    """
+    results = {}
+    directory = tempfile.mkdtemp(prefix="miniverse-benchmark-")
+    try:
+        for db in dbs:
+            for users in sizes:
+                db_url = DBS[db].format(directory=directory, users=users)
+                for name, result in benchmark_operations(db_url, users, repeat).items():
+                    results["{0}/{1}/{2}".format(db, users, name)] = result
+    finally:
+        shutil.rmtree(directory)
+    return results
+
+
+def compare(baseline, results, threshold):
+    """
+    Returns a row for each result also in the baseline, and the names of the
+    regressions: operations more than 'threshold' (ex. 0.2 for 20%) slower or
+    running more statements.
+    """
+    rows = []
+    regressions = []
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        old, new = baseline[name], results[name]
+        slower = new["ms"] > old["ms"] * (1 + threshold) and new["ms"] - old["ms"] > MIN_SLOWDOWN_MS
+        more_statements = new["statements"] > old["statements"]
+        if slower or more_statements:
+            regressions.append(name)
+        rows.append([name, old["ms"], new["ms"], new["ms"] / max(old["ms"], 1e-6), old["statements"],
+                     new["statements"], "REGRESSION" if slower or more_statements else ""])
+    return rows, regressions
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Benchmarks the operations of control/operations.py.")
+    arg_parser.add_argument("--dbs", nargs="+", choices=sorted(DBS), default=sorted(DBS))
+    arg_parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000], help="Numbers of users.")
+    arg_parser.add_argument("--repeat", type=int, default=50, help="Calls to each operation.")
+    arg_parser.add_argument("--save", help="JSON file to save the results to (ex. a new baseline).")
+    arg_parser.add_argument("--compare", help="JSON file with the baseline to compare the results with.")
+    arg_parser.add_argument("--threshold", type=float, default=0.2,
+                            help="Slowdown over the baseline considered a regression.")
+    options = arg_parser.parse_args()
+
+    set_balance_cache(NullCache())
+    benchmark_results = run_benchmarks(options.dbs, options.sizes, options.repeat)
+
+    if options.save:
+        with open(options.save, "w") as baseline_file:
+            json.dump({"python": platform.python_version(), "repeat": options.repeat,
+                       "results": benchmark_results}, baseline_file, indent=2, sort_keys=True)
+
+    if options.compare:
+        with open(options.compare) as baseline_file:
+            comparison, found_regressions = compare(json.load(baseline_file)["results"], benchmark_results,
+                                                    options.threshold)
+        print tabulate(comparison, ["operation", "baseline ms", "ms", "ratio", "baseline stmts", "stmts", ""],
+                       floatfmt=".3f")
+        print "\n{0} regressions".format(len(found_regressions))
+        sys.exit(1 if found_regressions else 0)
+
+    print tabulate([[name, result["ms"], result["statements"]] for name, result in sorted(benchmark_results.items())],
+                   ["operation", "ms", "stmts"], floatfmt=".3f")
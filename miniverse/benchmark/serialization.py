@@ -0,0 +1,80 @@
+"""
+Compares the ways of serializing the transactions of a user:
+  - a new TransactionSchema per transaction (as operations used to do)
+  - a single reused TransactionSchema(many=True)
+  - plain rows serialized with transaction_row_to_dict, without ORM objects
+
+    python -m miniverse.benchmark.serialization --transactions 100000
+"""
+import argparse
+import datetime
+import time
+from sqlalchemy.engine import create_engine
+from sqlalchemy.orm.session import sessionmaker
+from miniverse.model.model import Base, User, Transaction, TransactionType
+from miniverse.model.schemas import TransactionSchema, TRANSACTIONS_SCHEMA, TRANSACTION_COLUMNS, \
+    transaction_row_to_dict
+
+USER_ID = "0000"
+
+
+def fill_db(engine, transactions):
+    Base.metadata.create_all(engine)
+    engine.execute(User.__table__.insert(), phone_number=USER_ID, name="user", pass_hash="-", funds=0)
+    created = datetime.datetime.utcnow()
+    engine.execute(Transaction.__table__.insert(), [
+        {"user_phone": USER_ID, "amount": 100, "type": TransactionType.FUNDS_DEPOSIT, "created": created}
+        for _ in range(transactions)
+    ])
+
+
+def schema_per_transaction(session):
+    transactions = session.query(Transaction).filter(Transaction.user_phone == USER_ID).all()
+    return [TransactionSchema().dump(transaction).data for transaction in transactions]
+
+
+def reused_many_schema(session):
+    transactions = session.query(Transaction).filter(Transaction.user_phone == USER_ID).all()
+    return TRANSACTIONS_SCHEMA.dump(transactions).data
+
+
+def rows_to_dicts(session):
+    rows = session.query(*TRANSACTION_COLUMNS).filter(Transaction.user_phone == USER_ID).all()
+    return [transaction_row_to_dict(row) for row in rows]
+
+
+def time_serializer(session_maker, serializer, repetitions):
+    """
+    Best time (in s) of querying and serializing all the transactions, with a
+    new session each time so no ORM object is reused.
+    """
+    best = None
+    for _ in range(repetitions):
+        session = session_maker()
+        start = time.time()
+        serializer(session)
+        elapsed = time.time() - start
+        session.close()
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Benchmarks the serialization of transactions.")
+    arg_parser.add_argument("--transactions", type=int, default=100000)
+    arg_parser.add_argument("--repetitions", type=int, default=3)
+    options = arg_parser.parse_args()
+
+    engine = create_engine("sqlite://")
+    fill_db(engine, options.transactions)
+    session_maker = sessionmaker(bind=engine)
+
+    serializers = [("schema per transaction", schema_per_transaction),
+                   ("reused many=True schema", reused_many_schema),
+                   ("rows to dicts", rows_to_dicts)]
+    baseline = None
+    print "{0:<26}{1:>12}{2:>10}".format("serializer", "time (s)", "speedup")
+    for name, serializer in serializers:
+        elapsed = time_serializer(session_maker, serializer, options.repetitions)
+        baseline = baseline or elapsed
+        print "{0:<26}{1:>12.3f}{2:>9.1f}x".format(name, elapsed, baseline / elapsed)
@@ -0,0 +1,86 @@
+"""
+Measures the throughput of many threads depositing money to the same user,
+with its balance in a single row and sharded (see control/sharding.py):
+
+    python -m miniverse.benchmark.sharding --db-url mysql+pymysql://root:password@db:3306/miniverse_benchmark --threads 32
+
+The DB is dropped and recreated, so do not point it to a DB with real data.
+Sqlite locks the whole DB on every write, so sharding can not help there; the
+gain shows with DBs with row locks (ex. MySQL).
+"""
+import argparse
+import threading
+import time
+from sqlalchemy.engine import create_engine
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm.session import sessionmaker
+from miniverse.control.cache import set_balance_cache, NullCache
+from miniverse.control.operations import create_user, create_transaction, get_user_balance
+from miniverse.control.sharding import enable_balance_sharding, set_balance_shards
+from miniverse.model.migrations import upgrade
+from miniverse.model.model import Base, TransactionType
+
+RECEIVER_ID = "0000"
+
+
+def deposit(Session, deposits, failures):
+    session = Session()
+    for _ in range(deposits):
+        try:
+            create_transaction(session, "/user/" + RECEIVER_ID, 1, TransactionType.FUNDS_DEPOSIT)
+        except OperationalError:
+            session.rollback()
+            failures.append(1)
+    session.close()
+
+
+def time_deposits(engine, threads, deposits, shards):
+    """
+    Returns the deposits per second and the number of failed deposits (ex. by
+    lock timeouts) when 'threads' threads make 'deposits' deposits each.
+    """
+    Base.metadata.drop_all(bind=engine)
+    upgrade(engine)
+    Session = sessionmaker(bind=engine)
+    session = Session()
+    create_user(session, RECEIVER_ID, "shop", "-")
+    if shards:
+        enable_balance_sharding(session, RECEIVER_ID, shards)
+
+    failures = []
+    workers = [threading.Thread(target=deposit, args=(Session, deposits, failures)) for _ in range(threads)]
+    start = time.time()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.time() - start
+
+    # All the money arrived
+    assert get_user_balance(session, RECEIVER_ID) == threads * deposits - len(failures)
+    session.close()
+    set_balance_shards(RECEIVER_ID, 0)
+    return (threads * deposits - len(failures)) / elapsed, len(failures)
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Benchmarks deposits to a single user with a sharded balance.")
+    arg_parser.add_argument("--db-url", default="sqlite:///sharding_benchmark.db",
+                            help="SQLAlchemy url of the DB (it will be dropped).")
+    arg_parser.add_argument("--threads", type=int, default=16)
+    arg_parser.add_argument("--deposits", type=int, default=200, help="Deposits of each thread.")
+    arg_parser.add_argument("--shards", type=int, nargs="+", default=[0, 4, 16],
+                            help="Numbers of shards to compare (0 is the user row).")
+    options = arg_parser.parse_args()
+
+    if make_url(options.db_url).get_backend_name() == "sqlite":
+        engine = create_engine(options.db_url, connect_args={"timeout": 60})
+    else:
+        engine = create_engine(options.db_url, pool_size=options.threads, max_overflow=0)
+    set_balance_cache(NullCache())
+
+    print "{0:>8}{1:>16}{2:>10}".format("shards", "deposits/s", "failed")
+    for shards in options.shards:
+        throughput, failures = time_deposits(engine, options.threads, options.deposits, shards)
+        print "{0:>8}{1:>16.1f}{2:>10}".format(shards, throughput, failures)
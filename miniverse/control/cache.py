@@ -0,0 +1,185 @@
+"""
+Caches used by the operations. The balance cache keeps the funds of the users (in minor units)
+so that balance polling does not hit the DB. Operations invalidate the balance of
+a user when they change it (see operations.touch_user).
+
+The default backend is an in-process LRU cache, so each process has its own copy
+and other processes only see a change once their copy expires. Deployments
+with more than one process should plug a shared backend with ExternalCache.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+BALANCE_CACHE_SIZE = int(os.environ.get("MINIVERSE_BALANCE_CACHE_SIZE", 100000))
+BALANCE_CACHE_TTL = float(os.environ.get("MINIVERSE_BALANCE_CACHE_TTL", 30))
+
+
+class CacheBackend(object):
+    """
+    Interface of the caches. 'get' returns None for missing keys, so None
+    values can not be cached.
+    Every invalidation increases the 'generation' of the cache. A value read
+    from the DB is only stored if the generation has not changed since before
+    the read; otherwise it could be older than a change invalidated meanwhile.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        raise NotImplementedError()
+
+    def set(self, key, value, generation=None):
+        raise NotImplementedError()
+
+    def delete(self, key):
+        raise NotImplementedError()
+
+    def clear(self):
+        raise NotImplementedError()
+
+    def count_get(self, value):
+        with self.lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def count_invalidation(self):
+        with self.lock:
+            self.generation += 1
+            self.invalidations += 1
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations
+        }
+
+
+class NullCache(CacheBackend):
+    """
+    A cache that stores nothing (i.e. caching is disabled).
+    """
+    def get(self, key):
+        return None
+
+    def set(self, key, value, generation=None):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def clear(self):
+        pass
+
+
+class LRUCache(CacheBackend):
+    """
+    In-process cache holding up to 'maxsize' values for 'ttl' seconds. When it is
+    full, the least recently used value is evicted.
+    """
+    def __init__(self, maxsize=BALANCE_CACHE_SIZE, ttl=BALANCE_CACHE_TTL, clock=time.time):
+        super(LRUCache, self).__init__()
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.values = OrderedDict()
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self.lock:
+            value = None
+            if key in self.values:
+                value, expiry = self.values.pop(key)
+                if expiry > self.clock():
+                    self.values[key] = (value, expiry)
+                else:
+                    value = None
+                    self.expirations += 1
+        return self.count_get(value)
+
+    def set(self, key, value, generation=None):
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return
+            self.values.pop(key, None)
+            self.values[key] = (value, self.clock() + self.ttl)
+            while len(self.values) > self.maxsize:
+                self.values.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        self.count_invalidation()
+        with self.lock:
+            self.values.pop(key, None)
+
+    def clear(self):
+        self.count_invalidation()
+        with self.lock:
+            self.values.clear()
+
+    def stats(self):
+        stats = super(LRUCache, self).stats()
+        stats.update({
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "size": len(self.values)
+        })
+        return stats
+
+
+class ExternalCache(CacheBackend):
+    """
+    Adapter for caches living out of the process (ex. a redis or memcached client).
+    'client' must provide get(key), set(key, value, ttl) and delete(key), and
+    store strings. Values are stored as json under 'prefix' + key.
+    Only the invalidations made by this process change the generation, so the
+    ttl still bounds how long a value read during a change in another process
+    can be stale.
+    """
+    def __init__(self, client, prefix="miniverse:", ttl=BALANCE_CACHE_TTL):
+        super(ExternalCache, self).__init__()
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def get(self, key):
+        value = self.client.get(self.prefix + str(key))
+        return self.count_get(json.loads(value) if value is not None else None)
+
+    def set(self, key, value, generation=None):
+        if generation is not None and generation != self.generation:
+            return
+        self.client.set(self.prefix + str(key), json.dumps(value), self.ttl)
+
+    def delete(self, key):
+        self.count_invalidation()
+        self.client.delete(self.prefix + str(key))
+
+    def clear(self):
+        raise NotImplementedError("External caches must be cleared by their own means.")
+
+
+_balance_cache = LRUCache() if BALANCE_CACHE_SIZE > 0 and BALANCE_CACHE_TTL > 0 else NullCache()
+
+
+def get_balance_cache():
+    return _balance_cache
+
+
+def set_balance_cache(cache):
+    """
+    Replaces the balance cache (ex. by an ExternalCache or a NullCache).
+    """
+    global _balance_cache
+    _balance_cache = cache
@@ -0,0 +1,215 @@
+"""
+Group commit: money transactions submitted by concurrent requests are created
+by a single committer thread, which commits them in batches (of up to
+'max_batch' transactions, waiting at most 'max_delay' seconds for a batch to
+fill). Each commit (and its fsync) is shared by the whole batch. Requests wait
+until the batch of their transaction is committed, so they still get a result
+that is durable.
+"""
+import logging
+import Queue
+import threading
+import time
+from miniverse.control.histogram import Histogram
+from miniverse.control.operations import create_transaction
+from miniverse.model.exceptions import NotEnoughMoneyException, CommitTimeoutException
+from miniverse.model.sessionsingleton import DbSessionHolder
+
+MAX_BATCH = 100
+MAX_DELAY = 0.005
+WAIT_TIMEOUT = 10 # seconds
+
+BATCH_SIZE_BUCKETS = [1, 2, 5, 10, 20, 50, 100, 200, 500]
+LATENCY_BUCKETS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000] # ms
+
+logger = logging.getLogger(__name__)
+
+
+class PendingTransaction(object):
+    """
+    A transaction waiting to be committed. 'on_created(session, transaction_uri)'
+    is called in the same DB transaction after creating it.
+    """
+    def __init__(self, user_uri, amount, transaction_type, on_created=None):
+        self.user_uri = user_uri
+        self.amount = amount
+        self.transaction_type = transaction_type
+        self.on_created = on_created
+        self.submitted = time.time()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def set_result(self, result, error):
+        self.result = result
+        self.error = error
+        self.done.set()
+
+    def wait(self, timeout=None):
+        """
+        Waits until the transaction is committed and returns its uri, or raises
+        the exception that made it fail. After a timeout (CommitTimeoutException),
+        the transaction may still be committed.
+        """
+        if not self.done.wait(timeout):
+            raise CommitTimeoutException("The transaction was not committed in time.")
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class GroupCommitter(threading.Thread):
+    """
+    Submitters should not wait for their transactions for more than 'wait_timeout'
+    seconds (ex. if the DB hangs).
+    """
+    def __init__(self, max_batch=MAX_BATCH, max_delay=MAX_DELAY, wait_timeout=WAIT_TIMEOUT):
+        super(GroupCommitter, self).__init__(name="group-committer")
+        self.daemon = True
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.wait_timeout = wait_timeout
+        self.queue = Queue.Queue()
+        self.stopping = False
+        self.batch_sizes = Histogram(BATCH_SIZE_BUCKETS)
+        self.latencies = Histogram(LATENCY_BUCKETS)
+
+    def submit(self, user_uri, amount, transaction_type, on_created=None):
+        """
+        Queues a transaction (see create_transaction) and returns its PendingTransaction.
+        """
+        pending = PendingTransaction(user_uri, amount, transaction_type, on_created)
+        self.queue.put(pending)
+        return pending
+
+    def stop(self):
+        """
+        Commits the queued transactions and stops the thread.
+        """
+        self.queue.put(None)
+        self.join()
+
+    def run(self):
+        while not self.stopping:
+            batch = self.next_batch()
+            if not batch:
+                continue
+            try:
+                self.commit_batch(batch)
+            except Exception, e:
+                # The thread must survive, or every later submitter would wait until it times out
+                logger.exception("A group commit batch failed.")
+                for pending in batch:
+                    if not pending.done.is_set():
+                        pending.set_result(None, e)
+
+    def next_batch(self):
+        """
+        Waits for a transaction, and then for more until the batch is full or
+        'max_delay' has passed.
+        """
+        batch = []
+        deadline = None
+        while len(batch) < self.max_batch:
+            try:
+                if deadline is None:
+                    pending = self.queue.get()
+                    deadline = time.time() + self.max_delay
+                else:
+                    pending = self.queue.get(timeout=max(deadline - time.time(), 0))
+            except Queue.Empty:
+                break
+            if pending is None:
+                self.stopping = True
+                break
+            batch.append(pending)
+        return batch
+
+    def commit_batch(self, batch):
+        """
+        Creates all the transactions of the batch in one DB transaction. If it
+        can not be committed, they are committed one by one, so only the
+        failing ones fail.
+        """
+        session = DbSessionHolder().get_session()
+        try:
+            results = [self.create(session, pending) for pending in batch]
+            session.commit()
+        except Exception:
+            session.rollback()
+            results = [self.commit_one(session, pending) for pending in batch]
+        finally:
+            self.remove_session()
+
+        # Stats are recorded before waking up the submitters, so they see their batch in them
+        now = time.time()
+        for pending in batch:
+            self.latencies.observe((now - pending.submitted) * 1000)
+        self.batch_sizes.observe(len(batch))
+        for pending, (result, error) in zip(batch, results):
+            pending.set_result(result, error)
+
+    def create(self, session, pending):
+        """
+        Creates a transaction without committing it. Returns its uri and None,
+        or None and the exception if it was rejected (without changing anything).
+        """
+        try:
+            transaction_uri = create_transaction(session, pending.user_uri, pending.amount,
+                                                 pending.transaction_type, commit=False)
+        except (KeyError, ValueError, NotEnoughMoneyException), e:
+            return None, e
+        if pending.on_created is not None:
+            pending.on_created(session, transaction_uri)
+        return transaction_uri, None
+
+    def remove_session(self):
+        """
+        The transactions are already committed or rolled back, so a failure to
+        close the session must not fail them.
+        """
+        try:
+            DbSessionHolder().remove_session()
+        except Exception:
+            logger.exception("The session of the group committer could not be closed.")
+
+    def commit_one(self, session, pending):
+        try:
+            result = self.create(session, pending)
+            session.commit()
+            return result
+        except Exception, e:
+            session.rollback()
+            return None, e
+
+    def stats(self):
+        return {
+            "batch_size": self.batch_sizes.as_dict(),
+            "latency_ms": self.latencies.as_dict(),
+            "queued": self.queue.qsize()
+        }
+
+
+_group_committer = None
+
+
+def get_group_committer():
+    """
+    Returns the running committer, or None if group commit is disabled.
+    """
+    return _group_committer
+
+
+def start_group_committer(max_batch=MAX_BATCH, max_delay=MAX_DELAY, wait_timeout=WAIT_TIMEOUT):
+    global _group_committer
+    if _group_committer is None:
+        _group_committer = GroupCommitter(max_batch, max_delay, wait_timeout)
+        _group_committer.start()
+    return _group_committer
+
+
+def stop_group_committer():
+    global _group_committer
+    if _group_committer is not None:
+        _group_committer.stop()
+        _group_committer = None
@@ -0,0 +1,34 @@
+import threading
+from bisect import bisect_left
+
+
+class Histogram(object):
+    """
+    Thread safe histogram counting the observed values in buckets, given by their
+    upper bounds (plus an implicit one for the values above the last bound).
+    """
+    def __init__(self, bounds):
+        self.bounds = sorted(bounds)
+        self.lock = threading.Lock()
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.
+
+    def observe(self, value):
+        with self.lock:
+            self.counts[bisect_left(self.bounds, value)] += 1
+            self.count += 1
+            self.sum += value
+
+    def as_dict(self):
+        """
+        Buckets are cumulative: each one counts the values lower or equal than
+        its bound ('le'), as in Prometheus.
+        """
+        with self.lock:
+            buckets = []
+            cumulative = 0
+            for bound, count in zip(self.bounds + ["+Inf"], self.counts):
+                cumulative += count
+                buckets.append({"le": bound, "count": cumulative})
+            return {"buckets": buckets, "count": self.count, "sum": self.sum}
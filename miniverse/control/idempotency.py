@@ -0,0 +1,95 @@
+"""
+Idempotency keys: the response to a request that moves money and has an
+Idempotency-Key header is stored in the same DB transaction as the money
+movement. Retries with the same key get the stored response, without running
+the operation again. Only successful responses are stored (failed requests do
+not move money, so they can just be retried).
+
+Stored responses are kept IDEMPOTENCY_KEY_TTL seconds (see
+tools/purge_idempotency_keys.py), and the ones read recently are also kept in
+an in-process cache.
+"""
+import datetime
+import hashlib
+import json
+import os
+from miniverse.control.cache import LRUCache
+from miniverse.model.model import IdempotencyKey
+
+IDEMPOTENCY_KEY_TTL = float(os.environ.get("MINIVERSE_IDEMPOTENCY_KEY_TTL", 24 * 3600))
+IDEMPOTENCY_CACHE_SIZE = int(os.environ.get("MINIVERSE_IDEMPOTENCY_CACHE_SIZE", 10000))
+MAX_KEY_LENGTH = 128
+
+_response_cache = LRUCache(maxsize=IDEMPOTENCY_CACHE_SIZE, ttl=IDEMPOTENCY_KEY_TTL)
+
+
+def get_response_cache():
+    return _response_cache
+
+
+def get_request_hash(endpoint, data):
+    return hashlib.sha256(endpoint + json.dumps(data, sort_keys=True)).hexdigest()
+
+
+def check_key(key):
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise ValueError("Idempotency keys must have between 1 and " + str(MAX_KEY_LENGTH) + " characters.")
+
+
+def get_stored_response(session, key, endpoint, data):
+    """
+    Returns the stored response (a dictionary with 'status', 'location' and 'body')
+    to the request with 'key', or None if there is none. Raises ValueError if the
+    key was used for a different request.
+    """
+    check_key(key)
+    stored = _response_cache.get(key)
+    if stored is None:
+        row = session.query(IdempotencyKey.request_hash, IdempotencyKey.status, IdempotencyKey.location,
+                            IdempotencyKey.body).filter(IdempotencyKey.key == key).first()
+        if row is None:
+            return None
+        stored = {
+            "request_hash": row.request_hash,
+            "status": row.status,
+            "location": row.location,
+            "body": json.loads(row.body)
+        }
+        _response_cache.set(key, stored)
+
+    if stored["request_hash"] != get_request_hash(endpoint, data):
+        raise ValueError("This Idempotency-Key was already used for a different request.")
+    return stored
+
+
+def store_response(session, key, endpoint, data, status, location, body):
+    """
+    Adds the response to the request with 'key' to the session. It must be
+    committed together with the changes made by the request.
+    """
+    check_key(key)
+    session.add(IdempotencyKey(key=key,
+                               endpoint=endpoint,
+                               request_hash=get_request_hash(endpoint, data),
+                               status=status,
+                               location=location,
+                               body=json.dumps(body)))
+
+
+def purge_idempotency_keys(session, ttl=IDEMPOTENCY_KEY_TTL, chunk_size=10000):
+    """
+    Deletes the stored responses older than 'ttl' seconds, in chunks of 'chunk_size'
+    keys (each one in its own DB transaction). Returns the number of deleted keys.
+    """
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=ttl)
+    deleted = 0
+    while True:
+        keys = [key for key, in session.query(IdempotencyKey.key)
+                .filter(IdempotencyKey.created < cutoff).limit(chunk_size)]
+        if not keys:
+            break
+        deleted += session.query(IdempotencyKey).filter(IdempotencyKey.key.in_(keys))\
+            .delete(synchronize_session=False)
+        session.commit()
+    session.rollback()
+    return deleted
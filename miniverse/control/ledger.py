@@ -0,0 +1,144 @@
+"""
+Ledger mode: funds changes are only appended as transactions, and User.funds
+is not updated. The balance of a user is read from its BalanceSnapshot plus the
+transactions created after it, and a compactor (see tools/compact_ledger.py)
+periodically folds the transactions into the snapshots. Deposits do not lock
+any row, so hot accounts receiving many transfers do not serialize on their
+user row; withdrawals still lock the snapshot of the sender to check its funds.
+
+Ledger mode is enabled in every process with MINIVERSE_LEDGER_MODE=1, after
+creating the snapshots with 'start_ledger' (and disabled after folding them
+back into User.funds with 'stop_ledger'). Both must run while no funds are
+being moved.
+"""
+import datetime
+import os
+from sqlalchemy import and_, exists, func, select
+from miniverse.control.sharding import total_funds
+from miniverse.model.exceptions import NotEnoughMoneyException
+from miniverse.model.model import User, Transaction, BalanceSnapshot, BalanceShard
+
+LEDGER_MODE = os.environ.get("MINIVERSE_LEDGER_MODE", "").lower() in ("1", "true", "yes")
+
+# Transactions are folded once they are this old (in seconds), so all the
+# transactions with lower ids have been committed (or rolled back) by then
+COMPACTION_GRACE = float(os.environ.get("MINIVERSE_LEDGER_COMPACTION_GRACE", 60))
+
+_ledger_mode = LEDGER_MODE
+
+
+def is_ledger_mode():
+    return _ledger_mode
+
+
+def set_ledger_mode(enabled):
+    global _ledger_mode
+    _ledger_mode = enabled
+
+
+def _unfolded_amount(horizon=None):
+    """
+    Sum of the transactions of the user of a snapshot that are not folded into
+    it yet (up to the transaction 'horizon', if given).
+    """
+    conditions = [Transaction.user_phone == BalanceSnapshot.user_phone,
+                  Transaction.id > BalanceSnapshot.last_transaction_id]
+    if horizon is not None:
+        conditions.append(Transaction.id <= horizon)
+    return select([func.coalesce(func.sum(Transaction.amount), 0)]).where(and_(*conditions)).as_scalar()
+
+
+def get_ledger_balances(session, user_ids):
+    """
+    Returns the balances (in minor units) of the users that have a snapshot.
+    """
+    if not user_ids:
+        return {}
+    rows = session.query(BalanceSnapshot.user_phone, BalanceSnapshot.funds + _unfolded_amount())\
+        .filter(BalanceSnapshot.user_phone.in_(user_ids)).all()
+    return dict((user_id, int(balance)) for user_id, balance in rows)
+
+
+def get_ledger_balance(session, user_id):
+    """
+    Balance (in minor units) of a user.
+    """
+    balance = session.query(BalanceSnapshot.funds + _unfolded_amount())\
+        .filter(BalanceSnapshot.user_phone == user_id).all()[0][0]
+    return int(balance)
+
+
+def debit_ledger_funds(session, user_id, amount):
+    """
+    Checks that a user can afford withdrawing 'amount' (in minor units, a negative
+    number). The snapshot and the recent transactions of the user are locked until
+    the DB transaction ends, so withdrawals of the same user are serialized.
+    """
+    snapshot = session.query(BalanceSnapshot.funds, BalanceSnapshot.last_transaction_id)\
+        .filter(BalanceSnapshot.user_phone == user_id).with_for_update().first()
+    if snapshot is None:
+        raise NotEnoughMoneyException("Not enough money in your wallet!")
+
+    # A locking read, so it sees the last committed transactions
+    unfolded = session.query(func.coalesce(func.sum(Transaction.amount), 0))\
+        .filter(Transaction.user_phone == user_id,
+                Transaction.id > snapshot.last_transaction_id)\
+        .with_for_update().scalar()
+    if snapshot.funds + int(unfolded) + amount < 0:
+        raise NotEnoughMoneyException("Not enough money in your wallet!")
+
+
+def compact_ledger(session, grace=COMPACTION_GRACE):
+    """
+    Folds the transactions older than 'grace' seconds into the snapshots of their
+    users, with a single UPDATE. Returns the number of updated snapshots.
+    """
+    start = session.query(func.max(BalanceSnapshot.last_transaction_id)).scalar() or 0
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=grace)
+    horizon = session.query(func.max(Transaction.id))\
+        .filter(Transaction.id > start, Transaction.created < cutoff).scalar()
+    if horizon is None:
+        session.rollback()
+        return 0
+
+    changed_users = select([Transaction.user_phone]).where(and_(Transaction.id > start, Transaction.id <= horizon))
+    updated = session.query(BalanceSnapshot)\
+        .filter(BalanceSnapshot.user_phone.in_(changed_users),
+                BalanceSnapshot.last_transaction_id < horizon)\
+        .update({BalanceSnapshot.funds: BalanceSnapshot.funds + _unfolded_amount(horizon),
+                 BalanceSnapshot.last_transaction_id: horizon},
+                synchronize_session=False)
+    session.commit()
+    return updated
+
+
+def start_ledger(session):
+    """
+    Creates the snapshots of the users that do not have one from their current
+    funds. Sharded balances are not used in ledger mode, so shards are deleted.
+    Returns the number of created snapshots.
+    """
+    last_transaction_id = select([func.coalesce(func.max(Transaction.id), 0)])\
+        .where(Transaction.user_phone == User.phone_number).as_scalar()
+    users = select([User.phone_number, func.coalesce(total_funds(), 0), last_transaction_id])\
+        .where(~exists().where(BalanceSnapshot.user_phone == User.phone_number))
+    created = session.execute(BalanceSnapshot.__table__.insert().from_select(
+        ["user_phone", "funds", "last_transaction_id"], users)).rowcount
+    session.query(BalanceShard).delete(synchronize_session=False)
+    session.commit()
+    return created
+
+
+def stop_ledger(session):
+    """
+    Stores the ledger balance of every user in User.funds and deletes the
+    snapshots. Returns the number of updated users.
+    """
+    ledger_balance = select([BalanceSnapshot.funds + _unfolded_amount()])\
+        .where(BalanceSnapshot.user_phone == User.phone_number).as_scalar()
+    updated = session.query(User)\
+        .filter(exists().where(BalanceSnapshot.user_phone == User.phone_number))\
+        .update({User.funds: ledger_balance}, synchronize_session=False)
+    session.query(BalanceSnapshot).delete(synchronize_session=False)
+    session.commit()
+    return updated
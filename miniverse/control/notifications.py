@@ -0,0 +1,213 @@
+"""
+Notifications of balance changes, so clients can wait for a change of their
+balance instead of polling it. When a DB transaction that changed the funds of
+some users commits, their ids are published (see operations.touch_user), and
+every subscription to any of them is woken up.
+
+The default notifier is in-process, so it only sees the changes made by this
+process. Deployments with more than one process should plug a shared pub/sub
+channel with ExternalNotifier (ex. setting MINIVERSE_NOTIFIER_URL to a redis url,
+see service/app.py); otherwise waiters have to re-check their balance every
+'max_wait' seconds to see the changes of the other processes.
+"""
+import json
+import logging
+import threading
+import time
+from miniverse.control.cache import get_balance_cache
+
+# Seconds to wait before reconnecting to a pub/sub channel
+RECONNECT_DELAY = 1
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription(object):
+    """
+    Notifications of the changes of a user. Notifications received while nobody
+    is waiting are not lost: the next wait returns at once.
+    """
+    def __init__(self, notifier, user_id):
+        self.notifier = notifier
+        self.user_id = user_id
+        self.event = threading.Event()
+
+    def wait(self, timeout):
+        """
+        Waits up to 'timeout' seconds (or the 'max_wait' of the notifier, if it
+        is shorter) for a notification. Returns True if there was one.
+        """
+        if self.notifier.max_wait is not None:
+            timeout = min(timeout, self.notifier.max_wait)
+        notified = self.event.wait(timeout)
+        self.event.clear()
+        return notified
+
+    def close(self):
+        self.notifier.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class LocalNotifier(object):
+    """
+    In-process pub/sub of the ids of the users whose funds changed. If set,
+    'max_wait' bounds every wait of the subscriptions, so waiters re-check
+    changes the notifier may not see (ex. the ones of other processes).
+    """
+    def __init__(self, max_wait=None):
+        self.max_wait = max_wait
+        self.lock = threading.Lock()
+        self.subscriptions = {}
+        self.published = 0
+        self.delivered = 0
+
+    def subscribe(self, user_id):
+        subscription = Subscription(self, user_id)
+        with self.lock:
+            self.subscriptions.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            user_subscriptions = self.subscriptions.get(subscription.user_id, set())
+            user_subscriptions.discard(subscription)
+            if not user_subscriptions:
+                self.subscriptions.pop(subscription.user_id, None)
+
+    def publish(self, user_ids):
+        with self.lock:
+            self.published += 1
+        self.deliver(user_ids)
+
+    def deliver(self, user_ids):
+        """
+        Wakes up the subscriptions to any of 'user_ids'.
+        """
+        with self.lock:
+            woken = [subscription for user_id in user_ids for subscription in self.subscriptions.get(user_id, ())]
+            self.delivered += len(woken)
+        for subscription in woken:
+            subscription.event.set()
+
+    def wake_all(self):
+        with self.lock:
+            user_ids = list(self.subscriptions)
+        self.deliver(user_ids)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "subscribed_users": len(self.subscriptions),
+                "subscriptions": sum(len(subscriptions) for subscriptions in self.subscriptions.values()),
+                "published": self.published,
+                "delivered": self.delivered
+            }
+
+
+class ExternalNotifier(LocalNotifier):
+    """
+    Adapter for pub/sub channels living out of the process (ex. a redis client).
+    'client' must provide publish(channel, message) and pubsub(), returning an
+    object with subscribe(channel) and listen() (an iterator of dictionaries
+    with a 'type' and the 'data' of the message), as redis-py does.
+    A thread delivers the messages of 'channel' (including the ones published by
+    this process) to the subscriptions of this process. The balances of the
+    notified users are dropped from the balance cache, as they may have been
+    changed by another process.
+    If the channel fails, the thread logs the error and reconnects, and then
+    wakes up every subscription, as notifications may have been missed.
+    """
+    def __init__(self, client, channel="miniverse:balances", max_wait=None):
+        super(ExternalNotifier, self).__init__(max_wait)
+        self.client = client
+        self.channel = channel
+        self.errors = 0
+        self.listener = threading.Thread(target=self.listen, args=(self.connect(),), name="notification-listener")
+        self.listener.daemon = True
+        self.listener.start()
+
+    def connect(self):
+        pubsub = self.client.pubsub()
+        pubsub.subscribe(self.channel)
+        return pubsub
+
+    def publish(self, user_ids):
+        """
+        Errors are only logged: the changes are already committed, and waiters
+        still see them when they time out.
+        """
+        with self.lock:
+            self.published += 1
+        try:
+            self.client.publish(self.channel, json.dumps(sorted(user_ids)))
+        except Exception:
+            self.count_error()
+            logger.exception("Balance changes could not be notified.")
+
+    def listen(self, pubsub):
+        while True:
+            try:
+                if pubsub is None:
+                    pubsub = self.connect()
+                    self.wake_all()
+                for message in pubsub.listen():
+                    if message["type"] == "message":
+                        self.receive(message["data"])
+            except Exception:
+                self.count_error()
+                logger.exception("Balance notifications could not be received, reconnecting.")
+            pubsub = None
+            time.sleep(RECONNECT_DELAY)
+
+    def receive(self, data):
+        try:
+            user_ids = json.loads(data)
+        except ValueError:
+            self.count_error()
+            logger.exception("Invalid balance notification: %r", data)
+            return
+        balance_cache = get_balance_cache()
+        for user_id in user_ids:
+            balance_cache.delete(user_id)
+        self.deliver(user_ids)
+
+    def count_error(self):
+        with self.lock:
+            self.errors += 1
+
+    def stats(self):
+        stats = super(ExternalNotifier, self).stats()
+        stats["errors"] = self.errors
+        return stats
+
+
+def create_redis_notifier(url, max_wait=None):
+    """
+    ExternalNotifier publishing through the redis server of 'url' (ex.
+    redis://localhost:6379/0). redis is an optional dependency (pip install redis).
+    """
+    try:
+        import redis
+    except ImportError:
+        raise ImportError("Notifications through redis need the redis client (pip install redis).")
+    return ExternalNotifier(redis.StrictRedis.from_url(url), max_wait=max_wait)
+
+
+_balance_notifier = LocalNotifier()
+
+
+def get_balance_notifier():
+    return _balance_notifier
+
+
+def set_balance_notifier(notifier):
+    """
+    Replaces the balance notifier (ex. by an ExternalNotifier).
+    """
+    global _balance_notifier
+    _balance_notifier = notifier
@@ -1,36 +1,200 @@
-from miniverse.model.exceptions import NotEnoughMoneyException, AsymmetricTransferException
-from miniverse.model.model import User, Transaction, Transfer, TransactionType, TransferType
-from miniverse.model.schemas import UserSchema, TransactionSchema, TransferSchema
+import time
+from itertools import islice
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, joinedload
+from miniverse.control.cache import get_balance_cache
+from miniverse.control.ledger import is_ledger_mode, get_ledger_balance, get_ledger_balances, debit_ledger_funds
+from miniverse.control.notifications import get_balance_notifier
+from miniverse.control.sharding import add_to_shard, shards_funds, total_funds
+from miniverse.model.exceptions import NotEnoughMoneyException, AsymmetricTransferException, \
+    ConcurrentUpdateException
+from miniverse.model.model import User, Transaction, Transfer, TransactionType, TransferType, BalanceSnapshot
+from miniverse.model.money import to_minor_units, to_major_units
+from miniverse.model.schemas import USER_SCHEMA, TRANSACTION_SCHEMA, TRANSFER_SCHEMA, TRANSACTION_COLUMNS, \
+    transaction_row_to_dict
 from miniverse.service.urldefines import USER_GET_URI, TRANSACTION_GET_URI, TRANSFER_GET_URI
 
+# Users whose funds have been changed in the current transaction of a session
+TOUCHED_USERS = "touched_users"
+# Users whose changes have been committed, to be notified once the transaction ends
+COMMITTED_USERS = "committed_users"
+
+
+def touch_user(session, user_id):
+    """
+    Must be called when the funds of a user change. Cached balances are
+    invalidated now and when the transaction of the session ends, so no read
+    can cache a value older than the change. If the transaction commits, the
+    change is notified (see control/notifications.py).
+    """
+    session.info.setdefault(TOUCHED_USERS, set()).add(user_id)
+    get_balance_cache().delete(user_id)
+
+
+@event.listens_for(Session, "after_commit")
+def mark_touched_users_committed(session):
+    if session.transaction.parent is None and TOUCHED_USERS in session.info:
+        session.info[COMMITTED_USERS] = set(session.info[TOUCHED_USERS])
+
+
+@event.listens_for(Session, "after_transaction_end")
+def invalidate_touched_users(session, transaction):
+    if transaction.parent is None and TOUCHED_USERS in session.info:
+        balance_cache = get_balance_cache()
+        for user_id in session.info.pop(TOUCHED_USERS):
+            balance_cache.delete(user_id)
+    # Notified after the invalidation, so woken readers do not get cached balances
+    if transaction.parent is None and COMMITTED_USERS in session.info:
+        get_balance_notifier().publish(session.info.pop(COMMITTED_USERS))
+
 
 def create_user(session, phone_number, name, pass_hash, funds=0.0):
     """
     Inserts a new user/player in the DB.
     """
     # Perform the db job
-    user = User(phone_number=phone_number, name=name, pass_hash=pass_hash, funds=funds)
+    user = User(phone_number=phone_number, name=name, pass_hash=pass_hash, funds=to_minor_units(funds))
     session.add(user)
+    if is_ledger_mode():
+        session.add(BalanceSnapshot(user_phone=phone_number, funds=user.funds, last_transaction_id=0))
+    touch_user(session, phone_number)
     session.commit()
     return USER_GET_URI.format(user_id=phone_number)
 
 
+def bulk_create_users(session, users, chunk_size=1000):
+    """
+    Inserts many users in the DB. 'users' can be any iterable (even a generator)
+    of dictionaries with the keys 'phone_number', 'name', 'pass_hash' and,
+    optionally, 'funds'. Users are inserted with one multi-row statement per chunk,
+    and each chunk is committed separately. Users whose phone number is already
+    in use are skipped. Returns the number of created users and the list of
+    skipped phone numbers.
+    """
+    created = 0
+    duplicates = []
+    users = iter(users)
+    chunk = list(islice(users, chunk_size))
+    while chunk:
+        # Skip phone numbers repeated in the chunk or already stored
+        phone_numbers = [user["phone_number"] for user in chunk]
+        used = set(row.phone_number for row in
+                   session.query(User.phone_number).filter(User.phone_number.in_(phone_numbers)))
+        rows = []
+        for user in chunk:
+            if user["phone_number"] in used:
+                duplicates.append(user["phone_number"])
+                continue
+            used.add(user["phone_number"])
+            touch_user(session, user["phone_number"])
+            rows.append({
+                "phone_number": user["phone_number"],
+                "name": user["name"],
+                "pass_hash": user["pass_hash"],
+                "funds": to_minor_units(user.get("funds", 0))
+            })
+
+        if rows:
+            session.execute(User.__table__.insert(), rows)
+            if is_ledger_mode():
+                session.execute(BalanceSnapshot.__table__.insert(), [
+                    {"user_phone": row["phone_number"], "funds": row["funds"], "last_transaction_id": 0}
+                    for row in rows
+                ])
+        session.commit()
+        created += len(rows)
+        chunk = list(islice(users, chunk_size))
+    return created, duplicates
+
+
 def get_user(session, user_id):
     """
     Gets a user with id = name from the database. Returns a json.
     """
-    user = session.query(User).get(user_id)
-    user_schema = UserSchema()
-    user_json = user_schema.dump(user).data
+    return _serialize_user(session, session.query(User).get(user_id))
+
+
+def _serialize_user(session, user):
+    """
+    Every serialized user (ex. expanded ones) must go through here: User.funds
+    is only a part of the balance with sharding, and not kept up to date in
+    ledger mode, so the balance is read apart.
+    """
+    user_json = USER_SCHEMA.dump(user).data
+    if user is not None:
+        user_json["funds"] = get_user_balance(session, user.phone_number)
     return user_json
 
 
 def get_user_balance(session, user_id):
     """
-    Gets the funds of a user with user_id = name
+    Gets the funds of a user with user_id = name. Balances are cached, unless
+    the session has changed them and not committed yet.
+    """
+    return to_major_units(_get_user_funds(session, user_id))
+
+
+def get_user_version(session, user_id):
+    """
+    Returns a string that changes whenever the funds of the user change (ex. to
+    use as an ETag). It is cached with the balance, so it is usually free. The
+    balance is part of it because sharded and ledger deposits do not change
+    the user row.
+    """
+    funds, version = _get_user_funds_and_version(session, user_id)
+    return "{0}-{1}".format(version, funds)
+
+
+def wait_for_user_change(session, user_id, version, timeout):
+    """
+    Waits up to 'timeout' seconds until the version of a user (see get_user_version)
+    is not 'version', and returns the current one. The session is closed while
+    waiting, so no DB connection is held.
+    """
+    deadline = time.time() + timeout
+    with get_balance_notifier().subscribe(user_id) as subscription:
+        current = get_user_version(session, user_id)
+        remaining = deadline - time.time()
+        while current == version and remaining > 0:
+            session.close()
+            subscription.wait(remaining)
+            current = get_user_version(session, user_id)
+            remaining = deadline - time.time()
+    return current
+
+
+def _get_user_funds(session, user_id):
+    """
+    Same as get_user_balance, in minor units (which is what the cache stores).
+    """
+    return _get_user_funds_and_version(session, user_id)[0]
+
+
+def _get_user_funds_and_version(session, user_id):
+    """
+    Funds (in minor units) and version of a user, which are cached together.
+    Raises KeyError if the user does not exist.
     """
-    balance = session.query(User.funds).filter(User.phone_number == user_id).all()
-    return balance[0][0]
+    balance_cache = get_balance_cache()
+    is_touched = user_id in session.info.get(TOUCHED_USERS, ())
+    if not is_touched:
+        cached = balance_cache.get(user_id)
+        if cached is not None:
+            return tuple(cached)
+
+    generation = balance_cache.generation
+    if is_ledger_mode():
+        version = session.query(User.version).filter(User.phone_number == user_id).scalar()
+        funds = get_ledger_balance(session, user_id) if version is not None else None
+    else:
+        funds, version = session.query(total_funds(), User.version).filter(User.phone_number == user_id)\
+            .first() or (None, None)
+    if version is None:
+        raise KeyError("User " + str(user_id) + " does not exist.")
+    if not is_touched:
+        balance_cache.set(user_id, (funds, version), generation)
+    return funds, version
 
 
 def check_user_has_enough_money(session, user_id, amount):
@@ -38,8 +202,8 @@ def check_user_has_enough_money(session, user_id, amount):
     Checks that we can subtract 'amount' and still have funds. If not, an
     exception is raised. 'amount' is usually a negative number.
     """
-    user_funds = get_user_balance(session, user_id)
-    if user_funds + amount < 0:
+    user_funds = _get_user_funds(session, user_id)
+    if user_funds + to_minor_units(amount) < 0:
         raise NotEnoughMoneyException("Not enough money in your wallet!")
 
 
@@ -47,13 +211,64 @@ def update_user_funds(session, user_id, amount):
     """
     Changes user funds by the given quantity 'amount'
     """
-    session.query(User).filter_by(phone_number=user_id).update({'funds': User.funds + amount})
+    _add_user_funds(session, user_id, to_minor_units(amount))
+
+
+def _add_user_funds(session, user_id, amount):
+    """
+    Same as update_user_funds, with 'amount' in minor units. The amount goes to
+    a shard if the balance of the user is sharded.
+    """
+    touch_user(session, user_id)
+    if not add_to_shard(session, user_id, amount):
+        session.query(User).filter_by(phone_number=user_id).update({'funds': User.funds + amount,
+                                                                     'version': User.version + 1})
+
+
+def debit_user_funds(session, user_id, amount):
+    """
+    Changes user funds by 'amount' (usually a negative number) only if the user
+    can afford it. The check and the update are done in a single UPDATE statement,
+    so two concurrent withdrawals can not both pass the check.
+    """
+    _debit_user_funds(session, user_id, to_minor_units(amount))
+
+
+def _debit_user_funds(session, user_id, amount):
+    """
+    Same as debit_user_funds, with 'amount' in minor units. The check includes
+    the shards of the user, if any.
+    """
+    touch_user(session, user_id)
+    updated_rows = session.query(User).filter(User.phone_number == user_id,
+                                              User.funds + shards_funds() + amount >= 0)\
+        .update({'funds': User.funds + amount, 'version': User.version + 1}, synchronize_session=False)
+    if updated_rows == 0:
+        raise NotEnoughMoneyException("Not enough money in your wallet!")
+
+
+def _apply_transaction_amount(session, user_id, amount):
+    """
+    Changes the funds of a user by the 'amount' (in minor units) of a new transaction.
+    Withdrawals raise NotEnoughMoneyException if the user can not afford them.
+    In ledger mode the transaction itself changes the balance, so only
+    withdrawals have to touch the DB (to check the funds).
+    """
+    if is_ledger_mode():
+        touch_user(session, user_id)
+        if amount < 0:
+            debit_ledger_funds(session, user_id, amount)
+    elif amount < 0:
+        _debit_user_funds(session, user_id, amount)
+    else:
+        _add_user_funds(session, user_id, amount)
 
 
 def create_transaction(session, user_uri, amount, transaction_type, commit=True):
     """
     Registers a new money transaction in the DB.
-    Checks if the transaction is coherent with the user funds.
+    Checks if the transaction is coherent with the user funds (a withdrawal
+    raises NotEnoughMoneyException if the user can not afford it).
     Only commits if 'commit' is set to true. This allows us to completely rollback
     transfers.
     """
@@ -61,15 +276,15 @@ def create_transaction(session, user_uri, amount, transaction_type, commit=True)
     if transaction_type not in TransactionType.all_values():
         raise ValueError(transaction_type + " is not a proper TransactionType.")
 
+    amount = to_minor_units(amount)
     if amount == 0:
         raise ValueError("If no money is moved, this is not a money transaction!")
 
     # First we get the user id
     user_id = user_uri.split("/")[-1]
 
-    # Perform a security check
-    if amount < 0:
-        check_user_has_enough_money(session, user_id, amount)
+    # Update user's funds. Withdrawals are checked against the current funds
+    _apply_transaction_amount(session, user_id, amount)
 
     # Create the resource
     transaction = Transaction(user_phone=user_id, amount=amount, type=transaction_type)
@@ -77,9 +292,6 @@ def create_transaction(session, user_uri, amount, transaction_type, commit=True)
     session.flush()
     transaction_id = transaction.id
 
-    # Update user's funds
-    update_user_funds(session, user_id, amount)
-
     # And go go go!
     if commit:
         session.commit()
@@ -88,46 +300,82 @@ def create_transaction(session, user_uri, amount, transaction_type, commit=True)
 
 def get_transaction(session, transaction_id, expand=False):
     """
-    Returns a money transaction stored in the DB
+    Returns a money transaction stored in the DB. If 'expand' is true, the
+    user is loaded in the same query.
     """
-    transaction = session.query(Transaction).get(transaction_id)
-    transaction_schema = TransactionSchema()
-    transaction_json = transaction_schema.dump(transaction).data
-    # We may want to expand the user
+    query = session.query(Transaction)
     if expand:
-        user_id = transaction_json["user"].split("/")[-1]
-        user_json = get_user(session, user_id)
-        transaction_json["user"] = user_json
+        query = query.options(joinedload(Transaction.user))
+    transaction = query.filter(Transaction.id == transaction_id).first()
+    transaction_json = TRANSACTION_SCHEMA.dump(transaction).data
+    # We may want to expand the user
+    if expand and transaction is not None:
+        transaction_json["user"] = _serialize_user(session, transaction.user)
     return transaction_json
 
 
-def get_user_transactions(session, user_id, expand=False):
+def _user_transactions_query(session, user_id, expand, after_id):
     """
-    Returns all the transactions a user has performed.
+    Query for the transactions of a user (rows with all the TRANSACTION_COLUMNS
+    if 'expand' is true, only ids otherwise) sorted by id, starting after the
+    transaction 'after_id'. Rows are not loaded as ORM objects, as we only
+    need to serialize them.
     """
+    query = session.query(*TRANSACTION_COLUMNS) if expand else session.query(Transaction.id)
+    query = query.filter(Transaction.user_phone == user_id)
+    if after_id is not None:
+        query = query.filter(Transaction.id > after_id)
+    return query.order_by(Transaction.id)
+
+
+def _serialize_user_transaction(row, expand):
     if expand:
-        result = session.query(Transaction).filter(Transaction.user_phone == user_id).all()
-        transaction_schema = TransactionSchema()
-        transactions = [transaction_schema.dump(r).data for r in result]
-    else:
-        result = session.query(Transaction.id).filter(Transaction.user_phone == user_id).all()
-        transactions = [TRANSACTION_GET_URI.format(transaction_id=r.id) for r in result]
-    return transactions
+        return transaction_row_to_dict(row)
+    return TRANSACTION_GET_URI.format(transaction_id=row.id)
 
 
-def check_transfer_is_symmetric(session, withdrawal_id, deposit_id):
+def get_user_transactions(session, user_id, expand=False, after_id=None, limit=None):
+    """
+    Returns all the transactions a user has performed, sorted by id. Use 'after_id'
+    and 'limit' to get them by pages (keyset pagination): 'after_id' is the id of
+    the last transaction of the previous page.
+    """
+    query = _user_transactions_query(session, user_id, expand, after_id)
+    if limit is not None:
+        query = query.limit(limit)
+    return [_serialize_user_transaction(row, expand) for row in query]
+
+
+def iter_user_transactions(session, user_id, expand=False, after_id=None, batch_size=1000):
+    """
+    Same as get_user_transactions, but yields the transactions one by one while
+    they are fetched from the DB in batches of 'batch_size' rows.
+    """
+    query = _user_transactions_query(session, user_id, expand, after_id).yield_per(batch_size)
+    for row in query:
+        yield _serialize_user_transaction(row, expand)
+
+
+def check_amounts_are_symmetric(withdrawal_amount, deposit_amount):
     """
     Makes a couple of tests over the moved quantities.
     """
-    w = get_transaction(session, withdrawal_id)
-    d = get_transaction(session, deposit_id)
-    if w["amount"] > 0:
+    if withdrawal_amount > 0:
         raise ValueError("The withdrawn amount must be negative.")
 
-    if w["amount"] != -d["amount"]:
+    if withdrawal_amount != -deposit_amount:
         raise AsymmetricTransferException("In a transfer, the withdrawn amount and deposited amount must have same absolute value.")
 
 
+def check_transfer_is_symmetric(session, withdrawal_id, deposit_id):
+    """
+    Makes a couple of tests over the moved quantities of two stored transactions.
+    """
+    amounts = dict(session.query(Transaction.id, Transaction.amount)
+                   .filter(Transaction.id.in_([withdrawal_id, deposit_id])))
+    check_amounts_are_symmetric(amounts[withdrawal_id], amounts[deposit_id])
+
+
 def create_transfer(session, withdrawal_uri, deposit_uri, comment, transfer_type):
     """
     Adds a transfer to the database. The transactions have already been created.
@@ -156,24 +404,184 @@ def create_transfer(session, withdrawal_uri, deposit_uri, comment, transfer_type
     return TRANSFER_GET_URI.format(transfer_id=transfer_id)
 
 
-def get_transfer(session, transfer_id, expand=False):
+def build_transfer(sender_uri, receiver_uri, amount, comment, transfer_type):
     """
-    Obtains a transfer from the DB and serializes it to a dict. It will
-    return an "expanded" dict with transaction data instead of resource uris
-    if 'expand' is true.
+    Checks the parameters of a transfer and creates (but does not store) the
+    transfer and its two transactions. Raises ValueError for any wrong parameter
+    (ex. values of the wrong type coming from a json body).
+    """
+    # Check parameters
+    if not isinstance(transfer_type, basestring):
+        raise ValueError("The type of a transfer must be a TransferType.")
+    if transfer_type not in TransferType.all_values():
+        raise ValueError(transfer_type + " is not a proper TransferType.")
+    if not isinstance(sender_uri, basestring) or not isinstance(receiver_uri, basestring):
+        raise ValueError("The sender and the receiver must be user uris.")
+    if not isinstance(comment, basestring):
+        raise ValueError("The comment must be a string.")
+
+    amount = to_minor_units(amount)
+    if amount == 0:
+        raise ValueError("If no money is moved, this is not a money transaction!")
+
+    sender_id = sender_uri.split("/")[-1]
+    receiver_id = receiver_uri.split("/")[-1]
+
+    withdrawal = Transaction(user_phone=sender_id, amount=-amount, type=TransactionType.TRANSFER_WITHDRAWAL)
+    deposit = Transaction(user_phone=receiver_id, amount=amount, type=TransactionType.TRANSFER_DEPOSIT)
+    check_amounts_are_symmetric(withdrawal.amount, deposit.amount)
+
+    return Transfer(withdrawal=withdrawal,
+                    deposit=deposit,
+                    comment=comment,
+                    type=transfer_type)
+
+
+def execute_transfer(session, sender_uri, receiver_uri, amount, comment, transfer_type, commit=True):
+    """
+    Moves 'amount' from the sender to the receiver. Both fund updates, the two
+    transactions and the transfer are written in a single flush, and the symmetry
+    of the transfer is checked in memory instead of reading the transactions back.
+    """
+    transfer = build_transfer(sender_uri, receiver_uri, amount, comment, transfer_type)
+
+    # Move the money
+    _apply_transaction_amount(session, transfer.withdrawal.user_phone, transfer.withdrawal.amount)
+    _apply_transaction_amount(session, transfer.deposit.user_phone, transfer.deposit.amount)
+
+    # Store transactions and transfer
+    session.add(transfer)
+    session.flush()
+    transfer_id = transfer.id
+
+    if commit:
+        session.commit()
+    return TRANSFER_GET_URI.format(transfer_id=transfer_id)
+
+
+def execute_transfers(session, transfers, chunk_size=None):
+    """
+    Executes a batch of transfers. 'transfers' is a list of dictionaries with the
+    keys 'sender', 'receiver', 'amount', 'comment' and 'type'. Every transfer is
+    checked before touching the DB. The valid ones are stored in one DB transaction
+    per chunk of 'chunk_size' transfers (or a single one if it is None), and each
+    user appearing in a chunk gets a single fund update.
+    Returns a list with the uri of the created transfer or the raised exception
+    for each one of the input transfers.
+    """
+    results = [None] * len(transfers)
+
+    # Check the parameters of every transfer
+    pending = []
+    for i, transfer_data in enumerate(transfers):
+        try:
+            if not isinstance(transfer_data, dict):
+                raise ValueError("Transfer " + str(i) + " is not properly defined.")
+            pending.append((i, build_transfer(transfer_data["sender"],
+                                              transfer_data["receiver"],
+                                              transfer_data["amount"],
+                                              transfer_data["comment"],
+                                              transfer_data["type"])))
+        except (KeyError, ValueError, AsymmetricTransferException), e:
+            results[i] = e
+
+    chunk_size = chunk_size or len(pending) or 1
+    for start in range(0, len(pending), chunk_size):
+        _execute_transfer_chunk(session, pending[start:start + chunk_size], results)
+    return results
+
+
+def _execute_transfer_chunk(session, pending, results):
+    """
+    Executes and commits a chunk of checked transfers (a list of their positions
+    and Transfers, see 'execute_transfers'), storing their results in 'results'.
     """
-    transfer = session.query(Transfer).get(transfer_id)
-    transfer_schema = TransferSchema()
-    transfer_json = transfer_schema.dump(transfer).data
+    # Replay the transfers over the current funds of the involved users
+    user_ids = set()
+    for _, transfer in pending:
+        user_ids.update([transfer.withdrawal.user_phone, transfer.deposit.user_phone])
+    funds = {}
+    if is_ledger_mode():
+        funds = get_ledger_balances(session, user_ids)
+    elif user_ids:
+        funds = dict(session.query(User.phone_number, total_funds()).filter(User.phone_number.in_(user_ids)).all())
+
+    accepted = []
+    fund_changes = {}
+    for i, transfer in pending:
+        sender_id = transfer.withdrawal.user_phone
+        receiver_id = transfer.deposit.user_phone
+        if receiver_id not in funds:
+            results[i] = ValueError("User " + receiver_id + " does not exist.")
+        elif sender_id not in funds or funds[sender_id] + transfer.withdrawal.amount < 0:
+            results[i] = NotEnoughMoneyException("Not enough money in your wallet!")
+        else:
+            funds[sender_id] += transfer.withdrawal.amount
+            funds[receiver_id] += transfer.deposit.amount
+            fund_changes[sender_id] = fund_changes.get(sender_id, 0) + transfer.withdrawal.amount
+            fund_changes[receiver_id] = fund_changes.get(receiver_id, 0) + transfer.deposit.amount
+            accepted.append((i, transfer))
+
+    if not accepted:
+        session.rollback()
+        return
+
+    try:
+        # One update per user, always in the same order to avoid deadlocks
+        for user_id in sorted(fund_changes):
+            if fund_changes[user_id] != 0:
+                _apply_transaction_amount(session, user_id, fund_changes[user_id])
+
+        session.add_all([transfer for _, transfer in accepted])
+        session.flush()
+        for i, transfer in accepted:
+            results[i] = TRANSFER_GET_URI.format(transfer_id=transfer.id)
+        session.commit()
+
+    except NotEnoughMoneyException:
+        # Funds have changed since we read them
+        session.rollback()
+        for i, _ in accepted:
+            results[i] = ConcurrentUpdateException("Funds changed while processing the batch, please retry.")
+
+    except IntegrityError, e:
+        session.rollback()
+        for i, _ in accepted:
+            results[i] = e
 
+
+def _serialize_transfer(transfer, expand):
+    transfer_json = TRANSFER_SCHEMA.dump(transfer).data
     # If we want to expand the transactions
     if expand:
-        withdrawal_id = int(transfer_json["withdrawal"].split("/")[-1])
-        deposit_id = int(transfer_json["deposit"].split("/")[-1])
-        withdrawal_json = get_transaction(session, withdrawal_id)
-        deposit_json = get_transaction(session, deposit_id)
-        transfer_json["withdrawal"] = withdrawal_json
-        transfer_json["deposit"] = deposit_json
-
+        transfer_json["withdrawal"] = TRANSACTION_SCHEMA.dump(transfer.withdrawal).data
+        transfer_json["deposit"] = TRANSACTION_SCHEMA.dump(transfer.deposit).data
     return transfer_json
 
+
+def _transfers_query(session, expand):
+    query = session.query(Transfer)
+    if expand:
+        query = query.options(joinedload(Transfer.withdrawal), joinedload(Transfer.deposit))
+    return query
+
+
+def get_transfer(session, transfer_id, expand=False):
+    """
+    Obtains a transfer from the DB and serializes it to a dict. It will
+    return an "expanded" dict with transaction data instead of resource uris
+    if 'expand' is true (the transactions are loaded in the same query).
+    """
+    transfer = _transfers_query(session, expand).filter(Transfer.id == transfer_id).first()
+    return _serialize_transfer(transfer, expand)
+
+
+def get_transfers(session, transfer_ids, expand=False):
+    """
+    Same as get_transfer for a list (ex. a page) of transfers, which are loaded
+    (with their transactions if 'expand' is true) in a single query.
+    """
+    transfers = _transfers_query(session, expand).filter(Transfer.id.in_(transfer_ids)).all()
+    transfers_by_id = dict((transfer.id, transfer) for transfer in transfers)
+    return [_serialize_transfer(transfers_by_id[transfer_id], expand)
+            for transfer_id in transfer_ids if transfer_id in transfers_by_id]
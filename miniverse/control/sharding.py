@@ -0,0 +1,104 @@
+"""
+Sharded balances for users receiving many deposits at the same time (ex. merchants).
+Deposits to those users go to one of their BalanceShard rows, picked at random,
+instead of all waiting for the lock of the same user row. The balance of any
+user is User.funds plus the funds of its shards (none for most users).
+
+Withdrawals update User.funds (which may become negative) with a single UPDATE
+that checks the whole balance, so they are still serialized by the user row.
+
+Shards are created with 'enable_balance_sharding'. Every process must know
+which users have shards (MINIVERSE_BALANCE_SHARDS="user_id:shards,...") to send
+deposits to them; otherwise deposits just go to the user row.
+"""
+import os
+import random
+from sqlalchemy import func, select, cast, BigInteger
+from miniverse.model.model import User, BalanceShard
+
+
+def parse_balance_shards(value):
+    """
+    Parses "user_id:shards,user_id:shards" into a dictionary.
+    """
+    balance_shards = {}
+    for item in value.split(","):
+        if item.strip():
+            user_id, shards = item.rsplit(":", 1)
+            balance_shards[user_id.strip()] = int(shards)
+    return balance_shards
+
+
+BALANCE_SHARDS = parse_balance_shards(os.environ.get("MINIVERSE_BALANCE_SHARDS", ""))
+
+_balance_shards = dict(BALANCE_SHARDS)
+
+
+def get_balance_shards(user_id):
+    """
+    Number of shards of the balance of a user (0 if it is not sharded).
+    """
+    return _balance_shards.get(user_id, 0)
+
+
+def set_balance_shards(user_id, shards):
+    if shards:
+        _balance_shards[user_id] = shards
+    else:
+        _balance_shards.pop(user_id, None)
+
+
+def shards_funds():
+    """
+    Sum of the shards of a user, as a scalar subquery correlated to the user table.
+    """
+    return select([func.coalesce(func.sum(BalanceShard.funds), 0)])\
+        .where(BalanceShard.user_phone == User.phone_number).as_scalar()
+
+
+def total_funds():
+    """
+    Expression of the balance of a user (in minor units).
+    """
+    return cast(User.funds + shards_funds(), BigInteger)
+
+
+def add_to_shard(session, user_id, amount):
+    """
+    Adds 'amount' (in minor units) to a random shard of the user, if its balance
+    is sharded. Returns false if it is not, so the amount must go to the user row.
+    """
+    shards = get_balance_shards(user_id)
+    if not shards:
+        return False
+    updated_rows = session.query(BalanceShard)\
+        .filter(BalanceShard.user_phone == user_id,
+                BalanceShard.shard == random.randrange(shards))\
+        .update({BalanceShard.funds: BalanceShard.funds + amount}, synchronize_session=False)
+    return updated_rows == 1
+
+
+def enable_balance_sharding(session, user_id, shards):
+    """
+    Creates the missing shards (up to 'shards') of a user and registers them in
+    this process.
+    """
+    existing = set(shard for shard, in session.query(BalanceShard.shard).filter(BalanceShard.user_phone == user_id))
+    session.add_all([BalanceShard(user_phone=user_id, shard=shard, funds=0)
+                     for shard in range(shards) if shard not in existing])
+    session.commit()
+    set_balance_shards(user_id, shards)
+
+
+def disable_balance_sharding(session, user_id):
+    """
+    Moves the funds of the shards of a user back to its row, and deletes them.
+    """
+    set_balance_shards(user_id, 0)
+    session.query(User).filter(User.phone_number == user_id).with_for_update().one()
+    shard_funds = session.query(func.coalesce(func.sum(BalanceShard.funds), 0))\
+        .filter(BalanceShard.user_phone == user_id).with_for_update().scalar()
+    session.query(User).filter(User.phone_number == user_id)\
+        .update({User.funds: User.funds + int(shard_funds)}, synchronize_session=False)
+    session.query(BalanceShard).filter(BalanceShard.user_phone == user_id).delete(synchronize_session=False)
+    session.commit()
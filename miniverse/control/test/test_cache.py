@@ -0,0 +1,79 @@
+import unittest
+from miniverse.control.cache import LRUCache, ExternalCache
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0.
+
+    def __call__(self):
+        return self.now
+
+
+class DictCacheClient(object):
+    """
+    Stands in for an external cache (ex. redis).
+    """
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, ttl):
+        self.values[key] = value
+
+    def delete(self, key):
+        self.values.pop(key, None)
+
+
+class TestCache(unittest.TestCase):
+
+    def test_lru_cache(self):
+        clock = FakeClock()
+        cache = LRUCache(maxsize=2, ttl=10, clock=clock)
+        cache.set("a", 1.)
+        cache.set("b", 2.)
+        self.assertEqual(1., cache.get("a"))
+
+        # "b" is the least recently used
+        cache.set("c", 3.)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(3., cache.get("c"))
+
+        # Values expire
+        clock.now = 11
+        self.assertIsNone(cache.get("a"))
+
+        cache.set("a", 1.)
+        cache.delete("a")
+        self.assertIsNone(cache.get("a"))
+        cache.set("a", 1.)
+        cache.clear()
+        self.assertIsNone(cache.get("a"))
+
+        self.assertDictEqual({"hits": 2, "misses": 4, "evictions": 1, "expirations": 1, "invalidations": 2,
+                              "size": 0}, cache.stats())
+
+    def test_outdated_values_are_not_stored(self):
+        cache = LRUCache()
+        generation = cache.generation
+        cache.delete("a")
+        cache.set("a", 1., generation)
+        self.assertIsNone(cache.get("a"))
+        cache.set("a", 2., cache.generation)
+        self.assertEqual(2., cache.get("a"))
+
+    def test_external_cache(self):
+        client = DictCacheClient()
+        cache = ExternalCache(client, prefix="balance:")
+        cache.set("0000", 10.5)
+        self.assertEqual({"balance:0000": "10.5"}, client.values)
+        self.assertEqual(10.5, cache.get("0000"))
+        cache.delete("0000")
+        self.assertIsNone(cache.get("0000"))
+        self.assertDictEqual({"hits": 1, "misses": 1, "invalidations": 1}, cache.stats())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+import threading
+import unittest
+from miniverse.control.groupcommit import GroupCommitter
+from miniverse.control.histogram import Histogram
+from miniverse.control.operations import create_user, get_user_balance
+from miniverse.model.exceptions import NotEnoughMoneyException, CommitTimeoutException
+from miniverse.model.model import TransactionType, Transaction
+from miniverse.model.sessionsingleton import DbSessionHolder
+
+
+class TestGroupCommit(unittest.TestCase):
+    TEST_DB = 'test_miniverse_groupcommit.db'
+
+    def setUp(self):
+        DbSessionHolder('sqlite:///' + TestGroupCommit.TEST_DB).reset()
+        self.session = DbSessionHolder().get_session()
+        self.susan_uri = create_user(self.session, "0000", "susan", "--------", 10.)
+        self.committer = GroupCommitter(max_batch=10, max_delay=0.05)
+
+    def tearDown(self):
+        if self.committer.is_alive():
+            self.committer.stop()
+        DbSessionHolder().remove_session()
+
+    def test_histogram(self):
+        histogram = Histogram([1, 5, 10])
+        for value in [0.5, 1, 3, 7, 50]:
+            histogram.observe(value)
+        self.assertEqual({
+            "buckets": [{"le": 1, "count": 2}, {"le": 5, "count": 3}, {"le": 10, "count": 4},
+                        {"le": "+Inf", "count": 5}],
+            "count": 5,
+            "sum": 61.5
+        }, histogram.as_dict())
+
+    def test_transactions_are_committed_in_batches(self):
+        pending = [self.committer.submit(self.susan_uri, 1, TransactionType.FUNDS_DEPOSIT) for _ in range(15)]
+        self.committer.start()
+        uris = [transaction.wait(5) for transaction in pending]
+
+        self.assertEqual(15, len(set(uris)))
+        self.assertEqual(25., get_user_balance(self.session, "0000"))
+        stats = self.committer.stats()
+        self.assertEqual(2, stats["batch_size"]["count"])
+        self.assertEqual(15, stats["batch_size"]["sum"])
+        self.assertEqual(15, stats["latency_ms"]["count"])
+
+    def test_failures_do_not_affect_the_batch(self):
+        created = []
+        deposit = self.committer.submit(self.susan_uri, 5, TransactionType.FUNDS_DEPOSIT,
+                                        on_created=lambda session, uri: created.append(uri))
+        overdraft = self.committer.submit(self.susan_uri, -100, TransactionType.FUNDS_WITHDRAWAL)
+        wrong_type = self.committer.submit(self.susan_uri, 5, "GIFT")
+        withdrawal = self.committer.submit(self.susan_uri, -15, TransactionType.FUNDS_WITHDRAWAL)
+        self.committer.start()
+
+        self.assertEqual([deposit.wait(5)], created)
+        with self.assertRaises(NotEnoughMoneyException):
+            overdraft.wait(5)
+        with self.assertRaises(ValueError):
+            wrong_type.wait(5)
+        withdrawal.wait(5)
+        self.assertEqual(0., get_user_balance(self.session, "0000"))
+        self.assertEqual(2, self.session.query(Transaction).count())
+
+    def test_the_committer_survives_failed_batches(self):
+        commit_batch = self.committer.commit_batch
+
+        def fail_once(batch):
+            self.committer.commit_batch = commit_batch
+            raise IOError("Lost connection")
+        self.committer.commit_batch = fail_once
+        failed = self.committer.submit(self.susan_uri, 1, TransactionType.FUNDS_DEPOSIT)
+        self.committer.start()
+
+        with self.assertRaises(IOError):
+            failed.wait(5)
+        self.committer.submit(self.susan_uri, 1, TransactionType.FUNDS_DEPOSIT).wait(5)
+        self.assertTrue(self.committer.is_alive())
+        self.assertEqual(11., get_user_balance(self.session, "0000"))
+
+    def test_wait_timeout(self):
+        # Not started, so nothing gets committed
+        pending = self.committer.submit(self.susan_uri, 1, TransactionType.FUNDS_DEPOSIT)
+        with self.assertRaises(CommitTimeoutException):
+            pending.wait(0.01)
+
+    def test_concurrent_requests(self):
+        self.committer.start()
+        uris = []
+
+        def deposit():
+            uris.append(self.committer.submit(self.susan_uri, 1, TransactionType.FUNDS_DEPOSIT).wait(5))
+
+        threads = [threading.Thread(target=deposit) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(20, len(set(uris)))
+        self.assertEqual(30., get_user_balance(self.session, "0000"))
+        self.assertLess(self.committer.stats()["batch_size"]["count"], 20)
+
+if __name__ == '__main__':
+    unittest.main()
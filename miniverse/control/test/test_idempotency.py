@@ -0,0 +1,44 @@
+import os
+import unittest
+from sqlalchemy.engine import create_engine
+from sqlalchemy.orm.session import sessionmaker
+from miniverse.control.idempotency import get_stored_response, store_response, purge_idempotency_keys, \
+    get_response_cache
+from miniverse.model.model import Base, IdempotencyKey
+
+
+class TestIdempotency(unittest.TestCase):
+    TEST_DB = 'test_miniverse_idempotency.db'
+
+    def setUp(self):
+        if os.path.exists(TestIdempotency.TEST_DB):
+            os.remove(TestIdempotency.TEST_DB)
+        engine = create_engine('sqlite:///' + TestIdempotency.TEST_DB)
+        Base.metadata.create_all(bind=engine)
+        self.session = sessionmaker(bind=engine)()
+        get_response_cache().clear()
+
+    def test_stored_responses(self):
+        data = {"user": "0000", "amount": 10}
+        self.assertIsNone(get_stored_response(self.session, "key", "/transaction", data))
+        store_response(self.session, "key", "/transaction", data, 201, "/transaction/1", data)
+        self.session.commit()
+
+        stored = get_stored_response(self.session, "key", "/transaction", {"amount": 10, "user": "0000"})
+        self.assertEqual((201, "/transaction/1", data), (stored["status"], stored["location"], stored["body"]))
+        with self.assertRaises(ValueError):
+            get_stored_response(self.session, "key", "/transfer", data)
+        with self.assertRaises(ValueError):
+            get_stored_response(self.session, "k" * 200, "/transaction", data)
+
+    def test_purge(self):
+        for key in ["a", "b", "c"]:
+            store_response(self.session, key, "/transaction", {}, 201, None, {})
+        self.session.commit()
+
+        self.assertEqual(0, purge_idempotency_keys(self.session))
+        self.assertEqual(3, purge_idempotency_keys(self.session, ttl=-1, chunk_size=2))
+        self.assertEqual(0, self.session.query(IdempotencyKey).count())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import os
+import unittest
+from sqlalchemy import event
+from sqlalchemy.engine import create_engine
+from sqlalchemy.orm.session import sessionmaker
+from miniverse.control.ledger import set_ledger_mode, compact_ledger, start_ledger, stop_ledger
+from miniverse.control.operations import create_user, get_user, get_user_balance, create_transaction, \
+    execute_transfer, execute_transfers, get_transaction
+from miniverse.model.exceptions import NotEnoughMoneyException
+from miniverse.model.model import Base, User, BalanceSnapshot, TransactionType, TransferType
+
+
+class TestLedger(unittest.TestCase):
+    TEST_DB = 'test_miniverse_ledger.db'
+
+    def setUp(self):
+        if os.path.exists(TestLedger.TEST_DB):
+            os.remove(TestLedger.TEST_DB)
+        self.engine = create_engine('sqlite:///' + TestLedger.TEST_DB)
+        Base.metadata.create_all(bind=self.engine)
+        self.session = sessionmaker(bind=self.engine)()
+        set_ledger_mode(True)
+
+    def tearDown(self):
+        set_ledger_mode(False)
+
+    def get_snapshot(self, user_id):
+        return self.session.query(BalanceSnapshot.funds, BalanceSnapshot.last_transaction_id)\
+            .filter(BalanceSnapshot.user_phone == user_id).one()
+
+    def test_deposits_do_not_update_the_user(self):
+        susan_uri = create_user(self.session, "0000", "susan", "--------", 100.)
+        pep_uri = create_user(self.session, "0001", "pep", "--------", 0.)
+
+        statements = []
+        event.listen(self.engine, "before_cursor_execute",
+                     lambda conn, cursor, statement, *args: statements.append(statement))
+        transaction_uri = create_transaction(self.session, pep_uri, 10.5, TransactionType.FUNDS_DEPOSIT)
+        self.assertEqual([], [statement for statement in statements if statement.startswith("UPDATE")])
+        transaction = get_transaction(self.session, int(transaction_uri.split("/")[-1]), expand=True)
+        self.assertEqual(10.5, transaction["user"]["funds"])
+
+        execute_transfer(self.session, susan_uri, pep_uri, 30, "", TransferType.PUBLIC)
+        self.assertEqual((70., 40.5), (get_user_balance(self.session, "0000"), get_user_balance(self.session, "0001")))
+        self.assertEqual(40.5, get_user(self.session, "0001")["funds"])
+        self.assertEqual((10000, 0), tuple(funds for funds, in self.session.query(User.funds).order_by(User.phone_number)))
+
+        with self.assertRaises(NotEnoughMoneyException):
+            create_transaction(self.session, susan_uri, -70.01, TransactionType.FUNDS_WITHDRAWAL)
+        self.session.rollback()
+
+        results = execute_transfers(self.session, [
+            {"sender": susan_uri, "receiver": pep_uri, "amount": 50, "comment": "", "type": TransferType.PUBLIC},
+            {"sender": susan_uri, "receiver": pep_uri, "amount": 50, "comment": "", "type": TransferType.PUBLIC}
+        ])
+        self.assertEqual("/transfer/2", results[0])
+        self.assertIsInstance(results[1], NotEnoughMoneyException)
+        self.assertEqual((20., 90.5), (get_user_balance(self.session, "0000"), get_user_balance(self.session, "0001")))
+
+    def test_compaction(self):
+        pep_uri = create_user(self.session, "0000", "pep", "--------", 1.)
+        create_transaction(self.session, pep_uri, 10, TransactionType.FUNDS_DEPOSIT)
+        create_transaction(self.session, pep_uri, 20, TransactionType.FUNDS_DEPOSIT)
+        create_transaction(self.session, pep_uri, -5, TransactionType.FUNDS_WITHDRAWAL)
+
+        # Too recent to be folded
+        self.assertEqual(0, compact_ledger(self.session))
+        self.assertEqual((100, 0), self.get_snapshot("0000"))
+
+        self.assertEqual(1, compact_ledger(self.session, grace=-1))
+        self.assertEqual((2600, 3), self.get_snapshot("0000"))
+        self.assertEqual(26., get_user_balance(self.session, "0000"))
+
+        create_transaction(self.session, pep_uri, 4, TransactionType.FUNDS_DEPOSIT)
+        self.assertEqual(30., get_user_balance(self.session, "0000"))
+        self.assertEqual(1, compact_ledger(self.session, grace=-1))
+        self.assertEqual((3000, 4), self.get_snapshot("0000"))
+        self.assertEqual(0, compact_ledger(self.session, grace=-1))
+
+    def test_start_and_stop(self):
+        set_ledger_mode(False)
+        pep_uri = create_user(self.session, "0000", "pep", "--------", 10.)
+        create_transaction(self.session, pep_uri, 5, TransactionType.FUNDS_DEPOSIT)
+
+        self.assertEqual(1, start_ledger(self.session))
+        self.assertEqual((1500, 1), self.get_snapshot("0000"))
+        set_ledger_mode(True)
+        create_transaction(self.session, pep_uri, -2, TransactionType.FUNDS_WITHDRAWAL)
+        self.assertEqual(13., get_user_balance(self.session, "0000"))
+
+        set_ledger_mode(False)
+        self.assertEqual(1, stop_ledger(self.session))
+        self.assertEqual(0, self.session.query(BalanceSnapshot).count())
+        self.assertEqual(13., get_user_balance(self.session, "0000"))
+
+if __name__ == '__main__':
+    unittest.main()
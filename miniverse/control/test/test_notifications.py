@@ -0,0 +1,165 @@
+import json
+import os
+import threading
+import time
+import unittest
+from Queue import Queue
+from sqlalchemy.engine import create_engine
+from sqlalchemy.orm.session import sessionmaker
+import miniverse.control.notifications as notifications
+from miniverse.control.cache import LRUCache, get_balance_cache, set_balance_cache
+from miniverse.control.notifications import LocalNotifier, ExternalNotifier, get_balance_notifier, \
+    set_balance_notifier
+from miniverse.control.operations import create_user, create_transaction, update_user_funds, get_user_version, \
+    wait_for_user_change
+from miniverse.model.model import Base, TransactionType
+
+
+class QueuePubSubClient(object):
+    """
+    Stands in for an external pub/sub channel (ex. redis).
+    """
+    def __init__(self):
+        self.messages = Queue()
+
+    def publish(self, channel, message):
+        self.messages.put({"type": "message", "channel": channel, "data": message})
+
+    def pubsub(self):
+        return self
+
+    def subscribe(self, channel):
+        self.messages.put({"type": "subscribe", "channel": channel, "data": 1})
+
+    def listen(self):
+        while True:
+            message = self.messages.get()
+            if isinstance(message, Exception):
+                raise message
+            yield message
+
+
+class BrokenPubSubClient(QueuePubSubClient):
+    """
+    A channel that can not be published to.
+    """
+    def publish(self, channel, message):
+        raise IOError("Connection refused")
+
+
+class TestNotifications(unittest.TestCase):
+    TEST_DB = "test_miniverse_notifications.db"
+
+    def setUp(self):
+        self.old_notifier = get_balance_notifier()
+        self.notifier = LocalNotifier()
+        set_balance_notifier(self.notifier)
+        self.balance_cache = get_balance_cache()
+
+        # A file DB, so the sessions of other threads see the same data
+        if os.path.exists(TestNotifications.TEST_DB):
+            os.remove(TestNotifications.TEST_DB)
+        engine = create_engine("sqlite:///" + TestNotifications.TEST_DB)
+        Base.metadata.create_all(bind=engine)
+        self.session = sessionmaker(bind=engine)()
+
+    def tearDown(self):
+        set_balance_notifier(self.old_notifier)
+        set_balance_cache(self.balance_cache)
+
+    def test_local_notifier(self):
+        with self.notifier.subscribe("0000") as subscription, self.notifier.subscribe("0001") as other:
+            self.assertFalse(subscription.wait(0))
+
+            # Notifications are kept until the next wait
+            self.notifier.publish(["0000"])
+            self.assertTrue(subscription.wait(0))
+            self.assertFalse(subscription.wait(0))
+            self.assertFalse(other.wait(0))
+            self.assertEqual({"subscribed_users": 2, "subscriptions": 2, "published": 1, "delivered": 1},
+                             self.notifier.stats())
+
+        self.assertEqual(0, self.notifier.stats()["subscriptions"])
+
+    def test_max_wait(self):
+        self.notifier.max_wait = 0.01
+        with self.notifier.subscribe("0000") as subscription:
+            start = time.time()
+            self.assertFalse(subscription.wait(5))
+            self.assertLess(time.time() - start, 1)
+
+    def test_external_notifier(self):
+        set_balance_cache(LRUCache())
+        client = QueuePubSubClient()
+        notifier = ExternalNotifier(client, channel="balances")
+        get_balance_cache().set("0000", (100, 1))
+        with notifier.subscribe("0000") as subscription:
+            # Published by another process
+            client.publish("balances", json.dumps(["0000"]))
+            self.assertTrue(subscription.wait(5))
+            self.assertIsNone(get_balance_cache().get("0000"))
+
+            notifier.publish(["0000"])
+            self.assertTrue(subscription.wait(5))
+
+    def test_external_notifier_errors(self):
+        reconnect_delay = notifications.RECONNECT_DELAY
+        notifications.RECONNECT_DELAY = 0
+        try:
+            client = QueuePubSubClient()
+            notifier = ExternalNotifier(client, channel="balances")
+            with notifier.subscribe("0000") as subscription:
+                # Invalid messages are skipped
+                client.publish("balances", "not json")
+                client.publish("balances", json.dumps(["0000"]))
+                self.assertTrue(subscription.wait(5))
+
+                # The listener reconnects, and wakes up everybody in case something was missed
+                client.messages.put(IOError("Connection lost"))
+                self.assertTrue(subscription.wait(5))
+                client.publish("balances", json.dumps(["0000"]))
+                self.assertTrue(subscription.wait(5))
+                self.assertEqual(2, notifier.stats()["errors"])
+
+            # Failing to publish does not fail the commit
+            notifier = ExternalNotifier(BrokenPubSubClient(), channel="balances")
+            notifier.publish(["0000"])
+            self.assertEqual(1, notifier.stats()["errors"])
+        finally:
+            notifications.RECONNECT_DELAY = reconnect_delay
+
+    def test_changes_are_notified_on_commit(self):
+        create_user(self.session, "0000", "pep", "--", 10.)
+        with self.notifier.subscribe("0000") as subscription:
+            update_user_funds(self.session, "0000", 5.)
+            self.session.flush()
+            self.assertFalse(subscription.wait(0))
+            self.session.rollback()
+            self.assertFalse(subscription.wait(0))
+
+            create_transaction(self.session, "/user/0000", 5., TransactionType.FUNDS_DEPOSIT)
+            self.assertTrue(subscription.wait(0))
+
+    def test_wait_for_user_change(self):
+        create_user(self.session, "0000", "pep", "--", 10.)
+        version = get_user_version(self.session, "0000")
+
+        # Nothing changes
+        start = time.time()
+        self.assertEqual(version, wait_for_user_change(self.session, "0000", version, 0.05))
+        self.assertGreaterEqual(time.time() - start, 0.05)
+
+        # Another session changes the balance meanwhile
+        def deposit():
+            time.sleep(0.05)
+            create_transaction(sessionmaker(bind=self.session.bind)(), "/user/0000", 5.,
+                               TransactionType.FUNDS_DEPOSIT)
+        depositor = threading.Thread(target=deposit)
+        depositor.start()
+        new_version = wait_for_user_change(self.session, "0000", version, 5)
+        depositor.join()
+        self.assertNotEqual(version, new_version)
+        self.assertEqual(new_version, get_user_version(self.session, "0000"))
+
+if __name__ == '__main__':
+    unittest.main()
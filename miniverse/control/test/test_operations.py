@@ -1,13 +1,17 @@
 import inspect
 import os
 import unittest
+from sqlalchemy import event
 from sqlalchemy.engine import create_engine
 from sqlalchemy.orm.session import sessionmaker
 from miniverse.control.operations import create_user, get_user, get_user_balance, create_transaction, get_transaction, \
     update_user_funds, check_user_has_enough_money, create_transfer, get_transfer, check_transfer_is_symmetric, \
-    get_user_transactions
-from miniverse.model.exceptions import NotEnoughMoneyException, AsymmetricTransferException
-from miniverse.model.model import Base, TransactionType, TransferType
+    get_user_transactions, debit_user_funds, execute_transfer, execute_transfers, bulk_create_users, \
+    iter_user_transactions, get_transfers
+from miniverse.control.cache import LRUCache, set_balance_cache, get_balance_cache
+from miniverse.model.exceptions import NotEnoughMoneyException, AsymmetricTransferException, \
+    ConcurrentUpdateException
+from miniverse.model.model import Base, User, TransactionType, TransferType
 import miniverse.control.test as test_module
 
 
@@ -24,10 +28,15 @@ class TestOperations(unittest.TestCase):
         if os.path.exists(TestOperations.TEST_DB):
             os.remove(TestOperations.TEST_DB)
         engine = create_engine('sqlite:///' + TestOperations.TEST_DB)
+        self.engine = engine
         #Base.metadata.drop_all(bind=engine)
         Base.metadata.create_all(bind=engine)
         Session = sessionmaker(bind=engine)
         self.session = Session()
+        self.balance_cache = get_balance_cache()
+
+    def tearDown(self):
+        set_balance_cache(self.balance_cache)
 
     def test_user_creation_retrieval(self):
         user_uri = create_user(self.session, "0000", "peter", "--------", 3.0)
@@ -45,6 +54,23 @@ class TestOperations(unittest.TestCase):
         peter_balance = get_user_balance(self.session, user_json["phone_number"])
         self.assertEqual(3.0, peter_balance)
 
+    def test_bulk_user_creation(self):
+        create_user(self.session, "0000", "peter", "--------", 3.0)
+        users = ({"phone_number": "000" + str(i % 5), "name": "user", "pass_hash": "--------", "funds": float(i)}
+                 for i in range(7))
+
+        statements = []
+        event.listen(self.engine, "before_cursor_execute",
+                     lambda conn, cursor, statement, *args: statements.append(statement.split()[0]))
+        created, duplicates = bulk_create_users(self.session, users, chunk_size=3)
+        self.assertEqual(2, statements.count("INSERT"))
+        self.assertEqual(4, created)
+        self.assertEqual(["0000", "0000", "0001"], duplicates)
+        self.assertEqual(3.0, get_user_balance(self.session, "0000"))
+        self.assertEqual(4.0, get_user_balance(self.session, "0004"))
+        self.assertEqual("user", get_user(self.session, "0004")["name"])
+        self.assertIsNotNone(get_user(self.session, "0004")["created"])
+
     def test_transaction_creation_retrieval(self):
         # Resource creation
         dean_uri = create_user(self.session, "0000", "dean", "0123456789ABCDEF", 100.0)
@@ -95,6 +121,56 @@ class TestOperations(unittest.TestCase):
         pep_json = get_user(self.session, user_id)
         self.assertEqual(110.0, pep_json["funds"])
 
+    def test_money_is_exact(self):
+        pep_uri = create_user(self.session, "0000", "pep", "0123456789ABCDEF", 0.1)
+        create_transaction(self.session, pep_uri, 0.2, TransactionType.FUNDS_DEPOSIT)
+        self.assertEqual(0.3, get_user_balance(self.session, "0000"))
+        self.assertEqual(30, self.session.query(User.funds).scalar())
+
+        with self.assertRaises(ValueError):
+            create_transaction(self.session, pep_uri, 0.001, TransactionType.FUNDS_DEPOSIT)
+        with self.assertRaises(ValueError):
+            create_transaction(self.session, pep_uri, "forty", TransactionType.FUNDS_DEPOSIT)
+
+    def test_balance_cache(self):
+        set_balance_cache(LRUCache())
+        pep_uri = create_user(self.session, "0000", "pep", "0123456789ABCDEF", 100.0)
+        statements = []
+        event.listen(self.engine, "before_cursor_execute",
+                     lambda conn, cursor, statement, *args: statements.append(statement))
+
+        # Only the first read hits the DB
+        self.assertEqual(100., get_user_balance(self.session, "0000"))
+        self.assertEqual(100., get_user_balance(self.session, "0000"))
+        self.assertEqual(1, len(statements))
+
+        # Changes not committed yet are not cached
+        create_transaction(self.session, pep_uri, -10, TransactionType.FUNDS_WITHDRAWAL, commit=False)
+        self.assertEqual(90., get_user_balance(self.session, "0000"))
+        self.session.rollback()
+        self.assertEqual(100., get_user_balance(self.session, "0000"))
+
+        # Committed changes are seen
+        create_transaction(self.session, pep_uri, -10, TransactionType.FUNDS_WITHDRAWAL)
+        self.assertEqual(90., get_user_balance(self.session, "0000"))
+        self.assertEqual((9000, 1), tuple(get_balance_cache().get("0000")))
+
+    def test_debit_user_funds(self):
+        pep_uri = create_user(self.session, "0000", "pep", "0123456789ABCDEF", 100.0)
+        user_id = pep_uri.split("/")[-1]
+        debit_user_funds(self.session, user_id, -90.)
+        self.assertEqual(10.0, get_user(self.session, user_id)["funds"])
+        with self.assertRaises(NotEnoughMoneyException):
+            debit_user_funds(self.session, user_id, -20.)
+        self.assertEqual(10.0, get_user_balance(self.session, user_id))
+
+    def test_withdrawal_without_funds_is_not_stored(self):
+        pep_uri = create_user(self.session, "0000", "pep", "0123456789ABCDEF", 100.0)
+        with self.assertRaises(NotEnoughMoneyException):
+            create_transaction(self.session, pep_uri, -110, transaction_type=TransactionType.FUNDS_WITHDRAWAL)
+        self.assertEqual([], get_user_transactions(self.session, "0000"))
+        self.assertEqual(100.0, get_user_balance(self.session, "0000"))
+
     def test_create_retrieve_transfer(self):
         # susan -> 25 -> pep, Susan gives 25 to Pep
 
@@ -156,6 +232,117 @@ class TestOperations(unittest.TestCase):
         self.assertEqual(get_user_balance(self.session, susan_id), get_user_balance(self.session, pep_id))
         self.assertEqual(75., get_user_balance(self.session, susan_id))
 
+    def test_execute_transfer(self):
+        susan_uri = create_user(self.session, "0000", "susan", "0123456789ABCDEF", 100.0)
+        pep_uri = create_user(self.session, "0001", "pep", "0123456789ABCDEF", 50.0)
+
+        transfer_uri = execute_transfer(self.session, susan_uri, pep_uri, 25, "Great lunch!!", TransferType.PUBLIC)
+        self.assertEqual("/transfer/1", transfer_uri)
+        transfer_json = get_transfer(self.session, 1, expand=True)
+        self.assertEqual(-25.0, transfer_json["withdrawal"]["amount"])
+        self.assertEqual("/user/0000", transfer_json["withdrawal"]["user"])
+        self.assertEqual(25.0, transfer_json["deposit"]["amount"])
+        self.assertEqual("/user/0001", transfer_json["deposit"]["user"])
+        self.assertEqual((75., 75.), (get_user_balance(self.session, "0000"), get_user_balance(self.session, "0001")))
+
+        # Not enough money, nothing is stored
+        with self.assertRaises(NotEnoughMoneyException):
+            execute_transfer(self.session, susan_uri, pep_uri, 80, "Great dinner!!", TransferType.PUBLIC)
+        self.session.rollback()
+        self.assertItemsEqual(["/transaction/1"], get_user_transactions(self.session, "0000"))
+
+        # Negative amounts would be a withdrawal from the receiver
+        with self.assertRaises(ValueError):
+            execute_transfer(self.session, susan_uri, pep_uri, -5, "Give me back", TransferType.PUBLIC)
+
+    def test_expansion_statements(self):
+        susan_uri = create_user(self.session, "0000", "susan", "0123456789ABCDEF", 100.0)
+        pep_uri = create_user(self.session, "0001", "pep", "0123456789ABCDEF", 50.0)
+        execute_transfer(self.session, susan_uri, pep_uri, 25, "Great lunch!!", TransferType.PUBLIC)
+        execute_transfer(self.session, pep_uri, susan_uri, 5, "Coffee", TransferType.PUBLIC)
+        self.session.close()
+
+        statements = []
+        event.listen(self.engine, "before_cursor_execute",
+                     lambda conn, cursor, statement, *args: statements.append(statement))
+
+        transfer_json = get_transfer(self.session, 1, expand=True)
+        self.assertEqual("/user/0001", transfer_json["deposit"]["user"])
+        self.assertEqual(1, len(statements))
+
+        # Plus the balance of the user, which is not in the user row with sharding or in ledger mode
+        transaction_json = get_transaction(self.session, 3, expand=True)
+        self.assertEqual("pep", transaction_json["user"]["name"])
+        self.assertEqual(70., transaction_json["user"]["funds"])
+        self.assertEqual(3, len(statements))
+
+        self.session.close()
+        transfers_json = get_transfers(self.session, [2, 1], expand=True)
+        self.assertEqual([-5., -25.], [transfer["withdrawal"]["amount"] for transfer in transfers_json])
+        self.assertEqual(4, len(statements))
+
+    def test_execute_transfers(self):
+        susan_uri = create_user(self.session, "0000", "susan", "0123456789ABCDEF", 100.0)
+        pep_uri = create_user(self.session, "0001", "pep", "0123456789ABCDEF", 50.0)
+        transfers = [
+            {"sender": susan_uri, "receiver": pep_uri, "amount": 60, "comment": "1", "type": TransferType.PUBLIC},
+            {"sender": susan_uri, "receiver": pep_uri, "amount": 60, "comment": "2", "type": TransferType.PUBLIC},
+            {"sender": pep_uri, "receiver": susan_uri, "amount": 20, "comment": "3", "type": TransferType.PUBLIC},
+            {"sender": pep_uri, "receiver": susan_uri, "amount": 20, "comment": "4", "type": "SECRET"},
+            {"sender": pep_uri, "receiver": "/user/0002", "amount": 20, "comment": "5", "type": TransferType.PUBLIC},
+            {"sender": susan_uri, "receiver": pep_uri, "amount": 50, "comment": "6", "type": TransferType.PUBLIC},
+            {"sender": susan_uri, "receiver": pep_uri, "comment": "7", "type": TransferType.PUBLIC},
+        ]
+
+        updates = []
+        event.listen(self.engine, "before_cursor_execute",
+                     lambda conn, cursor, statement, *args: updates.append(statement.startswith("UPDATE")))
+        results = execute_transfers(self.session, transfers)
+
+        # One update per user
+        self.assertEqual(2, updates.count(True))
+        self.assertEqual(["/transfer/1", "/transfer/2"], results[0:3:2])
+        self.assertIsInstance(results[1], NotEnoughMoneyException)
+        self.assertIsInstance(results[3], ValueError)
+        self.assertIsInstance(results[4], ValueError)
+        self.assertEqual("/transfer/3", results[5])
+        self.assertIsInstance(results[6], KeyError)
+        self.assertEqual((10., 140.), (get_user_balance(self.session, "0000"), get_user_balance(self.session, "0001")))
+
+        # Chunks are committed separately
+        results = execute_transfers(self.session, transfers[2:3] * 3, chunk_size=2)
+        self.assertEqual(["/transfer/4", "/transfer/5", "/transfer/6"], results)
+        self.assertEqual((70., 80.), (get_user_balance(self.session, "0000"), get_user_balance(self.session, "0001")))
+
+    def test_execute_transfers_with_malformed_items(self):
+        susan_uri = create_user(self.session, "0000", "susan", "0123456789ABCDEF", 100.0)
+        pep_uri = create_user(self.session, "0001", "pep", "0123456789ABCDEF", 50.0)
+        transfer = {"sender": susan_uri, "receiver": pep_uri, "amount": 1, "comment": "", "type": TransferType.PUBLIC}
+        transfers = [transfer, transfer, dict(transfer, type=None), dict(transfer, sender=0),
+                     dict(transfer, receiver=["/user/0001"]), dict(transfer, comment=None), [transfer], None]
+
+        results = execute_transfers(self.session, transfers, chunk_size=1)
+        self.assertEqual(["/transfer/1", "/transfer/2"], results[:2])
+        for result in results[2:]:
+            self.assertIsInstance(result, ValueError)
+        self.assertEqual((98., 52.), (get_user_balance(self.session, "0000"), get_user_balance(self.session, "0001")))
+
+    def test_execute_transfers_with_concurrent_update(self):
+        susan_uri = create_user(self.session, "0000", "susan", "0123456789ABCDEF", 100.0)
+        pep_uri = create_user(self.session, "0001", "pep", "0123456789ABCDEF", 50.0)
+        transfers = [
+            {"sender": susan_uri, "receiver": pep_uri, "amount": 60, "comment": "1", "type": TransferType.PUBLIC}
+        ]
+
+        # Susan spends her money between the read and the update of the batch
+        def spend_money(conn, cursor, statement, *args):
+            if statement.startswith("UPDATE"):
+                cursor.execute("UPDATE user SET funds = 0 WHERE phone_number = '0000'")
+        event.listen(self.engine, "before_cursor_execute", spend_money)
+
+        results = execute_transfers(self.session, transfers)
+        self.assertIsInstance(results[0], ConcurrentUpdateException)
+
     def test_check_transfer_is_symetric(self):
         # REPEATED CODE AHEAD. TODO: REFACTOR
         # Create the users
@@ -250,5 +437,16 @@ class TestOperations(unittest.TestCase):
         transactions = get_user_transactions(self.session, susan_id, expand=False)
         self.assertItemsEqual(expected, transactions)
 
+        # By pages
+        self.assertEqual(expected[:2], get_user_transactions(self.session, susan_id, limit=2))
+        self.assertEqual(expected[2:], get_user_transactions(self.session, susan_id, after_id=3, limit=2))
+        transactions = get_user_transactions(self.session, susan_id, expand=True, after_id=1, limit=1)
+        self.assertEqual([3], [mov["id"] for mov in transactions])
+
+        # Streamed
+        self.assertEqual(expected, list(iter_user_transactions(self.session, susan_id, batch_size=2)))
+        transactions = list(iter_user_transactions(self.session, susan_id, expand=True, after_id=1, batch_size=1))
+        self.assertEqual([3, 5], [mov["id"] for mov in transactions])
+
 if __name__ == '__main__':
     unittest.main()
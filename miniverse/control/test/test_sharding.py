@@ -0,0 +1,94 @@
+import os
+import unittest
+from sqlalchemy.engine import create_engine
+from sqlalchemy.orm.session import sessionmaker
+from miniverse.control.ledger import start_ledger
+from miniverse.control.operations import create_user, get_user, get_user_balance, create_transaction, \
+    execute_transfer, execute_transfers, get_transaction, get_transfer
+from miniverse.control.sharding import enable_balance_sharding, disable_balance_sharding, set_balance_shards, \
+    parse_balance_shards
+from miniverse.model.exceptions import NotEnoughMoneyException
+from miniverse.model.model import Base, User, BalanceShard, BalanceSnapshot, TransactionType, TransferType
+
+
+class TestSharding(unittest.TestCase):
+    TEST_DB = 'test_miniverse_sharding.db'
+
+    def setUp(self):
+        if os.path.exists(TestSharding.TEST_DB):
+            os.remove(TestSharding.TEST_DB)
+        engine = create_engine('sqlite:///' + TestSharding.TEST_DB)
+        Base.metadata.create_all(bind=engine)
+        self.session = sessionmaker(bind=engine)()
+        self.susan_uri = create_user(self.session, "0000", "susan", "--------", 100.)
+        self.shop_uri = create_user(self.session, "0001", "shop", "--------", 10.)
+        enable_balance_sharding(self.session, "0001", 4)
+
+    def tearDown(self):
+        set_balance_shards("0001", 0)
+
+    def get_funds(self):
+        user_funds = self.session.query(User.funds).filter(User.phone_number == "0001").scalar()
+        shard_funds = [funds for funds, in self.session.query(BalanceShard.funds)
+                       .filter(BalanceShard.user_phone == "0001").order_by(BalanceShard.shard)]
+        return user_funds, shard_funds
+
+    def test_parse_balance_shards(self):
+        self.assertEqual({"0001": 16, "0002": 4}, parse_balance_shards("0001:16, 0002:4"))
+        self.assertEqual({}, parse_balance_shards(""))
+
+    def test_expanded_users_have_the_whole_balance(self):
+        transaction_uri = create_transaction(self.session, self.shop_uri, 5, TransactionType.FUNDS_DEPOSIT)
+        self.assertEqual(1000, self.get_funds()[0])
+        transaction = get_transaction(self.session, int(transaction_uri.split("/")[-1]), expand=True)
+        self.assertEqual(15., transaction["user"]["funds"])
+
+        # Expanded transfers only have the uris of the users
+        transfer_uri = execute_transfer(self.session, self.susan_uri, self.shop_uri, 5, "", TransferType.PUBLIC)
+        transfer = get_transfer(self.session, int(transfer_uri.split("/")[-1]), expand=True)
+        self.assertEqual(self.shop_uri, transfer["deposit"]["user"])
+
+    def test_deposits_go_to_the_shards(self):
+        for _ in range(10):
+            execute_transfer(self.session, self.susan_uri, self.shop_uri, 5, "", TransferType.PUBLIC)
+        user_funds, shard_funds = self.get_funds()
+        self.assertEqual(1000, user_funds)
+        self.assertEqual(5000, sum(shard_funds))
+        self.assertEqual(60., get_user_balance(self.session, "0001"))
+        self.assertEqual(60., get_user(self.session, "0001")["funds"])
+
+        # Withdrawals are checked against the whole balance
+        create_transaction(self.session, self.shop_uri, -55, TransactionType.FUNDS_WITHDRAWAL)
+        self.assertEqual(5., get_user_balance(self.session, "0001"))
+        self.assertEqual(-4500, self.get_funds()[0])
+        with self.assertRaises(NotEnoughMoneyException):
+            create_transaction(self.session, self.shop_uri, -5.01, TransactionType.FUNDS_WITHDRAWAL)
+        self.session.rollback()
+
+        results = execute_transfers(self.session, [
+            {"sender": self.shop_uri, "receiver": self.susan_uri, "amount": 5, "comment": "", "type": TransferType.PUBLIC},
+            {"sender": self.shop_uri, "receiver": self.susan_uri, "amount": 1, "comment": "", "type": TransferType.PUBLIC}
+        ])
+        self.assertEqual("/transfer/11", results[0])
+        self.assertIsInstance(results[1], NotEnoughMoneyException)
+        self.assertEqual(0., get_user_balance(self.session, "0001"))
+
+    def test_disable_balance_sharding(self):
+        create_transaction(self.session, self.shop_uri, 20, TransactionType.FUNDS_DEPOSIT)
+        disable_balance_sharding(self.session, "0001")
+        self.assertEqual((3000, []), self.get_funds())
+        self.assertEqual(30., get_user_balance(self.session, "0001"))
+
+        # Deposits go to the user row again
+        create_transaction(self.session, self.shop_uri, 1, TransactionType.FUNDS_DEPOSIT)
+        self.assertEqual((3100, []), self.get_funds())
+
+    def test_start_ledger(self):
+        create_transaction(self.session, self.shop_uri, 20, TransactionType.FUNDS_DEPOSIT)
+        start_ledger(self.session)
+        self.assertEqual(3000, self.session.query(BalanceSnapshot.funds)
+                         .filter(BalanceSnapshot.user_phone == "0001").scalar())
+        self.assertEqual([], self.get_funds()[1])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,3 +7,13 @@ class NotEnoughMoneyException(BaseException):
 class AsymmetricTransferException(BaseException):
     def __init__(self, message):
         super(AsymmetricTransferException, self).__init__(message)
+
+
+class ConcurrentUpdateException(BaseException):
+    def __init__(self, message):
+        super(ConcurrentUpdateException, self).__init__(message)
+
+
+class CommitTimeoutException(BaseException):
+    def __init__(self, message):
+        super(CommitTimeoutException, self).__init__(message)
@@ -0,0 +1,202 @@
+"""
+Keeps the schema of an existing DB up to date with the model without dropping
+any data. Each migration is a function that receives a connection and is applied
+only once; the number of applied migrations is stored in the schema_version table.
+New tables are created automatically, so migrations are only needed to change
+tables that may already exist.
+
+Migrations must be idempotent: DDL statements commit implicitly in some DBs
+(ex. MySQL), so a migration interrupted half way may be run again.
+Processes upgrading the same DB at the same time are serialized with a DB
+lock (on MySQL and PostgreSQL).
+"""
+from contextlib import contextmanager
+from sqlalchemy import inspect, select, func, cast, text, BigInteger, Integer, MetaData, Table
+from miniverse.model.model import Base, SchemaVersion, Transaction, Transfer, USER_TABLE, MONEY_COLUMNS
+from miniverse.model.money import MINOR_UNITS
+
+SCHEMA_LOCK_NAME = "miniverse_schema_upgrade"
+SCHEMA_LOCK_KEY = 7405396 # Key of the PostgreSQL advisory lock
+SCHEMA_LOCK_TIMEOUT = 600 # seconds
+
+
+def create_missing_indexes(connection, table):
+    """
+    Creates the indexes declared in the model for 'table' that the DB does not have.
+    """
+    existing = set(index["name"] for index in inspect(connection).get_indexes(table.name))
+    for index in table.indexes:
+        if index.name not in existing:
+            index.create(bind=connection)
+
+
+def add_access_path_indexes(connection):
+    """
+    Indexes to get the transactions of a user and the transfer of a transaction.
+    """
+    create_missing_indexes(connection, Transaction.__table__)
+    create_missing_indexes(connection, Transfer.__table__)
+
+
+def _quote(connection, name):
+    return connection.dialect.identifier_preparer.quote(name)
+
+
+def _to_minor_units(column):
+    return cast(func.round(column * MINOR_UNITS), BigInteger)
+
+
+def _rebuild_sqlite_table(connection, table_name, money_columns):
+    """
+    Sqlite can not change the type of a column, so the table is copied to a new
+    one with the same columns and indexes, but with integer money columns.
+    """
+    old_name = table_name + "_old"
+    # Keep the foreign keys of other tables pointing to 'table_name'
+    connection.execute("PRAGMA legacy_alter_table = ON")
+    connection.execute("ALTER TABLE {0} RENAME TO {1}".format(_quote(connection, table_name),
+                                                             _quote(connection, old_name)))
+    metadata = MetaData()
+    old_table = Table(old_name, metadata, autoload_with=connection)
+    for index in old_table.indexes:
+        index.drop(bind=connection)
+
+    new_table = old_table.tometadata(metadata, name=table_name)
+    for column_name in money_columns:
+        new_table.c[column_name].type = BigInteger()
+    new_table.create(bind=connection)
+
+    values = [_to_minor_units(column) if column.name in money_columns else column
+              for column in old_table.columns]
+    connection.execute(new_table.insert().from_select([column.name for column in old_table.columns],
+                                                      select(values)))
+    old_table.drop(bind=connection)
+    connection.execute("PRAGMA legacy_alter_table = OFF")
+
+
+def _convert_column_to_minor_units(connection, table_name, column_name, existing_columns):
+    """
+    Converts a money column through a new BIGINT column, so the values in minor
+    units are never stored in the old (maybe single precision) column. Each
+    step can be run again if the conversion is interrupted.
+    """
+    table = _quote(connection, table_name)
+    old_column = _quote(connection, column_name)
+    new_column = _quote(connection, column_name + "_minor")
+    if column_name + "_minor" in existing_columns:
+        # Left by an interrupted conversion
+        connection.execute("ALTER TABLE {0} DROP COLUMN {1}".format(table, new_column))
+    connection.execute("ALTER TABLE {0} ADD COLUMN {1} BIGINT NULL".format(table, new_column))
+    connection.execute("UPDATE {0} SET {1} = ROUND({2} * {3})".format(table, new_column, old_column, MINOR_UNITS))
+
+    null = "NULL" if Base.metadata.tables[table_name].c[column_name].nullable else "NOT NULL"
+    if connection.dialect.name == "mysql":
+        # A single statement, so the old column is never dropped without the new one taking its place
+        connection.execute("ALTER TABLE {0} DROP COLUMN {1}, CHANGE {2} {1} BIGINT {3}"
+                           .format(table, old_column, new_column, null))
+    else:
+        connection.execute("ALTER TABLE {0} DROP COLUMN {1}".format(table, old_column))
+        connection.execute("ALTER TABLE {0} RENAME COLUMN {1} TO {2}".format(table, new_column, old_column))
+        if null == "NOT NULL":
+            connection.execute("ALTER TABLE {0} ALTER COLUMN {1} SET NOT NULL".format(table, old_column))
+
+
+def store_money_in_minor_units(connection):
+    """
+    Money was stored as floats in major units, and now it is stored as integers
+    in minor units (see model/money.py). Columns that already are integers are
+    not converted again.
+    """
+    inspector = inspect(connection)
+    existing_tables = inspector.get_table_names()
+    for table_name, money_columns in MONEY_COLUMNS.items():
+        if table_name not in existing_tables:
+            continue
+        column_types = dict((column["name"], column["type"]) for column in inspector.get_columns(table_name))
+        float_columns = [column_name for column_name in money_columns
+                         if not isinstance(column_types[column_name], Integer)]
+        if not float_columns:
+            continue
+        if connection.dialect.name == "sqlite":
+            _rebuild_sqlite_table(connection, table_name, float_columns)
+            continue
+
+        for column_name in float_columns:
+            _convert_column_to_minor_units(connection, table_name, column_name, column_types)
+
+
+def add_user_version(connection):
+    """
+    Version of the users, bumped when their funds change (see operations.get_user_version).
+    """
+    columns = set(column["name"] for column in inspect(connection).get_columns(USER_TABLE))
+    if "version" not in columns:
+        connection.execute("ALTER TABLE {0} ADD COLUMN version BIGINT NOT NULL DEFAULT 0"
+                           .format(_quote(connection, USER_TABLE)))
+
+
+# Never remove or reorder migrations, only append new ones
+MIGRATIONS = [
+    add_access_path_indexes,
+    store_money_in_minor_units,
+    add_user_version
+]
+
+
+def get_schema_version(connection):
+    """
+    Number of migrations applied to the DB.
+    """
+    version = connection.execute(select([SchemaVersion.version])).scalar()
+    return version or 0
+
+
+def set_schema_version(connection, version):
+    schema_version = SchemaVersion.__table__
+    connection.execute(schema_version.delete())
+    connection.execute(schema_version.insert(), version=version)
+
+
+@contextmanager
+def schema_lock(connection):
+    """
+    Holds a DB lock (tied to 'connection') while the schema is upgraded, so two
+    processes can not apply the same migrations at the same time. Sqlite locks
+    the whole DB while writing, so it needs no other lock.
+    """
+    dialect = connection.dialect.name
+    if dialect == "mysql":
+        acquired = connection.execute(text("SELECT GET_LOCK(:name, :timeout)"),
+                                      name=SCHEMA_LOCK_NAME, timeout=SCHEMA_LOCK_TIMEOUT).scalar()
+        if acquired != 1:
+            raise RuntimeError("The schema upgrade lock could not be acquired.")
+        try:
+            yield
+        finally:
+            connection.execute(text("SELECT RELEASE_LOCK(:name)"), name=SCHEMA_LOCK_NAME)
+    elif dialect == "postgresql":
+        connection.execute(text("SELECT pg_advisory_lock(:key)"), key=SCHEMA_LOCK_KEY)
+        try:
+            yield
+        finally:
+            connection.execute(text("SELECT pg_advisory_unlock(:key)"), key=SCHEMA_LOCK_KEY)
+    else:
+        yield
+
+
+def upgrade(engine):
+    """
+    Creates the tables that do not exist and applies the pending migrations.
+    A new DB is created with the latest schema, so it does not need any migration.
+    """
+    with engine.connect() as lock_connection, schema_lock(lock_connection):
+        with engine.begin() as connection:
+            is_new_db = USER_TABLE not in inspect(connection).get_table_names()
+            Base.metadata.create_all(bind=connection)
+
+            version = len(MIGRATIONS) if is_new_db else get_schema_version(connection)
+            for migration in MIGRATIONS[version:]:
+                migration(connection)
+
+            if is_new_db or version < len(MIGRATIONS):
+                set_schema_version(connection, len(MIGRATIONS))
@@ -1,6 +1,6 @@
 import datetime
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import Column, ForeignKey, Integer, String, Float, DateTime, Enum
+from sqlalchemy import Column, ForeignKey, Integer, BigInteger, String, Text, DateTime, Enum, Index
 from sqlalchemy.orm import relationship
 
 Base = declarative_base()
@@ -40,6 +40,17 @@ TRANSFER_TABLE = "transfer"
 TRANSACTION_TABLE = "transaction"
 CREDITCARD_TABLE = "creditcard"
 CCTRANSACTION_TABLE = "creditcard_transaction"
+SCHEMA_VERSION_TABLE = "schema_version"
+BALANCE_SNAPSHOT_TABLE = "balance_snapshot"
+BALANCE_SHARD_TABLE = "balance_shard"
+IDEMPOTENCY_KEY_TABLE = "idempotency_key"
+
+# Columns storing money (in minor units), by table
+MONEY_COLUMNS = {
+    USER_TABLE: ("funds",),
+    TRANSACTION_TABLE: ("amount",),
+    CCTRANSACTION_TABLE: ("amount",)
+}
 
 
 class User(Base):
@@ -47,9 +58,10 @@ class User(Base):
     phone_number = Column(String(32), primary_key=True)
     name = Column(String(32))
     pass_hash = Column(String(256), nullable=False)
-    funds = Column(Float, default=0.0)
+    funds = Column(BigInteger, default=0) # In minor units (see model/money.py)
     picture_path = Column(String(256), nullable=True)
     created = Column(DateTime, default=datetime.datetime.utcnow)
+    version = Column(BigInteger, nullable=False, default=0, server_default="0") # Bumped when funds change
 
 
 class CreditCard(Base):
@@ -66,7 +78,7 @@ class CreditCard(Base):
 class CreditCardTransaction(Base):
     __tablename__ = CCTRANSACTION_TABLE
     id = Column(Integer, primary_key=True, autoincrement=True)
-    amount = Column(Float, nullable=False)
+    amount = Column(BigInteger, nullable=False) # In minor units
     card_number = Column(String(16), ForeignKey(CREDITCARD_TABLE + '.number'))
     card = relationship("CreditCard", foreign_keys=[card_number])
 
@@ -74,12 +86,15 @@ class CreditCardTransaction(Base):
 class Transaction(Base):
     __tablename__ = TRANSACTION_TABLE
     id = Column(Integer, primary_key=True, autoincrement=True)
-    amount = Column(Float, nullable=False)
+    amount = Column(BigInteger, nullable=False) # In minor units
     user_phone = Column(String(32), ForeignKey(USER_TABLE + '.phone_number'))
     user = relationship("User", foreign_keys=[user_phone])
     type = Column(String(32), nullable=False) # Enum(TransactionType)
     created = Column(DateTime, default=datetime.datetime.utcnow)
 
+    # Transactions of a user, sorted by id (for pagination)
+    __table_args__ = (Index("ix_transaction_user_phone_id", "user_phone", "id"),)
+
 
 class Transfer(Base):
     __tablename__ = TRANSFER_TABLE
@@ -100,4 +115,56 @@ class Transfer(Base):
     type = Column(String(16), nullable=False) #Enum(TransferType)
 
     # For tracking purposes
-    created = Column(DateTime, default=datetime.datetime.utcnow)
\ No newline at end of file
+    created = Column(DateTime, default=datetime.datetime.utcnow)
+
+    # The transfer a transaction belongs to
+    __table_args__ = (Index("ix_transfer_withdrawal_id", "withdrawal_id"),
+                      Index("ix_transfer_deposit_id", "deposit_id"))
+
+
+class BalanceSnapshot(Base):
+    """
+    Balance of a user in ledger mode (see control/ledger.py): the funds after
+    all the transactions of the user up to 'last_transaction_id'.
+    """
+    __tablename__ = BALANCE_SNAPSHOT_TABLE
+    user_phone = Column(String(32), ForeignKey(USER_TABLE + '.phone_number'), primary_key=True)
+    # Keep 'funds' before 'last_transaction_id', MySQL assigns them in order when compacting
+    funds = Column(BigInteger, nullable=False, default=0) # In minor units
+    last_transaction_id = Column(Integer, nullable=False, default=0)
+    updated = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
+
+class BalanceShard(Base):
+    """
+    Part of the funds of a user whose balance is sharded (see control/sharding.py).
+    The balance of a user is User.funds plus the funds of its shards.
+    """
+    __tablename__ = BALANCE_SHARD_TABLE
+    user_phone = Column(String(32), ForeignKey(USER_TABLE + '.phone_number'), primary_key=True)
+    shard = Column(Integer, primary_key=True, autoincrement=False)
+    funds = Column(BigInteger, nullable=False, default=0) # In minor units
+
+
+class IdempotencyKey(Base):
+    """
+    Response to a request sent with an Idempotency-Key header (see control/idempotency.py).
+    """
+    __tablename__ = IDEMPOTENCY_KEY_TABLE
+    key = Column(String(128), primary_key=True)
+    endpoint = Column(String(64), nullable=False)
+    request_hash = Column(String(64), nullable=False)
+    status = Column(Integer, nullable=False)
+    location = Column(String(256), nullable=True)
+    body = Column(Text, nullable=False)
+
+    # Keys are purged by age
+    created = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+
+
+class SchemaVersion(Base):
+    """
+    Number of migrations (see model/migrations.py) applied to the DB.
+    """
+    __tablename__ = SCHEMA_VERSION_TABLE
+    version = Column(Integer, primary_key=True)
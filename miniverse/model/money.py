@@ -0,0 +1,38 @@
+"""
+Money is stored as integers in minor units (cents), so sums and comparisons
+are exact, also when they are done by the DB. Amounts are exchanged in major
+units (ex. 13.05) at the API, and converted with these functions.
+"""
+from decimal import Decimal, InvalidOperation
+
+MINOR_UNITS = 100
+
+
+def to_minor_units(amount):
+    """
+    Converts an amount in major units (int, float, Decimal or a numeric string)
+    to minor units. Raises ValueError if it is not a number or has more
+    decimals than the minor unit allows (ex. 0.001).
+    """
+    if isinstance(amount, bool) or not isinstance(amount, (int, long, float, Decimal, basestring)):
+        raise ValueError("Amounts must be numbers.")
+    try:
+        # repr gives the shortest string that represents the float (ex. '13.05')
+        decimal_amount = Decimal(repr(amount)) if isinstance(amount, float) else Decimal(amount)
+    except InvalidOperation:
+        raise ValueError("Amounts must be numbers.")
+    if not decimal_amount.is_finite():
+        raise ValueError("Amounts must be numbers.")
+
+    minor_units = decimal_amount * MINOR_UNITS
+    if minor_units != minor_units.to_integral_value():
+        raise ValueError("Amounts can not have more than 2 decimals.")
+    return int(minor_units)
+
+
+def to_major_units(minor_units):
+    """
+    Converts an amount in minor units to major units, as a float to be sent
+    as a json number.
+    """
+    return minor_units / float(MINOR_UNITS)
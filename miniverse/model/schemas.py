@@ -1,6 +1,7 @@
 from marshmallow_sqlalchemy import ModelSchema
-from marshmallow import fields
+from marshmallow import fields, ValidationError
 from miniverse.model.model import User, Transaction, Transfer, CreditCard, CreditCardTransaction
+from miniverse.model.money import to_minor_units, to_major_units
 from miniverse.service.urldefines import USER_GET_URI, TRANSACTION_GET_URI, CREDIT_CARD_GET_URL
 
 
@@ -19,14 +20,33 @@ class CardUri(fields.Field):
         return CREDIT_CARD_GET_URL.format(card_number=card_number)
 
 
+class MoneyField(fields.Field):
+    """
+    Money is stored in minor units and serialized in major units.
+    """
+    def _serialize(self, minor_units, attr, obj, **kwargs):
+        if minor_units is None:
+            return None
+        return to_major_units(minor_units)
+
+    def _deserialize(self, amount, attr, data, **kwargs):
+        try:
+            return to_minor_units(amount)
+        except ValueError, e:
+            raise ValidationError(str(e))
+
+
 class UserSchema(ModelSchema):
+    funds = MoneyField()
+
     class Meta:
         model = User
-        exclude = ("cards",)
+        exclude = ("cards", "version")
 
 
 class TransactionSchema(ModelSchema):
     user = UserUri(attribute="user_phone", dump_only=True)
+    amount = MoneyField()
 
     class Meta:
         model = Transaction
@@ -49,6 +69,36 @@ class CreditCardSchema(ModelSchema):
 
 class CreditCardTransactionSchema(ModelSchema):
     card = CardUri(attribute="card_id", dump_only=True)
+    amount = MoneyField()
 
     class Meta:
         model = CreditCardTransaction
+
+
+# Schemas are stateless when dumping, so they can be created once and reused
+USER_SCHEMA = UserSchema()
+TRANSACTION_SCHEMA = TransactionSchema()
+TRANSACTIONS_SCHEMA = TransactionSchema(many=True)
+TRANSFER_SCHEMA = TransferSchema()
+
+# Fast path: the columns of a transaction, to be queried as plain rows and
+# serialized with 'transaction_row_to_dict' (same output as TransactionSchema once
+# encoded, see service/encoder.py)
+TRANSACTION_COLUMNS = (Transaction.id, Transaction.amount, Transaction.type, Transaction.user_phone,
+                       Transaction.created)
+
+
+def transaction_row_to_dict(row):
+    """
+    Serializes a row with the TRANSACTION_COLUMNS of a transaction without
+    creating the ORM object. The creation time is left as a datetime, for the
+    response encoder to format it.
+    """
+    transaction_id, amount, transaction_type, user_phone, created = row
+    return {
+        "id": transaction_id,
+        "amount": to_major_units(amount),
+        "type": transaction_type,
+        "user": USER_GET_URI.format(user_id=user_phone),
+        "created": created
+    }
@@ -1,7 +1,111 @@
+import os
+import threading
+from thread import get_ident
+from flask import _app_ctx_stack
+from sqlalchemy import event
 from sqlalchemy.engine import create_engine
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.orm import scoped_session
 from sqlalchemy.orm.session import sessionmaker
+from sqlalchemy.pool import QueuePool
+from miniverse.model.migrations import upgrade
 from miniverse.model.model import Base
 
+# Connection pool options, and the config keys / environment variables they are read from
+POOL_OPTIONS = {
+    "pool_size": ("DB_POOL_SIZE", "MINIVERSE_DB_POOL_SIZE", int),
+    "max_overflow": ("DB_MAX_OVERFLOW", "MINIVERSE_DB_MAX_OVERFLOW", int),
+    "pool_recycle": ("DB_POOL_RECYCLE", "MINIVERSE_DB_POOL_RECYCLE", int),
+    "pool_pre_ping": ("DB_POOL_PRE_PING", "MINIVERSE_DB_POOL_PRE_PING",
+                      lambda value: str(value).lower() in ("1", "true", "yes"))
+}
+
+# Only pools that keep a fixed set of connections (not the sqlite ones) can be sized
+SIZE_POOL_OPTIONS = ("pool_size", "max_overflow")
+
+
+def get_pool_options(config=None):
+    """
+    Reads the connection pool options from the environment or, if not defined
+    there, from 'config' (ex. the flask app config).
+    """
+    config = config or {}
+    pool_options = {}
+    for option, (config_key, env_var, parse) in POOL_OPTIONS.items():
+        value = os.environ.get(env_var, config.get(config_key))
+        if value is not None:
+            pool_options[option] = parse(value)
+    return pool_options
+
+
+def get_engine_options(db_url, pool_options):
+    """
+    Drops the pool options the pool of the DB does not accept.
+    """
+    url = make_url(db_url)
+    if issubclass(url.get_dialect().get_pool_class(url), QueuePool):
+        return dict(pool_options)
+    return dict((option, value) for option, value in pool_options.items() if option not in SIZE_POOL_OPTIONS)
+
+
+def get_session_scope():
+    """
+    Sessions are shared inside a flask app context (i.e. a request) or, out of
+    it, inside a thread.
+    """
+    app_context = _app_ctx_stack.top
+    if app_context is not None:
+        return app_context
+    return get_ident()
+
+
+class PoolStats(object):
+    """
+    Counts the connection checkouts and checkins of the pool of an engine.
+    """
+    def __init__(self, engine):
+        self.engine = engine
+        self.lock = threading.Lock()
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.peak_checked_out = 0
+        event.listen(engine, "connect", self.on_connect)
+        event.listen(engine, "checkout", self.on_checkout)
+        event.listen(engine, "checkin", self.on_checkin)
+
+    def on_connect(self, dbapi_connection, connection_record):
+        with self.lock:
+            self.connects += 1
+
+    def on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        with self.lock:
+            self.checkouts += 1
+            self.peak_checked_out = max(self.peak_checked_out, self.checkouts - self.checkins)
+
+    def on_checkin(self, dbapi_connection, connection_record):
+        with self.lock:
+            self.checkins += 1
+
+    def as_dict(self):
+        """
+        Current values of the counters. 'overflow' is the number of connections
+        opened over the size of the pool (only for pools with a fixed size).
+        """
+        with self.lock:
+            stats = {
+                "connects": self.connects,
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "checked_out": self.checkouts - self.checkins,
+                "peak_checked_out": self.peak_checked_out
+            }
+        pool = self.engine.pool
+        if isinstance(pool, QueuePool):
+            stats["size"] = pool.size()
+            stats["overflow"] = max(pool.overflow(), 0)
+        return stats
+
 
 class _Singleton(type):
     """ A metaclass that creates a Singleton base class when called. """
@@ -14,22 +118,60 @@ class _Singleton(type):
 
 
 class Singleton(_Singleton('SingletonMeta', (object,), {})):
-    pass
+
+    @classmethod
+    def is_initialized(cls):
+        return cls in _Singleton._instances
 
 
 class DbSessionHolder(Singleton):
     """
     Keeps a copy of the session maker of sqlalchemy to be used when needed.
+    The schema is created (or upgraded) if needed, but data is never dropped,
+    unless 'upgrade_schema' is false (ex. when it was upgraded before starting
+    the process). Sessions are scoped (see get_session_scope), so all the calls
+    inside a request get the same session, which must be removed when the
+    request ends.
     """
-    def __init__(self, db_url):
-        self.engine = create_engine(db_url)
-        self.Session = None
-        self.reset()
+    def __init__(self, db_url, pool_options=None, upgrade_schema=True):
+        self.engine = create_engine(db_url, **get_engine_options(db_url, pool_options or {}))
+        self.pool_stats = PoolStats(self.engine)
+        self.Session = scoped_session(sessionmaker(bind=self.engine), scopefunc=get_session_scope)
+        self.pool_is_warm = False
+        if upgrade_schema:
+            upgrade(self.engine)
 
     def reset(self):
+        """
+        Drops all the data and recreates the schema. Useful for testing.
+        """
+        self.Session.remove()
         Base.metadata.drop_all(bind=self.engine)
-        Base.metadata.create_all(self.engine)
-        self.Session = sessionmaker(bind=self.engine)
+        upgrade(self.engine)
 
     def get_session(self):
         return self.Session()
+
+    def remove_session(self):
+        """
+        Closes the session of the current scope (rolling back anything not
+        committed) and gives its connection back to the pool.
+        """
+        self.Session.remove()
+
+    def warm_up_pool(self, connections):
+        """
+        Opens 'connections' connections (at most the size of the pool) at the
+        same time and gives them back to the pool, so the first requests do
+        not have to wait for them.
+        """
+        pool = self.engine.pool
+        if isinstance(pool, QueuePool):
+            connections = min(connections, pool.size())
+        opened = [self.engine.connect() for _ in range(max(connections, 1))]
+        for connection in opened:
+            connection.close()
+        self.pool_is_warm = True
+
+    def get_pool_stats(self):
+        return self.pool_stats.as_dict()
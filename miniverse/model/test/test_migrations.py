@@ -0,0 +1,102 @@
+import unittest
+from sqlalchemy import inspect, Float, MetaData, Table
+from sqlalchemy.engine import create_engine
+from miniverse.model.migrations import upgrade, get_schema_version, set_schema_version, store_money_in_minor_units, \
+    MIGRATIONS, _convert_column_to_minor_units
+from miniverse.model.model import Base, TRANSACTION_TABLE, TRANSFER_TABLE, USER_TABLE, SCHEMA_VERSION_TABLE, \
+    MONEY_COLUMNS
+
+
+class TestMigrations(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+
+    def get_index_names(self, table_name):
+        return set(index["name"] for index in inspect(self.engine).get_indexes(table_name))
+
+    def test_new_db(self):
+        upgrade(self.engine)
+        self.assertEqual(len(MIGRATIONS), get_schema_version(self.engine))
+        self.assertIn("ix_transaction_user_phone_id", self.get_index_names(TRANSACTION_TABLE))
+
+        # Upgrading again does nothing
+        upgrade(self.engine)
+        self.assertEqual(len(MIGRATIONS), get_schema_version(self.engine))
+
+    def test_existing_db(self):
+        # A DB created before the indexes were added
+        Base.metadata.create_all(self.engine)
+        for index_name in ["ix_transaction_user_phone_id", "ix_transfer_withdrawal_id", "ix_transfer_deposit_id"]:
+            self.engine.execute("DROP INDEX " + index_name)
+        self.engine.execute("DROP TABLE schema_version")
+        self.engine.execute("INSERT INTO user (phone_number, name, pass_hash) VALUES ('0000', 'pep', '----')")
+
+        upgrade(self.engine)
+        self.assertEqual(len(MIGRATIONS), get_schema_version(self.engine))
+        self.assertEqual({"ix_transaction_user_phone_id"}, self.get_index_names(TRANSACTION_TABLE))
+        self.assertEqual({"ix_transfer_withdrawal_id", "ix_transfer_deposit_id"},
+                         self.get_index_names(TRANSFER_TABLE))
+        self.assertEqual(1, self.engine.execute("SELECT COUNT(*) FROM " + USER_TABLE).scalar())
+
+    def test_money_to_minor_units(self):
+        # A DB where money was stored as floats, before schema versions existed
+        metadata = MetaData()
+        for table in Base.metadata.sorted_tables:
+            if table.name != SCHEMA_VERSION_TABLE:
+                table = table.tometadata(metadata)
+                for column_name in MONEY_COLUMNS.get(table.name, ()):
+                    table.c[column_name].type = Float()
+        metadata.create_all(self.engine)
+        self.engine.execute("INSERT INTO user (phone_number, name, pass_hash, funds) VALUES ('0000', 'pep', '--', 233.05)")
+        self.engine.execute("INSERT INTO \"transaction\" (user_phone, amount, type) VALUES ('0000', -4.05, 'FUNDS_WITHDRAWAL')")
+
+        upgrade(self.engine)
+        self.assertEqual(len(MIGRATIONS), get_schema_version(self.engine))
+        funds = self.engine.execute("SELECT funds FROM user").scalar()
+        amount = self.engine.execute("SELECT amount FROM \"transaction\"").scalar()
+        self.assertEqual((23305, -405), (funds, amount))
+        self.assertIsInstance(funds, (int, long))
+        self.assertEqual({"ix_transaction_user_phone_id"}, self.get_index_names(TRANSACTION_TABLE))
+        self.assertEqual(["user"], [foreign_key["referred_table"]
+                                    for foreign_key in inspect(self.engine).get_foreign_keys(TRANSACTION_TABLE)])
+
+    def test_money_to_minor_units_twice(self):
+        # A migration interrupted after converting the money (ex. by a MySQL implicit commit) runs again
+        upgrade(self.engine)
+        self.engine.execute("INSERT INTO user (phone_number, name, pass_hash, funds) VALUES ('0000', 'pep', '--', 23305)")
+        with self.engine.begin() as connection:
+            store_money_in_minor_units(connection)
+        self.assertEqual(23305, self.engine.execute("SELECT funds FROM user").scalar())
+
+    def test_convert_column_to_minor_units(self):
+        # The conversion used by the DBs that can change column types, interrupted after adding the new column
+        self.engine.execute("CREATE TABLE user (phone_number VARCHAR(32) PRIMARY KEY, funds FLOAT, "
+                            "funds_minor BIGINT)")
+        self.engine.execute("INSERT INTO user (phone_number, funds, funds_minor) VALUES ('0000', 1677721.61, 5)")
+        with self.engine.begin() as connection:
+            columns = dict((column["name"], column["type"]) for column in inspect(connection).get_columns(USER_TABLE))
+            _convert_column_to_minor_units(connection, USER_TABLE, "funds", columns)
+
+        self.assertEqual(["phone_number", "funds"],
+                         [column["name"] for column in inspect(self.engine).get_columns(USER_TABLE)])
+        self.assertEqual(167772161, self.engine.execute("SELECT funds FROM user").scalar())
+
+    def test_user_version(self):
+        # A DB created before users had a version
+        metadata = MetaData()
+        for table in Base.metadata.sorted_tables:
+            if table.name == USER_TABLE:
+                Table(USER_TABLE, metadata, *[column.copy() for column in table.columns if column.name != "version"])
+            else:
+                table.tometadata(metadata)
+        metadata.create_all(self.engine)
+        set_schema_version(self.engine, len(MIGRATIONS) - 1)
+        self.engine.execute("INSERT INTO user (phone_number, name, pass_hash, funds) VALUES ('0000', 'pep', '--', 100)")
+
+        upgrade(self.engine)
+        self.assertEqual(len(MIGRATIONS), get_schema_version(self.engine))
+        self.assertEqual((100, 0), tuple(self.engine.execute("SELECT funds, version FROM user").first()))
+
+if __name__ == '__main__':
+    unittest.main()
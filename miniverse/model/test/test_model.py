@@ -10,7 +10,8 @@ import miniverse.model.test as test_module
 from miniverse.model.model import Base, User, Transaction, TransactionType, TransferType, Transfer, CreditCard, \
     CreditCardTransaction, CreditCardStatus
 from miniverse.model.schemas import UserSchema, TransactionSchema, TransferSchema, CreditCardTransactionSchema, \
-    CreditCardSchema
+    CreditCardSchema, TRANSACTIONS_SCHEMA, TRANSACTION_COLUMNS, transaction_row_to_dict
+from miniverse.service.encoder import dumps
 
 
 class TestModel(unittest.TestCase):
@@ -44,12 +45,12 @@ class TestModel(unittest.TestCase):
         john_card = CreditCard(user=john,
                                number="4929867030624094",
                                status=CreditCardStatus.ACTIVE) # yeha! a Visa cc!
-        cc_transaction = CreditCardTransaction(card=john_card, amount=-10)
+        cc_transaction = CreditCardTransaction(card=john_card, amount=-1000)
 
         # But they share expenses :) (5 and 5 eu!)
-        transaction1 = Transaction(user=susan, type=TransactionType.TRANSFER_WITHDRAWAL, amount=-5.0,
+        transaction1 = Transaction(user=susan, type=TransactionType.TRANSFER_WITHDRAWAL, amount=-500,
                              created=datetime.datetime.strptime('24052010', "%d%m%Y").date())
-        transaction2 = Transaction(user=john, type=TransactionType.TRANSFER_DEPOSIT, amount=5.0,
+        transaction2 = Transaction(user=john, type=TransactionType.TRANSFER_DEPOSIT, amount=500,
                              created=datetime.datetime.strptime('24052010', "%d%m%Y").date())
         transfer = Transfer(withdrawal=transaction1,
                             deposit=transaction2,
@@ -100,6 +101,12 @@ class TestModel(unittest.TestCase):
         self.maxDiff = None
         self.assertItemsEqual(data, expected)
 
+    def test_transaction_fast_serialization(self):
+        expected = TRANSACTIONS_SCHEMA.dump(self.session.query(Transaction).order_by(Transaction.id).all()).data
+        rows = self.session.query(*TRANSACTION_COLUMNS).order_by(Transaction.id).all()
+        # Datetimes are left to the response encoder
+        self.assertEqual(expected, json.loads(dumps([transaction_row_to_dict(row) for row in rows])))
+
     def test_enums(self):
         self.assertItemsEqual(['PRIVATE', 'PUBLIC'], TransferType.all_values())
         self.assertIn("PUBLIC", TransferType.all_values())
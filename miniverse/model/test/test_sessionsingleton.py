@@ -0,0 +1,58 @@
+import os
+import unittest
+from flask import Flask
+from sqlalchemy.engine import create_engine
+from sqlalchemy.orm import scoped_session
+from sqlalchemy.orm.session import sessionmaker
+from sqlalchemy.pool import QueuePool
+from miniverse.model.sessionsingleton import get_pool_options, get_engine_options, get_session_scope, PoolStats
+
+
+class TestSessionSingleton(unittest.TestCase):
+
+    def tearDown(self):
+        os.environ.pop("MINIVERSE_DB_POOL_SIZE", None)
+
+    def test_get_pool_options(self):
+        self.assertDictEqual({}, get_pool_options())
+
+        config = {"DB_POOL_SIZE": 5, "DB_POOL_PRE_PING": True, "SECRET_KEY": "-"}
+        self.assertDictEqual({"pool_size": 5, "pool_pre_ping": True}, get_pool_options(config))
+
+        # The environment has priority
+        os.environ["MINIVERSE_DB_POOL_SIZE"] = "7"
+        self.assertDictEqual({"pool_size": 7, "pool_pre_ping": True}, get_pool_options(config))
+
+    def test_get_engine_options(self):
+        pool_options = {"pool_size": 5, "max_overflow": 10, "pool_recycle": 3600}
+        self.assertDictEqual(pool_options, get_engine_options("mysql+pymysql://root:password@db:3306/miniverse",
+                                                              pool_options))
+        self.assertDictEqual({"pool_recycle": 3600}, get_engine_options("sqlite:///miniverse.db", pool_options))
+
+    def test_session_scope(self):
+        Session = scoped_session(sessionmaker(), scopefunc=get_session_scope)
+        thread_session = Session()
+        app = Flask(__name__)
+        with app.app_context():
+            request_session = Session()
+            self.assertIs(request_session, Session())
+            self.assertIsNot(thread_session, request_session)
+            Session.remove()
+        with app.app_context():
+            self.assertIsNot(request_session, Session())
+        self.assertIs(thread_session, Session())
+
+    def test_pool_stats(self):
+        engine = create_engine("sqlite://", poolclass=QueuePool, pool_size=1)
+        pool_stats = PoolStats(engine)
+        connection = engine.connect()
+        engine.execute("SELECT 1")
+        stats = pool_stats.as_dict()
+        self.assertEqual((2, 1, 1, 2), (stats["checkouts"], stats["checkins"], stats["checked_out"],
+                                        stats["peak_checked_out"]))
+        self.assertEqual((1, 1), (stats["size"], stats["overflow"]))
+        connection.close()
+        self.assertEqual(0, pool_stats.as_dict()["checked_out"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,15 @@
-from time import sleep
+import os
+from time import sleep, time
 import pymysql
 import sqlalchemy
 from flask import Flask
-from miniverse.model.sessionsingleton import DbSessionHolder
+from sqlalchemy.engine import create_engine
+from miniverse.control.groupcommit import start_group_committer
+from miniverse.control.notifications import create_redis_notifier, set_balance_notifier
+from miniverse.model.migrations import upgrade
+from miniverse.model.sessionsingleton import DbSessionHolder, get_pool_options
+from miniverse.service.metrics import setup_metrics, enable_metrics
+from miniverse.service.profiler import setup_profiler
 from miniverse.service.rest.api import setup_rest_api
 
 DB_NAME = "miniverse_local.db"
@@ -15,37 +22,119 @@ DB_URL = DBTYPE + DB_NAME
 # for mysql docker image
 DB_URL = "mysql+pymysql://root:password@db:3306/miniverse"
 
-app = Flask(__name__) # create the application instance :)
+# DB connection pool (can be overridden with MINIVERSE_DB_* environment variables)
+DB_POOL_SIZE = 10
+DB_MAX_OVERFLOW = 20
+DB_POOL_RECYCLE = 3600
+DB_POOL_PRE_PING = True
 
-app.config.from_object(__name__) # Load config
+# Seconds to wait for the DB to be up
+DB_CONNECT_TIMEOUT = 120
 
-# Load default config and override config from an environment variable
-app.config.update(dict(
-    SECRET_KEY='super secret key',
-    USERNAME='admin',
-    PASSWORD='default'
-))
-app.config.from_envvar('FLASKR_SETTINGS', silent=True)
+# Group commit of POST /transaction (see control/groupcommit.py), enabled with MINIVERSE_GROUP_COMMIT=1
+GROUP_COMMIT = os.environ.get("MINIVERSE_GROUP_COMMIT", "").lower() in ("1", "true", "yes")
+GROUP_COMMIT_MAX_BATCH = 100
+GROUP_COMMIT_MAX_DELAY = 0.005 # seconds
+GROUP_COMMIT_TIMEOUT = 10 # seconds a request waits for its transaction before answering 503
 
-#Init the DB Session
-connected = False
-while not connected:
+# Per endpoint metrics (see service/metrics.py), enabled with MINIVERSE_METRICS=1
+METRICS = os.environ.get("MINIVERSE_METRICS", "").lower() in ("1", "true", "yes")
+SLOW_QUERY_MS = float(os.environ.get("MINIVERSE_SLOW_QUERY_MS", 100))
+
+# Request profiling (see service/profiler.py), enabled by setting a secret or profiling 1 in N requests
+PROFILER_SECRET = os.environ.get("MINIVERSE_PROFILER_SECRET")
+PROFILE_EVERY = int(os.environ.get("MINIVERSE_PROFILE_EVERY", 0))
+PROFILE_DIR = os.environ.get("MINIVERSE_PROFILE_DIR", "profiles")
+PROFILE_RING_SIZE = 100
+
+# Balance change notifications (see control/notifications.py) are shared by the processes through
+# this redis url. Without it, waiters in servers with several processes re-check every few seconds
+NOTIFIER_URL = os.environ.get("MINIVERSE_NOTIFIER_URL")
+NOTIFIER_RECHECK_INTERVAL = float(os.environ.get("MINIVERSE_NOTIFIER_RECHECK_INTERVAL", 2)) # seconds
+
+
+def create_app(config=None):
+    """
+    Creates the flask app with the REST API. 'config' overrides the default
+    configuration.
+    """
+    app = Flask(__name__) # create the application instance :)
+
+    app.config.from_object(__name__) # Load config
+
+    # Load default config and override config from an environment variable
+    app.config.update(dict(
+        SECRET_KEY='super secret key',
+        USERNAME='admin',
+        PASSWORD='default'
+    ))
+    app.config.from_envvar('FLASKR_SETTINGS', silent=True)
+    app.config.update(config or {})
+
+    # Init the REST API
+    setup_rest_api(app)
+    if app.config["METRICS"]:
+        setup_metrics(app)
+    setup_profiler(app)
+    return app
+
+
+def wait_for_db(app, connect):
+    """
+    Calls 'connect' until the DB is up (retrying with an increasing delay, up to
+    DB_CONNECT_TIMEOUT seconds) and returns its result.
+    """
+    deadline = time() + app.config["DB_CONNECT_TIMEOUT"]
+    delay = 0.5
+    while True:
+        try:
+            return connect()
+        except (pymysql.err.OperationalError, sqlalchemy.exc.OperationalError), e:
+            if time() > deadline:
+                raise
+            print "Waiting for the DB:", str(e)
+            sleep(delay)
+            delay = min(delay * 2, 10)
+
+
+def upgrade_db(app):
+    """
+    Creates or upgrades the schema of the DB, waiting for the DB to be up. Servers
+    with several processes do it once, before starting them.
+    """
+    engine = create_engine(app.config["DB_URL"])
     try:
-        DbSessionHolder(DB_URL)
-        connected = True
-        print "Connected to DB"
-    except pymysql.err.OperationalError:
-        sleep(1)
-        print "*", str(e)
-    except sqlalchemy.exc.OperationalError, e:
-        sleep(1)
-        print str(e)
+        wait_for_db(app, lambda: upgrade(engine))
+    finally:
+        engine.dispose()
+
+
+def init_db(app, upgrade_schema=True):
+    """
+    Inits the DB Session, waiting for the DB to be up, and warms up its
+    connection pool. The schema is upgraded too, unless 'upgrade_schema' is false.
+    Starts the group committer if GROUP_COMMIT is enabled, the metrics if
+    METRICS is, and the shared balance notifications if NOTIFIER_URL is set.
+    """
+    db_session_holder = wait_for_db(app, lambda: DbSessionHolder(app.config["DB_URL"], get_pool_options(app.config),
+                                                                 upgrade_schema))
+
+    db_session_holder.warm_up_pool(app.config["DB_POOL_SIZE"])
+    print "Connected to DB"
+
+    if app.config["GROUP_COMMIT"]:
+        start_group_committer(app.config["GROUP_COMMIT_MAX_BATCH"], app.config["GROUP_COMMIT_MAX_DELAY"],
+                              app.config["GROUP_COMMIT_TIMEOUT"])
+    if app.config["METRICS"]:
+        enable_metrics(db_session_holder.engine, app.config["SLOW_QUERY_MS"])
+    if app.config["NOTIFIER_URL"]:
+        set_balance_notifier(create_redis_notifier(app.config["NOTIFIER_URL"]))
 
 
-# Init the REST API
-setup_rest_api(app)
+app = create_app()
 
 if __name__ == "__main__":
+    init_db(app)
     app.run(
         debug=DEBUG,
         host=HOST,
@@ -0,0 +1,48 @@
+"""
+Serves the REST API cooperatively with gevent. Each request runs in a greenlet
+instead of holding an OS thread, and the standard library is monkey patched, so
+while a request waits on MySQL (PyMySQL is pure python, so it becomes non
+blocking) the others keep running. One process can then hold thousands of
+concurrent requests (ex. balance polls) with a small DB pool. The flask app and
+the control operations are the same ones the threaded server uses.
+
+    python -m miniverse.service.async_app --port 5000 --concurrency 2000
+
+gevent is an optional dependency (pip install gevent).
+"""
+if __name__ == "__main__":
+    # Must be done before anything imports socket or threading
+    from gevent import monkey
+    monkey.patch_all()
+
+import argparse
+try:
+    from gevent.pool import Pool
+    from gevent.pywsgi import WSGIServer
+except ImportError:
+    raise ImportError("The async service needs gevent (pip install gevent).")
+from miniverse.service.app import create_app, init_db, HOST, PORT
+
+# Maximum number of requests served at the same time
+CONCURRENCY = 1000
+
+
+def create_server(app, host=HOST, port=PORT, concurrency=CONCURRENCY):
+    """
+    Creates a WSGI server serving 'app' with up to 'concurrency' greenlets.
+    """
+    return WSGIServer((host, port), app, spawn=Pool(concurrency), log=None)
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Serves the REST API with gevent.")
+    arg_parser.add_argument("--host", default=HOST)
+    arg_parser.add_argument("--port", type=int, default=PORT)
+    arg_parser.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    options = arg_parser.parse_args()
+
+    app = create_app()
+    init_db(app)
+    server = create_server(app, options.host, options.port, options.concurrency)
+    print "Serving on {0}:{1}".format(options.host, options.port)
+    server.serve_forever()
@@ -0,0 +1,67 @@
+"""
+JSON encoder of the responses of the REST API. It is the json_encoder of the app,
+so every jsonify goes through it. Datetimes and dates (ex. the creation time of
+the transactions) are encoded as ISO 8601 strings, in the same format the
+schemas use, so lists of rows do not need to format them beforehand; decimal
+amounts are encoded as numbers.
+
+simplejson is an optional dependency (pip install simplejson): if installed it
+encodes the responses, as it is faster than the stdlib json module, with the
+same output (ex. decimals go through default too). Otherwise the stdlib json
+is used, with its C encoder (keys are not sorted, as sorting them disables it).
+"""
+import datetime
+from decimal import Decimal
+from flask.json import JSONEncoder
+from marshmallow.utils import isoformat
+
+try:
+    import simplejson as fast_json
+except ImportError:
+    fast_json = None
+
+BACKEND = "simplejson" if fast_json is not None else "json"
+
+
+def encode_datetime(value):
+    """
+    Same output as marshmallow's isoformat (UTC, with its offset), without
+    localizing naive datetimes.
+    """
+    if value.tzinfo is None:
+        return value.isoformat() + "+00:00"
+    return isoformat(value)
+
+
+class ResponseEncoder(JSONEncoder):
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return encode_datetime(o)
+        if isinstance(o, datetime.date):
+            return o.isoformat()
+        if isinstance(o, Decimal):
+            return float(o)
+        return super(ResponseEncoder, self).default(o)
+
+    def encode(self, o):
+        if fast_json is not None:
+            return fast_json.dumps(o, default=self.default, sort_keys=self.sort_keys, indent=self.indent,
+                                   separators=(self.item_separator, self.key_separator),
+                                   ensure_ascii=self.ensure_ascii, use_decimal=False)
+        return super(ResponseEncoder, self).encode(o)
+
+
+_compact_encoder = ResponseEncoder(separators=(",", ":"))
+
+
+def dumps(data):
+    """
+    Encodes 'data' as the responses are (ex. for the lines of streamed responses).
+    """
+    return _compact_encoder.encode(data)
+
+
+def setup_encoder(app):
+    app.json_encoder = ResponseEncoder
+    app.config["JSON_SORT_KEYS"] = False
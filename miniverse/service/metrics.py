@@ -0,0 +1,270 @@
+"""
+Per endpoint metrics of the REST API: number of SQL statements, time spent in
+the DB, time spent encoding the JSON responses and total time of each request,
+plus samples of the queries slower than a threshold. They are exported (with the
+DB pool, cache and group commit stats) in the Prometheus text format.
+
+Nothing is hooked unless metrics are enabled (MINIVERSE_METRICS=1), so there
+is no overhead otherwise. Metrics are per process: every sample has the 'pid' of
+its process as a label, and each worker must be scraped to see all of them.
+"""
+import os
+import threading
+import time
+from collections import deque
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from miniverse.control.cache import get_balance_cache
+from miniverse.control.groupcommit import get_group_committer
+from miniverse.control.histogram import Histogram
+from miniverse.model.sessionsingleton import DbSessionHolder
+
+DURATION_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5] # seconds
+STATEMENT_BUCKETS = [0, 1, 2, 5, 10, 20, 50, 100]
+SLOW_QUERY_MS = 100
+SLOW_QUERY_SAMPLES = 100
+
+# Stats of the pool and the cache that only grow (the rest are gauges)
+COUNTER_STATS = ("connects", "checkouts", "checkins", "hits", "misses", "evictions", "expirations",
+                 "invalidations")
+
+ENDPOINT_HISTOGRAMS = [
+    ("miniverse_request_duration_seconds", "duration", "Total time of the requests."),
+    ("miniverse_request_db_duration_seconds", "db_duration", "Time spent running SQL statements."),
+    ("miniverse_request_serialization_duration_seconds", "serialization_duration",
+     "Time spent encoding the JSON responses."),
+    ("miniverse_request_statements", "statements", "SQL statements run by a request.")
+]
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class EndpointMetrics(object):
+
+    def __init__(self):
+        self.responses = {}
+        self.duration = Histogram(DURATION_BUCKETS)
+        self.db_duration = Histogram(DURATION_BUCKETS)
+        self.serialization_duration = Histogram(DURATION_BUCKETS)
+        self.statements = Histogram(STATEMENT_BUCKETS)
+
+
+class Metrics(object):
+    """
+    Metrics of the requests, by endpoint and method, and the last SLOW_QUERY_SAMPLES
+    queries that took more than 'slow_query_ms'.
+    """
+    def __init__(self, slow_query_ms=SLOW_QUERY_MS):
+        self.lock = threading.Lock()
+        self.endpoints = {}
+        self.slow_query_ms = slow_query_ms
+        self.slow_queries = deque(maxlen=SLOW_QUERY_SAMPLES)
+        self.slow_query_count = 0
+
+    def get_endpoint(self, endpoint, method):
+        with self.lock:
+            if (endpoint, method) not in self.endpoints:
+                self.endpoints[(endpoint, method)] = EndpointMetrics()
+            return self.endpoints[(endpoint, method)]
+
+    def observe_request(self, endpoint, method, status_code, duration, db_duration, serialization_duration,
+                        statements):
+        endpoint_metrics = self.get_endpoint(endpoint, method)
+        with self.lock:
+            endpoint_metrics.responses[status_code] = endpoint_metrics.responses.get(status_code, 0) + 1
+        endpoint_metrics.duration.observe(duration)
+        endpoint_metrics.db_duration.observe(db_duration)
+        endpoint_metrics.serialization_duration.observe(serialization_duration)
+        endpoint_metrics.statements.observe(statements)
+
+    def observe_query(self, statement, duration, endpoint):
+        if duration * 1000 < self.slow_query_ms:
+            return
+        with self.lock:
+            self.slow_query_count += 1
+            self.slow_queries.append({
+                "statement": statement,
+                "ms": duration * 1000,
+                "endpoint": endpoint,
+                "time": time.time()
+            })
+
+    def get_slow_queries(self):
+        with self.lock:
+            return list(self.slow_queries)
+
+
+_metrics = None
+
+
+def get_metrics():
+    """
+    Returns the metrics being recorded, or None if metrics are disabled.
+    """
+    return _metrics
+
+
+def is_measured():
+    return has_request_context() and "metrics_start" in g
+
+
+def start_request():
+    if _metrics is not None:
+        g.metrics_start = time.time()
+        g.metrics_db_duration = 0.
+        g.metrics_serialization_duration = 0.
+        g.metrics_statements = 0
+
+
+def end_request(response):
+    if _metrics is not None and is_measured():
+        _metrics.observe_request(request.endpoint or "unknown", request.method, response.status_code,
+                                 time.time() - g.metrics_start, g.metrics_db_duration,
+                                 g.metrics_serialization_duration, g.metrics_statements)
+    return response
+
+
+def timed_json_encoder(encoder_class):
+    """
+    Subclass of 'encoder_class' that adds the time spent encoding to the
+    serialization time of the request.
+    """
+    class TimedJSONEncoder(encoder_class):
+
+        def encode(self, o):
+            start = time.time()
+            try:
+                return super(TimedJSONEncoder, self).encode(o)
+            finally:
+                if is_measured():
+                    g.metrics_serialization_duration += time.time() - start
+
+    return TimedJSONEncoder
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context.metrics_start = time.time()
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _metrics is None or context is None or not hasattr(context, "metrics_start"):
+        return
+    duration = time.time() - context.metrics_start
+    endpoint = None
+    if is_measured():
+        g.metrics_db_duration += duration
+        g.metrics_statements += 1
+        endpoint = request.endpoint
+    _metrics.observe_query(statement, duration, endpoint)
+
+
+def setup_metrics(app):
+    """
+    Hooks the start and end of the requests of 'app' (and the encoding of its
+    responses). Requests are only measured while metrics are enabled.
+    """
+    app.before_request(start_request)
+    app.after_request(end_request)
+    app.json_encoder = timed_json_encoder(app.json_encoder)
+
+
+def enable_metrics(engine, slow_query_ms=SLOW_QUERY_MS):
+    """
+    Starts recording metrics, timing the statements executed by 'engine'.
+    """
+    global _metrics
+    if _metrics is None:
+        _metrics = Metrics(slow_query_ms)
+    if not event.contains(engine, "before_cursor_execute", before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", after_cursor_execute)
+    return _metrics
+
+
+def disable_metrics(engine):
+    global _metrics
+    if event.contains(engine, "before_cursor_execute", before_cursor_execute):
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+        event.remove(engine, "after_cursor_execute", after_cursor_execute)
+    _metrics = None
+
+
+def format_labels(labels):
+    return "{" + ",".join('{0}="{1}"'.format(name, value) for name, value in labels) + "}" if labels else ""
+
+
+class PrometheusWriter(object):
+    """
+    Writes metrics in the Prometheus text format. 'labels' are added to every sample.
+    """
+    def __init__(self, labels=()):
+        self.labels = list(labels)
+        self.lines = []
+        self.described = set()
+
+    def describe(self, name, metric_type, description):
+        if name not in self.described:
+            self.described.add(name)
+            self.lines.append("# HELP {0} {1}".format(name, description))
+            self.lines.append("# TYPE {0} {1}".format(name, metric_type))
+
+    def sample(self, name, metric_type, description, value, labels=()):
+        self.describe(name, metric_type, description)
+        self.lines.append("{0}{1} {2}".format(name, format_labels(self.labels + list(labels)), value))
+
+    def stats(self, prefix, description, stats):
+        for name, value in sorted(stats.items()):
+            if name in COUNTER_STATS:
+                self.sample(prefix + name + "_total", "counter", description + " " + name + ".", value)
+            else:
+                self.sample(prefix + name, "gauge", description + " " + name.replace("_", " ") + ".", value)
+
+    def histogram(self, name, description, histogram, labels=()):
+        self.describe(name, "histogram", description)
+        labels = self.labels + list(labels)
+        values = histogram.as_dict()
+        for bucket in values["buckets"]:
+            self.lines.append("{0}_bucket{1} {2}".format(name, format_labels(labels + [("le", bucket["le"])]),
+                                                         bucket["count"]))
+        self.lines.append("{0}_sum{1} {2}".format(name, format_labels(labels), repr(values["sum"])))
+        self.lines.append("{0}_count{1} {2}".format(name, format_labels(labels), values["count"]))
+
+    def text(self):
+        return "\n".join(self.lines) + "\n"
+
+
+def render_metrics():
+    """
+    Returns the metrics of the process in the Prometheus text format.
+    """
+    writer = PrometheusWriter([("pid", os.getpid())])
+    if _metrics is not None:
+        # The samples of a metric must be contiguous, so we loop over the metrics first
+        with _metrics.lock:
+            endpoints = [(endpoint, method, endpoint_metrics, sorted(endpoint_metrics.responses.items()))
+                         for (endpoint, method), endpoint_metrics in sorted(_metrics.endpoints.items())]
+        for endpoint, method, _, responses in endpoints:
+            for status_code, count in responses:
+                writer.sample("miniverse_requests_total", "counter", "Requests served.", count,
+                              [("endpoint", endpoint), ("method", method), ("status", status_code)])
+        for name, attribute, description in ENDPOINT_HISTOGRAMS:
+            for endpoint, method, endpoint_metrics, _ in endpoints:
+                writer.histogram(name, description, getattr(endpoint_metrics, attribute),
+                                 [("endpoint", endpoint), ("method", method)])
+        writer.sample("miniverse_slow_queries_total", "counter", "Queries slower than the slow query threshold.",
+                      _metrics.slow_query_count)
+
+    if DbSessionHolder.is_initialized():
+        writer.stats("miniverse_db_pool_", "DB connection pool", DbSessionHolder().get_pool_stats())
+    writer.stats("miniverse_balance_cache_", "Balance cache", get_balance_cache().stats())
+
+    committer = get_group_committer()
+    if committer is not None:
+        writer.histogram("miniverse_group_commit_batch_size", "Transactions committed together.",
+                         committer.batch_sizes)
+        writer.histogram("miniverse_group_commit_latency_milliseconds",
+                         "Time from the submission of a transaction to its commit.", committer.latencies)
+        writer.sample("miniverse_group_commit_queued", "gauge", "Transactions waiting for the committer.",
+                      committer.queue.qsize())
+    return writer.text()
@@ -0,0 +1,203 @@
+"""
+Sampling profiler for the requests of the REST API. While a profiled request
+runs, a thread samples its stack every PROFILE_INTERVAL seconds, so every
+resource and operation it goes through shows up. Each profile is written in
+the collapsed stack format ("frame;frame;frame count" lines, the input of
+flamegraph.pl or speedscope) to a directory that keeps only the last
+PROFILE_RING_SIZE profiles.
+
+A request is profiled if it carries a token signed with PROFILER_SECRET (in the
+X-Miniverse-Profile header or the 'profile' query argument), or, if PROFILE_EVERY
+is set, one in every PROFILE_EVERY requests. Tokens are generated with:
+
+    MINIVERSE_PROFILER_SECRET=... python -m miniverse.service.profiler /miniverse/v1/transfer
+
+The stacks are sampled with sys._current_frames, which only sees real threads,
+so the profiler is not enabled when gevent patched the threads into greenlets.
+"""
+import argparse
+import hashlib
+import hmac
+import itertools
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from thread import get_ident
+from flask import g, request
+
+PROFILE_HEADER = "X-Miniverse-Profile"
+PROFILE_QUERY_ARG = "profile"
+PROFILE_ID_HEADER = "X-Miniverse-Profile-Id"
+PROFILE_INTERVAL = 0.001 # seconds
+PROFILE_RING_SIZE = 100
+TOKEN_TTL = 3600 # seconds
+
+logger = logging.getLogger(__name__)
+
+
+def sign_profile_request(secret, path, expires):
+    """
+    Returns a token that enables the profiling of the requests to 'path' until
+    'expires' (a timestamp).
+    """
+    signature = hmac.new(secret, "{0}:{1}".format(path, int(expires)), hashlib.sha256).hexdigest()
+    return "{0}:{1}".format(int(expires), signature)
+
+
+def check_profile_token(secret, path, token, now=None):
+    try:
+        token = str(token)
+        expires = int(token.split(":")[0])
+    except ValueError:
+        return False
+    if expires < (now or time.time()):
+        return False
+    return hmac.compare_digest(token, sign_profile_request(secret, path, expires))
+
+
+def frame_name(frame):
+    return "{0}:{1}".format(frame.f_globals.get("__name__", "?"), frame.f_code.co_name)
+
+
+def collapse_stack(frame):
+    """
+    Returns the stack of 'frame' as a string of frames (root first) separated by ';'.
+    """
+    frames = []
+    while frame is not None:
+        frames.append(frame_name(frame))
+        frame = frame.f_back
+    return ";".join(reversed(frames))
+
+
+class StackSampler(threading.Thread):
+    """
+    Counts the stacks of the thread 'thread_id', sampled every 'interval' seconds.
+    """
+    def __init__(self, thread_id, interval=PROFILE_INTERVAL):
+        super(StackSampler, self).__init__(name="stack-sampler")
+        self.daemon = True
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.running = True
+
+    def run(self):
+        while self.running:
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[collapse_stack(frame)] += 1
+            del frame
+            time.sleep(self.interval)
+
+    def stop(self):
+        """
+        Stops sampling and returns the stack counts.
+        """
+        self.running = False
+        self.join()
+        return self.stacks
+
+
+class ProfileRing(object):
+    """
+    Writes profiles to 'directory', deleting the oldest ones so there are at
+    most 'size'. Profile names start with their time, so they sort by age.
+    """
+    def __init__(self, directory, size=PROFILE_RING_SIZE):
+        self.directory = directory
+        self.size = size
+        self.lock = threading.Lock()
+
+    def write(self, description, stacks):
+        """
+        Writes the stack counts of a profile and returns its name.
+        """
+        name = "{0:.6f}-{1}-{2}.collapsed".format(time.time(), os.getpid(), description)
+        with self.lock:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            with open(os.path.join(self.directory, name), "w") as profile_file:
+                for stack, count in sorted(stacks.items()):
+                    profile_file.write("{0} {1}\n".format(stack, count))
+            for old_name in self.get_profiles()[:-self.size]:
+                try:
+                    os.remove(os.path.join(self.directory, old_name))
+                except OSError:
+                    # Deleted meanwhile by another process writing to the same directory
+                    pass
+        return name
+
+    def get_profiles(self):
+        return sorted(name for name in os.listdir(self.directory) if name.endswith(".collapsed"))
+
+
+class RequestProfiler(object):
+    """
+    Decides which requests are profiled and profiles them (see setup_profiler).
+    """
+    def __init__(self, ring, secret=None, every=0, interval=PROFILE_INTERVAL):
+        self.ring = ring
+        self.secret = secret
+        self.every = every
+        self.interval = interval
+        self.counter = itertools.count(1)
+
+    def should_profile(self):
+        token = request.headers.get(PROFILE_HEADER) or request.args.get(PROFILE_QUERY_ARG)
+        if token is not None and self.secret and check_profile_token(self.secret, request.path, token):
+            return True
+        return bool(self.every) and next(self.counter) % self.every == 0
+
+    def start_request(self):
+        if self.should_profile():
+            g.profile_sampler = StackSampler(get_ident(), self.interval)
+            g.profile_sampler.start()
+
+    def end_request(self, response):
+        sampler = g.pop("profile_sampler", None)
+        if sampler is not None:
+            stacks = sampler.stop()
+            description = "{0}-{1}".format(request.method, request.endpoint or "unknown")
+            response.headers[PROFILE_ID_HEADER] = self.ring.write(description, stacks)
+        return response
+
+
+def threads_are_greenlets():
+    """
+    True if gevent monkey patched the thread module (ex. gunicorn --worker-class gevent).
+    """
+    gevent_monkey = sys.modules.get("gevent.monkey")
+    return gevent_monkey is not None and gevent_monkey.is_module_patched("thread")
+
+
+def setup_profiler(app):
+    """
+    Profiles the requests of 'app' (see the configuration in service/app.py).
+    Nothing is hooked if neither a secret nor PROFILE_EVERY are configured, or
+    if requests run in greenlets (their stacks can not be sampled).
+    """
+    if not app.config.get("PROFILER_SECRET") and not app.config.get("PROFILE_EVERY"):
+        return None
+    if threads_are_greenlets():
+        logger.warning("The profiler is disabled: it can not sample the stacks of gevent greenlets.")
+        return None
+    profiler = RequestProfiler(ProfileRing(app.config["PROFILE_DIR"], app.config["PROFILE_RING_SIZE"]),
+                               app.config.get("PROFILER_SECRET"),
+                               app.config.get("PROFILE_EVERY"),
+                               app.config.get("PROFILE_INTERVAL", PROFILE_INTERVAL))
+    app.before_request(profiler.start_request)
+    app.after_request(profiler.end_request)
+    return profiler
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Generates a token to profile the requests to a path.")
+    arg_parser.add_argument("path", help="Path of the requests (ex. /miniverse/v1/transfer).")
+    arg_parser.add_argument("--ttl", type=int, default=TOKEN_TTL, help="Seconds the token is valid.")
+    options = arg_parser.parse_args()
+
+    print sign_profile_request(os.environ["MINIVERSE_PROFILER_SECRET"], options.path, time.time() + options.ttl)
@@ -1,8 +1,13 @@
 from flask_restful import Api
 import miniverse.service.rest.v1 as v1
+from miniverse.model.sessionsingleton import DbSessionHolder
+from miniverse.service.encoder import setup_encoder
+from miniverse.service.rest.readiness import Readiness
+from miniverse.service.rest.stats import GroupCommitStats, Metrics, SlowQueries
 from miniverse.service.rest.tools import py_to_flask
 from miniverse.service.urldefines import USER_GET_TRANSACTIONS_URI, USER_GET_BALANCE_URI, USER_GET_URI, USER_POST_URI, \
-    TRANSACTION_GET_URI, TRANSACTION_POST_URI, TRANSFER_GET_URI, TRANSFER_POST_URI
+    USER_BULK_POST_URI, TRANSACTION_GET_URI, TRANSACTION_POST_URI, TRANSFER_GET_URI, TRANSFER_POST_URI, TRANSFER_BATCH_POST_URI, \
+    READINESS_URI, GROUP_COMMIT_STATS_URI, METRICS_URI, SLOW_QUERIES_URI, USER_GET_BALANCE_STREAM_URI
 
 API_PREFIX = "miniverse"
 
@@ -19,17 +24,33 @@ def gen_resource_url(api_prefix, version_module, resource_name):
     return "/"+"/".join(url_parts)
 
 
+def remove_db_session(exception=None):
+    """
+    Closes the DB session used during the request.
+    """
+    if DbSessionHolder.is_initialized():
+        DbSessionHolder().remove_session()
+
+
 def setup_rest_api(flask_app):
     api = Api(flask_app)
+    flask_app.teardown_appcontext(remove_db_session)
+    setup_encoder(flask_app)
     version = v1
 
     api.add_resource(version.User,
                      gen_resource_url(API_PREFIX, version, py_to_flask(USER_GET_URI)),
                      gen_resource_url(API_PREFIX, version, USER_POST_URI))
 
+    api.add_resource(version.UserBulk,
+                     gen_resource_url(API_PREFIX, version, USER_BULK_POST_URI))
+
     api.add_resource(version.UserBalance,
                      gen_resource_url(API_PREFIX, version, py_to_flask(USER_GET_BALANCE_URI)))
 
+    api.add_resource(version.UserBalanceStream,
+                     gen_resource_url(API_PREFIX, version, py_to_flask(USER_GET_BALANCE_STREAM_URI)))
+
     api.add_resource(version.UserTransactions,
                      gen_resource_url(API_PREFIX, version, py_to_flask(USER_GET_TRANSACTIONS_URI)))
 
@@ -40,3 +61,12 @@ def setup_rest_api(flask_app):
     api.add_resource(version.Transfer,
                      gen_resource_url(API_PREFIX, version, py_to_flask(TRANSFER_GET_URI)),
                      gen_resource_url(API_PREFIX, version, TRANSFER_POST_URI))
+
+    api.add_resource(version.TransferBatch,
+                     gen_resource_url(API_PREFIX, version, TRANSFER_BATCH_POST_URI))
+
+    # Not versioned, it is meant for load balancers and orchestrators
+    api.add_resource(Readiness, "/" + API_PREFIX + READINESS_URI)
+    api.add_resource(GroupCommitStats, "/" + API_PREFIX + GROUP_COMMIT_STATS_URI)
+    api.add_resource(Metrics, "/" + API_PREFIX + METRICS_URI)
+    api.add_resource(SlowQueries, "/" + API_PREFIX + SLOW_QUERIES_URI)
@@ -0,0 +1,20 @@
+from flask import jsonify, make_response
+from flask_api import status
+from flask_restful import Resource
+from miniverse.model.sessionsingleton import DbSessionHolder
+
+
+class Readiness(Resource):
+
+    def __init__(self):
+        pass
+
+    def get(self):
+        """
+        Tells whether the service can take traffic, i.e. its DB connection pool is warm.
+        """
+        if DbSessionHolder.is_initialized() and DbSessionHolder().pool_is_warm:
+            return make_response(jsonify({"ready": True}),
+                                 status.HTTP_200_OK)
+        return make_response(jsonify({"ready": False}),
+                             status.HTTP_503_SERVICE_UNAVAILABLE)
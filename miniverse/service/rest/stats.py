@@ -0,0 +1,55 @@
+from flask import jsonify, make_response
+from flask_api import status
+from flask_restful import Resource
+from miniverse.control.groupcommit import get_group_committer
+from miniverse.service.metrics import render_metrics, get_metrics, PROMETHEUS_CONTENT_TYPE
+
+
+class GroupCommitStats(Resource):
+
+    def __init__(self):
+        pass
+
+    def get(self):
+        """
+        Returns the batch size and latency (in ms) histograms of the group committer.
+        """
+        committer = get_group_committer()
+        stats = {"enabled": committer is not None}
+        if committer is not None:
+            stats.update(committer.stats())
+        return make_response(jsonify(stats),
+                             status.HTTP_200_OK)
+
+
+class Metrics(Resource):
+
+    def __init__(self):
+        pass
+
+    def get(self):
+        """
+        Returns the metrics of this process in the Prometheus text format.
+        """
+        response = make_response(render_metrics(), status.HTTP_200_OK)
+        response.headers["Content-Type"] = PROMETHEUS_CONTENT_TYPE
+        return response
+
+
+class SlowQueries(Resource):
+
+    def __init__(self):
+        pass
+
+    def get(self):
+        """
+        Returns the last queries slower than the slow query threshold.
+        """
+        metrics = get_metrics()
+        if metrics is None:
+            return make_response(jsonify({"enabled": False, "queries": []}),
+                                 status.HTTP_200_OK)
+        return make_response(jsonify({"enabled": True,
+                                      "threshold_ms": metrics.slow_query_ms,
+                                      "queries": metrics.get_slow_queries()}),
+                             status.HTTP_200_OK)
@@ -1,3 +1,15 @@
+from flask import jsonify, make_response, request
+from flask_api import status
+
+# Requests that move money can be retried safely with the same key
+IDEMPOTENCY_KEY_HEADER = "Idempotency-Key"
+IDEMPOTENT_REPLAY_HEADER = "Idempotent-Replayed"
+
+# Clients must revalidate (with If-None-Match) before using their copy
+REVALIDATE_CACHE_CONTROL = "no-cache"
+# Resources that never change (ex. transactions)
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
 
 def parse_status(status):
     """
@@ -13,3 +25,36 @@ def parse_status(status):
 def py_to_flask(url):
     new = url.replace("{", "<").replace("}", ">")
     return new
+
+
+def replay_response(stored):
+    """
+    Rebuilds a response stored for an idempotency key (see control/idempotency.py).
+    """
+    response = make_response(jsonify(stored["body"]), stored["status"])
+    if stored["location"] is not None:
+        response.headers["location"] = stored["location"]
+        response.autocorrect_location_header = False
+    response.headers[IDEMPOTENT_REPLAY_HEADER] = "true"
+    return response
+
+
+def is_not_modified(etag):
+    """
+    True if the client already has the version 'etag' of the resource (it sent
+    it in If-None-Match).
+    """
+    return request.if_none_match.contains_weak(etag)
+
+
+def set_cache_headers(response, etag, cache_control):
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = cache_control
+    return response
+
+
+def not_modified_response(etag, cache_control):
+    """
+    Empty 304 response for clients that already have the version 'etag'.
+    """
+    return set_cache_headers(make_response("", status.HTTP_304_NOT_MODIFIED), etag, cache_control)
@@ -1,5 +1,8 @@
 from miniverse.service.rest.v1.user import User
+from miniverse.service.rest.v1.userbulk import UserBulk
 from miniverse.service.rest.v1.userbalance import UserBalance
+from miniverse.service.rest.v1.userbalancestream import UserBalanceStream
 from miniverse.service.rest.v1.usertransactions import UserTransactions
 from miniverse.service.rest.v1.transaction import Transaction
 from miniverse.service.rest.v1.transfer import Transfer
+from miniverse.service.rest.v1.transferbatch import TransferBatch
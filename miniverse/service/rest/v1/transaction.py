@@ -2,9 +2,14 @@ from flask import jsonify, make_response, request
 from flask_api import status
 from flask_restful import Resource
 from sqlalchemy.exc import IntegrityError
-from miniverse.control.operations import create_transaction
-from miniverse.model.exceptions import NotEnoughMoneyException
+from miniverse.control.groupcommit import get_group_committer
+from miniverse.control.idempotency import get_stored_response, store_response
+from miniverse.control.operations import create_transaction, get_transaction
+from miniverse.model.exceptions import NotEnoughMoneyException, CommitTimeoutException
 from miniverse.model.sessionsingleton import DbSessionHolder
+from miniverse.service.rest.tools import IDEMPOTENCY_KEY_HEADER, IMMUTABLE_CACHE_CONTROL, replay_response, \
+    is_not_modified, not_modified_response, set_cache_headers
+from miniverse.service.urldefines import TRANSACTION_POST_URI
 
 
 class Transaction(Resource):
@@ -12,23 +17,74 @@ class Transaction(Resource):
     def __init__(self):
         pass
 
+    def get(self, transaction_id):
+        """
+        Gets a money transaction. Transactions never change, so they can be cached
+        for as long as clients want, and revalidating them needs no DB access.
+        """
+        etag = "transaction-" + transaction_id
+        if is_not_modified(etag):
+            return not_modified_response(etag, IMMUTABLE_CACHE_CONTROL)
+
+        session = DbSessionHolder().get_session()
+        try:
+            transaction_json = get_transaction(session, int(transaction_id))
+            if not transaction_json:
+                return make_response(jsonify({"error": "Transaction " + transaction_id + " does not exist."}),
+                                     status.HTTP_404_NOT_FOUND)
+            response = make_response(jsonify(transaction_json),
+                                     status.HTTP_200_OK)
+            return set_cache_headers(response, etag, IMMUTABLE_CACHE_CONTROL)
+
+        except ValueError, e:
+            return make_response(jsonify({"error": str(e)}),
+                                 status.HTTP_400_BAD_REQUEST)
+        except Exception, e:
+            session.rollback()
+            return make_response(jsonify({"error": str(e)}),
+                                 status.HTTP_500_INTERNAL_SERVER_ERROR)
+
     def post(self):
         """
-        Creates a money transaction.
+        Creates a money transaction. Requests with an Idempotency-Key header
+        already processed get the original response. With group commit enabled,
+        the transaction is committed by the group committer with others.
         """
         json_data = request.get_json(force=True)
         session = DbSessionHolder().get_session()
+        idempotency_key = request.headers.get(IDEMPOTENCY_KEY_HEADER)
 
         try:
+            if idempotency_key is not None:
+                stored = get_stored_response(session, idempotency_key, TRANSACTION_POST_URI, json_data)
+                if stored is not None:
+                    return replay_response(stored)
+
             # Check that we are not giving the resource a transfer type
             if "TRANSFER" in json_data["type"]:
                 raise ValueError("A single transaction cannot be of 'TRANSFER' type")
 
+            def store_idempotent_response(session, transaction_uri):
+                if idempotency_key is not None:
+                    store_response(session, idempotency_key, TRANSACTION_POST_URI, json_data,
+                                   status.HTTP_201_CREATED, transaction_uri, json_data)
+
             # Create the resource
-            transaction_uri = create_transaction(session,
-                                           json_data["user"],
-                                           json_data["amount"],
-                                           json_data["type"])
+            committer = get_group_committer()
+            if committer is not None:
+                transaction_uri = committer.submit(json_data["user"],
+                                                   json_data["amount"],
+                                                   json_data["type"],
+                                                   on_created=store_idempotent_response)\
+                    .wait(committer.wait_timeout)
+            else:
+                transaction_uri = create_transaction(session,
+                                               json_data["user"],
+                                               json_data["amount"],
+                                               json_data["type"],
+                                               commit=False)
+                store_idempotent_response(session, transaction_uri)
+                session.commit()
 
             response = make_response(jsonify(json_data),
                                      status.HTTP_201_CREATED)
@@ -37,11 +93,22 @@ class Transaction(Resource):
             return response
 
         except (KeyError, ValueError, NotEnoughMoneyException), e:
+            session.rollback()
             return make_response(jsonify({"error": str(e)}),
                                  status.HTTP_400_BAD_REQUEST)
 
+        except CommitTimeoutException, e:
+            # It may still be committed, so clients must retry with the same Idempotency-Key
+            return make_response(jsonify({"error": str(e)}),
+                                 status.HTTP_503_SERVICE_UNAVAILABLE)
+
         except IntegrityError:
             session.rollback()
+            # The same request may have been stored meanwhile
+            stored = get_stored_response(session, idempotency_key, TRANSACTION_POST_URI, json_data) \
+                if idempotency_key is not None else None
+            if stored is not None:
+                return replay_response(stored)
             return make_response(jsonify({"error": "Something weird happened in the DB"}),
                                  status.HTTP_409_CONFLICT)
         except Exception, e:
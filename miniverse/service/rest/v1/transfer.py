@@ -2,10 +2,12 @@ from flask import jsonify, make_response, request
 from flask_api import status
 from flask_restful import Resource
 from sqlalchemy.exc import IntegrityError
-from miniverse.control.operations import create_transfer, get_transaction, create_transaction
-from miniverse.model.exceptions import NotEnoughMoneyException
-from miniverse.model.model import TransactionType
+from miniverse.control.idempotency import get_stored_response, store_response
+from miniverse.control.operations import execute_transfer
+from miniverse.model.exceptions import NotEnoughMoneyException, AsymmetricTransferException
 from miniverse.model.sessionsingleton import DbSessionHolder
+from miniverse.service.rest.tools import IDEMPOTENCY_KEY_HEADER, replay_response
+from miniverse.service.urldefines import TRANSFER_POST_URI
 
 
 class Transfer(Resource):
@@ -15,36 +17,32 @@ class Transfer(Resource):
 
     def post(self):
         """
-        Creates a money transaction.
+        Creates a money transfer between two users. Requests with an
+        Idempotency-Key header already processed get the original response.
         """
         json_data = request.get_json(force=True)
         session = DbSessionHolder().get_session()
+        idempotency_key = request.headers.get(IDEMPOTENCY_KEY_HEADER)
 
         try:
+            if idempotency_key is not None:
+                stored = get_stored_response(session, idempotency_key, TRANSFER_POST_URI, json_data)
+                if stored is not None:
+                    return replay_response(stored)
 
-            withdrawal_uri = create_transaction(
+            transfer_uri = execute_transfer(
                 session,
                 json_data["sender"],
-                -int(json_data["amount"]),
-                TransactionType.TRANSFER_WITHDRAWAL,
-                commit=False
-            )
-
-            deposit_uri = create_transaction(
-                session,
                 json_data["receiver"],
-                int(json_data["amount"]),
-                TransactionType.TRANSFER_DEPOSIT,
-                commit=False
-            )
-
-            transfer_uri = create_transfer(
-                session,
-                withdrawal_uri,
-                deposit_uri,
+                json_data["amount"],
                 json_data["comment"],
-                json_data["type"]
+                json_data["type"],
+                commit=False
             )
+            if idempotency_key is not None:
+                store_response(session, idempotency_key, TRANSFER_POST_URI, json_data,
+                               status.HTTP_201_CREATED, transfer_uri, json_data)
+            session.commit()
 
             response = make_response(jsonify(json_data),
                                      status.HTTP_201_CREATED)
@@ -52,12 +50,18 @@ class Transfer(Resource):
             response.autocorrect_location_header = False
             return response
 
-        except (KeyError, ValueError, NotEnoughMoneyException), e:
+        except (KeyError, ValueError, NotEnoughMoneyException, AsymmetricTransferException), e:
+            session.rollback()
             return make_response(jsonify({"error": str(e)}),
                                  status.HTTP_400_BAD_REQUEST)
 
         except IntegrityError:
             session.rollback()
+            # The same request may have been stored meanwhile
+            stored = get_stored_response(session, idempotency_key, TRANSFER_POST_URI, json_data) \
+                if idempotency_key is not None else None
+            if stored is not None:
+                return replay_response(stored)
             return make_response(jsonify({"error": "Something weird happened in the DB"}),
                                  status.HTTP_409_CONFLICT)
         except Exception, e:
@@ -0,0 +1,66 @@
+from flask import jsonify, make_response, request
+from flask_api import status
+from flask_restful import Resource
+from sqlalchemy.exc import IntegrityError
+from webargs import fields
+from webargs.flaskparser import parser
+from miniverse.control.operations import execute_transfers
+from miniverse.model.exceptions import NotEnoughMoneyException, AsymmetricTransferException, \
+    ConcurrentUpdateException
+from miniverse.model.sessionsingleton import DbSessionHolder
+
+post_args = {
+    "chunk_size": fields.Int(missing=None, required=False)
+}
+
+
+def transfer_result_to_json(result):
+    """
+    Converts the result of one of the transfers of the batch into its status json.
+    """
+    if isinstance(result, basestring):
+        return {"status": status.HTTP_201_CREATED, "location": result}
+
+    if isinstance(result, (KeyError, ValueError, NotEnoughMoneyException, AsymmetricTransferException)):
+        return {"status": status.HTTP_400_BAD_REQUEST, "error": str(result)}
+
+    if isinstance(result, IntegrityError):
+        return {"status": status.HTTP_409_CONFLICT, "error": "Something weird happened in the DB"}
+
+    if isinstance(result, ConcurrentUpdateException):
+        return {"status": status.HTTP_409_CONFLICT, "error": str(result)}
+
+    return {"status": status.HTTP_500_INTERNAL_SERVER_ERROR, "error": str(result)}
+
+
+class TransferBatch(Resource):
+
+    def __init__(self):
+        pass
+
+    def post(self):
+        """
+        Creates a batch of money transfers. Returns the status of each one of them.
+        """
+        json_data = request.get_json(force=True)
+        session = DbSessionHolder().get_session()
+        args = parser.parse(post_args, request, locations=("query",))
+
+        try:
+            if not isinstance(json_data, list):
+                raise ValueError("A batch of transfers must be a list.")
+
+            results = execute_transfers(session, json_data, chunk_size=args["chunk_size"])
+
+            response = make_response(jsonify([transfer_result_to_json(result) for result in results]),
+                                     status.HTTP_200_OK)
+            return response
+
+        except ValueError, e:
+            return make_response(jsonify({"error": str(e)}),
+                                 status.HTTP_400_BAD_REQUEST)
+
+        except Exception, e:
+            session.rollback()
+            return make_response(jsonify({"error": str(e)}),
+                                 status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -2,8 +2,10 @@ from flask import jsonify, make_response, request
 from flask_api import status
 from flask_restful import Resource
 from sqlalchemy.exc import IntegrityError
-from miniverse.control.operations import create_user
+from miniverse.control.operations import create_user, get_user, get_user_version
 from miniverse.model.sessionsingleton import DbSessionHolder
+from miniverse.service.rest.tools import REVALIDATE_CACHE_CONTROL, is_not_modified, not_modified_response, \
+    set_cache_headers
 
 
 class User(Resource):
@@ -11,6 +13,31 @@ class User(Resource):
     def __init__(self):
         pass
 
+    def get(self, user_id):
+        """
+        Gets a user (without its password hash). Clients sending the ETag of their
+        copy in If-None-Match get an empty 304 if the user has not changed.
+        """
+        session = DbSessionHolder().get_session()
+        try:
+            etag = get_user_version(session, user_id)
+            if is_not_modified(etag):
+                return not_modified_response(etag, REVALIDATE_CACHE_CONTROL)
+
+            user_json = get_user(session, user_id)
+            user_json.pop("pass_hash", None)
+            response = make_response(jsonify(user_json),
+                                     status.HTTP_200_OK)
+            return set_cache_headers(response, etag, REVALIDATE_CACHE_CONTROL)
+
+        except KeyError, e:
+            return make_response(jsonify({"error": str(e)}),
+                                 status.HTTP_404_NOT_FOUND)
+        except Exception, e:
+            session.rollback()
+            return make_response(jsonify({"error": str(e)}),
+                                 status.HTTP_500_INTERNAL_SERVER_ERROR)
+
     def post(self):
         """
         Creates a new user.
@@ -1,11 +1,24 @@
-from flask import jsonify, make_response
+import os
+from flask import jsonify, make_response, request
 from flask_api import status
 from flask_restful import Resource
 from sqlalchemy.exc import IntegrityError
-from miniverse.control.operations import get_user_balance
+from webargs import fields
+from webargs.flaskparser import parser
+from miniverse.control.operations import get_user_balance, get_user_version, wait_for_user_change
 from miniverse.model.sessionsingleton import DbSessionHolder
+from miniverse.service.rest.tools import REVALIDATE_CACHE_CONTROL, is_not_modified, not_modified_response, \
+    set_cache_headers
 from miniverse.service.urldefines import USER_GET_URI
 
+# Longest wait of a long-poll (seconds)
+LONG_POLL_TIMEOUT = float(os.environ.get("MINIVERSE_LONG_POLL_TIMEOUT", 30))
+
+get_args = {
+    "wait_for_version": fields.Str(missing=None, required=False),
+    "timeout": fields.Float(missing=LONG_POLL_TIMEOUT, required=False, validate=lambda timeout: timeout >= 0)
+}
+
 
 class UserBalance(Resource):
 
@@ -14,10 +27,24 @@ class UserBalance(Resource):
 
     def get(self, user_id):
         """
-        Gets the balance of a given user
+        Gets the balance of a given user. Clients sending the ETag of their copy
+        in If-None-Match get an empty 304 if the balance has not changed.
+        Long-polling clients send it in 'wait_for_version' instead: the response
+        is delayed until the balance changes, or until 'timeout' seconds (at most
+        LONG_POLL_TIMEOUT) have passed, and then it is a 304.
         """
         session = DbSessionHolder().get_session()
+        args = parser.parse(get_args, request)
+
         try:
+            known_version = args["wait_for_version"].strip('"') if args["wait_for_version"] is not None else None
+            if known_version is not None:
+                etag = wait_for_user_change(session, user_id, known_version, min(args["timeout"], LONG_POLL_TIMEOUT))
+            else:
+                etag = get_user_version(session, user_id)
+            if etag == known_version or is_not_modified(etag):
+                return not_modified_response(etag, REVALIDATE_CACHE_CONTROL)
+
             balance = get_user_balance(session, user_id)
             balance_json = {
                 "balance": balance,
@@ -27,7 +54,7 @@ class UserBalance(Resource):
             response = make_response(jsonify(balance_json),
                                      status.HTTP_201_CREATED)
             response.autocorrect_location_header = False
-            return response
+            return set_cache_headers(response, etag, REVALIDATE_CACHE_CONTROL)
 
         except KeyError, e:
             return make_response(jsonify({"error": str(e)}),
@@ -0,0 +1,76 @@
+import os
+import time
+from flask import jsonify, make_response, request, Response, stream_with_context
+from flask_api import status
+from flask_restful import Resource
+from webargs import fields
+from webargs.flaskparser import parser
+from miniverse.control.operations import get_user_balance, get_user_version, wait_for_user_change
+from miniverse.model.sessionsingleton import DbSessionHolder
+from miniverse.service.encoder import dumps
+from miniverse.service.urldefines import USER_GET_URI
+
+EVENT_STREAM_MIMETYPE = "text/event-stream"
+# Seconds between the comments sent to keep idle streams open
+SSE_KEEPALIVE = 15
+# Longest time a stream is kept open (seconds); clients reconnect after it
+SSE_MAX_DURATION = float(os.environ.get("MINIVERSE_SSE_MAX_DURATION", 300))
+
+get_args = {
+    "timeout": fields.Float(missing=SSE_MAX_DURATION, required=False, validate=lambda timeout: timeout >= 0)
+}
+
+
+def balance_event(version, balance, user_id):
+    return "id: {0}\nevent: balance\ndata: {1}\n\n".format(version, dumps({
+        "balance": balance,
+        "user": USER_GET_URI.format(user_id=user_id)
+    }))
+
+
+class UserBalanceStream(Resource):
+
+    def __init__(self):
+        pass
+
+    def get(self, user_id):
+        """
+        Streams the balance of a user as Server-Sent Events: the current balance
+        first, and then the new one every time it changes, for 'timeout' seconds
+        (at most SSE_MAX_DURATION). The id of each event is the version of the
+        balance, so a reconnecting client (sending it in Last-Event-ID) does not
+        get the balance again unless it changed.
+        """
+        session = DbSessionHolder().get_session()
+        args = parser.parse(get_args, request)
+
+        try:
+            get_user_version(session, user_id)
+        except KeyError, e:
+            return make_response(jsonify({"error": str(e)}),
+                                 status.HTTP_404_NOT_FOUND)
+        finally:
+            session.close()
+
+        last_version = request.headers.get("Last-Event-ID")
+        deadline = time.time() + min(args["timeout"], SSE_MAX_DURATION)
+
+        def generate_events(version):
+            remaining = deadline - time.time()
+            while remaining > 0:
+                new_version = wait_for_user_change(session, user_id, version, min(remaining, SSE_KEEPALIVE))
+                if new_version == version:
+                    event = ": keepalive\n\n"
+                else:
+                    version = new_version
+                    event = balance_event(version, get_user_balance(session, user_id), user_id)
+                # Do not hold a DB connection while the client reads
+                session.close()
+                yield event
+                remaining = deadline - time.time()
+
+        response = Response(stream_with_context(generate_events(last_version)), mimetype=EVENT_STREAM_MIMETYPE)
+        response.headers["Cache-Control"] = "no-cache"
+        # Proxies (ex. nginx) must not buffer the events
+        response.headers["X-Accel-Buffering"] = "no"
+        return response
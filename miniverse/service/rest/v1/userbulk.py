@@ -0,0 +1,42 @@
+from flask import jsonify, make_response, request
+from flask_api import status
+from flask_restful import Resource
+from sqlalchemy.exc import IntegrityError
+from miniverse.control.operations import bulk_create_users
+from miniverse.model.sessionsingleton import DbSessionHolder
+
+
+class UserBulk(Resource):
+
+    def __init__(self):
+        pass
+
+    def post(self):
+        """
+        Creates many users at once. Returns how many have been created and the
+        phone numbers that were already in use.
+        """
+        json_data = request.get_json(force=True)
+        session = DbSessionHolder().get_session()
+
+        try:
+            if not isinstance(json_data, list):
+                raise ValueError("A bulk of users must be a list.")
+
+            created, duplicates = bulk_create_users(session, json_data)
+            response = make_response(jsonify({"created": created, "duplicates": duplicates}),
+                                     status.HTTP_200_OK)
+            return response
+
+        except (KeyError, ValueError), e:
+            session.rollback()
+            return make_response(jsonify({"error": str(e)}),
+                                 status.HTTP_400_BAD_REQUEST)
+        except IntegrityError:
+            session.rollback()
+            return make_response(jsonify({"error": "Something weird happened in the DB"}),
+                                 status.HTTP_409_CONFLICT)
+        except Exception, e:
+            session.rollback()
+            return make_response(jsonify({"error": str(e)}),
+                                 status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -1,17 +1,43 @@
-from flask import jsonify, make_response
+from flask import jsonify, make_response, Response, stream_with_context
 from flask_api import status
 from flask_restful import Resource
-from miniverse.control.operations import get_user_transactions
+from miniverse.control.operations import get_user_transactions, iter_user_transactions
 from miniverse.model.sessionsingleton import DbSessionHolder
+from miniverse.service.encoder import dumps
 from webargs import fields
 from flask import request
 from webargs.flaskparser import parser
 
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+NDJSON_MIMETYPE = "application/x-ndjson"
+
 get_args = {
-    "expand": fields.Bool(missing=False, required=False)
+    "expand": fields.Bool(missing=False, required=False),
+    "after_id": fields.Int(missing=None, required=False),
+    "limit": fields.Int(missing=None, required=False, validate=lambda limit: limit > 0),
+    "stream": fields.Bool(missing=False, required=False)
 }
 
 
+def get_transaction_id(transaction):
+    """
+    Id of a transaction of the list (expanded or not).
+    """
+    if isinstance(transaction, dict):
+        return transaction["id"]
+    return int(transaction.split("/")[-1])
+
+
+def next_page_link(base_url, args, after_id):
+    """
+    Link header pointing to the next page of transactions.
+    """
+    query = "after_id={after_id}&limit={limit}".format(after_id=after_id, limit=args["limit"])
+    if args["expand"]:
+        query += "&expand=true"
+    return '<{base_url}?{query}>; rel="next"'.format(base_url=base_url, query=query)
+
+
 class UserTransactions(Resource):
 
     def __init__(self):
@@ -19,16 +45,36 @@ class UserTransactions(Resource):
 
     def get(self, user_id):
         """
-        Gets the balance of a given user
+        Gets the transactions of a given user. They can be paginated with
+        'after_id' and 'limit', or streamed as json lines with 'stream'.
         """
         session = DbSessionHolder().get_session()
         args = parser.parse(get_args, request)
 
         try:
-            transactions = get_user_transactions(session, user_id, expand=args["expand"])
+            if args["stream"]:
+                transactions = iter_user_transactions(session, user_id,
+                                                      expand=args["expand"],
+                                                      after_id=args["after_id"])
+                lines = (dumps(transaction) + "\n" for transaction in transactions)
+                return Response(stream_with_context(lines),
+                                status=status.HTTP_201_CREATED,
+                                mimetype=NDJSON_MIMETYPE)
+
+            transactions = get_user_transactions(session, user_id,
+                                                 expand=args["expand"],
+                                                 after_id=args["after_id"],
+                                                 limit=args["limit"])
 
             response = make_response(jsonify(transactions),
                                      status.HTTP_201_CREATED)
+
+            # A full page means there may be more transactions
+            if args["limit"] is not None and len(transactions) == args["limit"]:
+                last_id = get_transaction_id(transactions[-1])
+                response.headers["Link"] = next_page_link(request.base_url, args, last_id)
+                response.headers[NEXT_CURSOR_HEADER] = str(last_id)
+
             response.autocorrect_location_header = False
             return response
 
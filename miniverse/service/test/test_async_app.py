@@ -0,0 +1,58 @@
+import json
+import unittest
+from miniverse.control.operations import create_user
+from miniverse.model.sessionsingleton import DbSessionHolder
+from miniverse.service.app import create_app
+from miniverse.service.rest.api import gen_resource_url, API_PREFIX
+from miniverse.service.rest import v1
+from miniverse.service.test import test_v1_api
+from miniverse.service.urldefines import USER_GET_BALANCE_URI
+
+try:
+    import gevent
+    from gevent import socket
+    from miniverse.service.async_app import create_server
+except ImportError:
+    gevent = None
+
+
+def http_get(address, path):
+    """
+    Minimal HTTP client over gevent sockets. Returns the status line and the body.
+    """
+    connection = socket.create_connection(address)
+    connection.sendall("GET {0} HTTP/1.0\r\nHost: localhost\r\n\r\n".format(path))
+    response = ""
+    data = connection.recv(4096)
+    while data:
+        response += data
+        data = connection.recv(4096)
+    connection.close()
+    head, body = response.split("\r\n\r\n", 1)
+    return head.splitlines()[0], body
+
+
+@unittest.skipIf(gevent is None, "gevent is not installed")
+class TestAsyncApp(unittest.TestCase):
+
+    def setUp(self):
+        DbSessionHolder('sqlite:///' + test_v1_api.TestV1API.REST_TEST_DB).reset()
+        create_user(DbSessionHolder().get_session(), "0000", "Finn", "1413434", 233.05)
+        DbSessionHolder().remove_session()
+        self.server = create_server(create_app({"TESTING": True}), "127.0.0.1", 0, concurrency=10)
+        self.server.start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_concurrent_requests(self):
+        endpoint = gen_resource_url(API_PREFIX, v1, USER_GET_BALANCE_URI.format(user_id="0000"))
+        clients = [gevent.spawn(http_get, ("127.0.0.1", self.server.server_port), endpoint) for _ in range(50)]
+        gevent.joinall(clients, raise_error=True)
+        for client in clients:
+            status_line, body = client.value
+            self.assertIn("201", status_line)
+            self.assertDictEqual({"balance": 233.05, "user": "/user/0000"}, json.loads(body))
+
+if __name__ == "__main__":
+    unittest.main()
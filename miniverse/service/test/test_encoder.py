@@ -0,0 +1,92 @@
+import datetime
+import json
+import unittest
+from decimal import Decimal
+from flask import jsonify
+from flask.app import Flask
+from marshmallow.utils import isoformat
+from miniverse.service import encoder
+from miniverse.service.encoder import dumps, encode_datetime, setup_encoder, ResponseEncoder
+
+try:
+    import simplejson
+except ImportError:
+    simplejson = None
+
+
+class UTCPlusOne(datetime.tzinfo):
+
+    def utcoffset(self, dt):
+        return datetime.timedelta(hours=1)
+
+    def dst(self, dt):
+        return datetime.timedelta(0)
+
+
+class StubSimplejson(object):
+    """
+    Stands in for simplejson (an optional dependency) with the stdlib json.
+    """
+    def __init__(self):
+        self.calls = []
+
+    def dumps(self, o, use_decimal=True, **options):
+        self.calls.append(use_decimal)
+        return json.dumps(o, **options)
+
+
+def encode_all(data):
+    return [ResponseEncoder().encode(data),
+            ResponseEncoder(sort_keys=True, indent=2).encode(data),
+            dumps(data)]
+
+
+class TestEncoder(unittest.TestCase):
+
+    def check_fast_json(self, fast_json):
+        """
+        Checks that the responses encoded with 'fast_json' are the same as the
+        ones encoded with the stdlib json.
+        """
+        data = {"created": datetime.datetime(2010, 5, 24, 10, 30), "day": datetime.date(2010, 5, 24),
+                "amount": Decimal("73.050"), "name": u"Jos\xe9", "values": [1, 2.5, None, True]}
+        original_fast_json = encoder.fast_json
+        try:
+            encoder.fast_json = None
+            expected = encode_all(data)
+            encoder.fast_json = fast_json
+            self.assertEqual(expected, encode_all(data))
+        finally:
+            encoder.fast_json = original_fast_json
+
+    def test_fast_json(self):
+        stub = StubSimplejson()
+        self.check_fast_json(stub)
+        self.assertEqual([False] * 3, stub.calls)
+
+    @unittest.skipIf(simplejson is None, "simplejson is not installed")
+    def test_simplejson(self):
+        self.check_fast_json(simplejson)
+
+    def test_datetimes(self):
+        for value in [datetime.datetime(2010, 5, 24), datetime.datetime(2010, 5, 24, 10, 30, 5, 123),
+                      datetime.datetime(2010, 5, 24, 10, 30, tzinfo=UTCPlusOne())]:
+            self.assertEqual(isoformat(value), encode_datetime(value))
+
+    def test_dumps(self):
+        self.assertEqual({"created": "2010-05-24T10:30:00+00:00", "day": "2010-05-24", "amount": 73.05},
+                         json.loads(dumps({"created": datetime.datetime(2010, 5, 24, 10, 30),
+                                           "day": datetime.date(2010, 5, 24),
+                                           "amount": Decimal("73.05")})))
+        with self.assertRaises(TypeError):
+            dumps({"user": object()})
+
+    def test_jsonify(self):
+        app = Flask(__name__)
+        setup_encoder(app)
+        with app.app_context():
+            response = jsonify([{"created": datetime.datetime(2010, 5, 24)}])
+        self.assertEqual([{"created": "2010-05-24T00:00:00+00:00"}], json.loads(response.data))
+
+if __name__ == "__main__":
+    unittest.main()
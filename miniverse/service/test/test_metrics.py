@@ -0,0 +1,86 @@
+import json
+import os
+import unittest
+from flask.app import Flask
+from miniverse.control.operations import create_user
+from miniverse.model.model import TransactionType
+from miniverse.model.sessionsingleton import DbSessionHolder
+from miniverse.service.metrics import setup_metrics, enable_metrics, disable_metrics, get_metrics, \
+    PROMETHEUS_CONTENT_TYPE, PrometheusWriter
+from miniverse.service.rest import v1
+from miniverse.service.rest.api import setup_rest_api, gen_resource_url, API_PREFIX
+from miniverse.service.urldefines import TRANSACTION_POST_URI, USER_GET_BALANCE_URI, METRICS_URI, SLOW_QUERIES_URI
+
+
+class TestMetrics(unittest.TestCase):
+
+    REST_TEST_DB = "miniverse_metrics_test.db"
+
+    def setUp(self):
+        app = Flask(__name__)
+        app.testing = True
+        setup_rest_api(app)
+        setup_metrics(app)
+        self.client = app.test_client
+        DbSessionHolder('sqlite:///' + TestMetrics.REST_TEST_DB).reset()
+        create_user(DbSessionHolder().get_session(), "0000", "Finn", "1413434", 10.)
+        DbSessionHolder().remove_session()
+
+    def tearDown(self):
+        disable_metrics(DbSessionHolder().engine)
+
+    def get_metrics(self):
+        response = self.client().get("/" + API_PREFIX + METRICS_URI)
+        self.assertEqual(PROMETHEUS_CONTENT_TYPE, response.headers["Content-Type"])
+        return response.data.splitlines()
+
+    def deposit(self):
+        return self.client().post(gen_resource_url(API_PREFIX, v1, TRANSACTION_POST_URI), data=json.dumps({
+            "user": "0000",
+            "amount": 5,
+            "type": TransactionType.FUNDS_DEPOSIT
+        }))
+
+    def test_disabled(self):
+        self.deposit()
+        metrics = self.get_metrics()
+        self.assertFalse([line for line in metrics if line.startswith("miniverse_request")])
+        self.assertIn("# TYPE miniverse_db_pool_checkouts_total counter", metrics)
+        self.assertIn("# TYPE miniverse_balance_cache_evictions_total counter", metrics)
+        # Each worker has its own metrics
+        self.assertTrue([line for line in metrics if line.startswith('miniverse_balance_cache_hits_total{{pid="{0}"}} '
+                                                                     .format(os.getpid()))])
+
+    def test_writer_labels(self):
+        writer = PrometheusWriter([("pid", 7)])
+        writer.sample("requests", "counter", "Requests.", 1, [("method", "GET")])
+        writer.stats("cache_", "Cache", {"size": 2})
+        self.assertEqual('# HELP requests Requests.\n# TYPE requests counter\nrequests{pid="7",method="GET"} 1\n'
+                         '# HELP cache_size Cache size.\n# TYPE cache_size gauge\ncache_size{pid="7"} 2\n',
+                         writer.text())
+
+    def test_request_metrics(self):
+        enable_metrics(DbSessionHolder().engine, slow_query_ms=0)
+        self.deposit()
+        self.deposit()
+        self.client().get(gen_resource_url(API_PREFIX, v1, USER_GET_BALANCE_URI.format(user_id="0000")))
+
+        metrics = [line.replace('pid="{0}",'.format(os.getpid()), "") for line in self.get_metrics()]
+        self.assertIn('miniverse_requests_total{endpoint="transaction",method="POST",status="201"} 2', metrics)
+        self.assertIn('miniverse_request_duration_seconds_count{endpoint="userbalance",method="GET"} 1', metrics)
+        self.assertIn('miniverse_request_duration_seconds_count{endpoint="transaction",method="POST"} 2', metrics)
+        self.assertIn('miniverse_request_serialization_duration_seconds_count{endpoint="transaction",method="POST"} 2',
+                      metrics)
+        # The update of the funds and the insertion of the transaction
+        self.assertIn('miniverse_request_statements_bucket{endpoint="transaction",method="POST",le="1"} 0', metrics)
+        self.assertIn('miniverse_request_statements_bucket{endpoint="transaction",method="POST",le="2"} 2', metrics)
+        self.assertEqual(1, len([line for line in metrics if line == "# TYPE miniverse_request_statements histogram"]))
+
+        # With a threshold of 0 ms all the queries are slow
+        slow_queries = json.loads(self.client().get("/" + API_PREFIX + SLOW_QUERIES_URI).data)
+        self.assertTrue(slow_queries["enabled"])
+        self.assertIn("transaction", [query["endpoint"] for query in slow_queries["queries"]])
+        self.assertGreaterEqual(get_metrics().slow_query_count, 5)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+import json
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+from thread import get_ident
+from flask.app import Flask
+from miniverse.control.operations import create_user
+from miniverse.model.sessionsingleton import DbSessionHolder
+from miniverse.service.profiler import StackSampler, ProfileRing, setup_profiler, sign_profile_request, \
+    check_profile_token, PROFILE_HEADER, PROFILE_ID_HEADER, PROFILE_QUERY_ARG
+from miniverse.service import profiler
+from miniverse.service.rest import v1
+from miniverse.service.rest.api import setup_rest_api, gen_resource_url, API_PREFIX
+from miniverse.service.urldefines import USER_GET_BALANCE_URI
+
+
+def wait_in_test(seconds):
+    time.sleep(seconds)
+
+
+class PatchedGeventMonkey(object):
+    """
+    Stands in for gevent.monkey after patching the threads.
+    """
+    @staticmethod
+    def is_module_patched(name):
+        return name == "thread"
+
+
+class TestProfiler(unittest.TestCase):
+
+    REST_TEST_DB = "miniverse_profiler_test.db"
+
+    def setUp(self):
+        self.profile_dir = tempfile.mkdtemp()
+        DbSessionHolder('sqlite:///' + TestProfiler.REST_TEST_DB).reset()
+        create_user(DbSessionHolder().get_session(), "0000", "Finn", "1413434", 10.)
+        DbSessionHolder().remove_session()
+        self.endpoint = gen_resource_url(API_PREFIX, v1, USER_GET_BALANCE_URI.format(user_id="0000"))
+
+    def tearDown(self):
+        shutil.rmtree(self.profile_dir)
+
+    def create_client(self, **config):
+        app = Flask(__name__)
+        app.testing = True
+        app.config.update(PROFILE_DIR=self.profile_dir, PROFILE_RING_SIZE=2, **config)
+        setup_rest_api(app)
+        setup_profiler(app)
+        return app.test_client()
+
+    def test_sampler(self):
+        sampler = StackSampler(get_ident(), interval=0.001)
+        sampler.start()
+        wait_in_test(0.05)
+        stacks = sampler.stop()
+        self.assertTrue(any(stack.endswith("test_profiler:test_sampler;" + __name__ + ":wait_in_test")
+                            for stack in stacks))
+
+    def test_tokens(self):
+        token = sign_profile_request("secret", "/path", 1000)
+        self.assertTrue(check_profile_token("secret", "/path", token, now=999))
+        self.assertFalse(check_profile_token("secret", "/path", token, now=1001))
+        self.assertFalse(check_profile_token("secret", "/other_path", token, now=999))
+        self.assertFalse(check_profile_token("other_secret", "/path", token, now=999))
+        self.assertFalse(check_profile_token("secret", "/path", "forged", now=999))
+
+    def test_ring(self):
+        ring = ProfileRing(self.profile_dir, size=2)
+        names = [ring.write("test", {"a;b": i + 1}) for i in range(3)]
+        self.assertEqual(names[1:], ring.get_profiles())
+
+    def test_ring_shared_by_processes(self):
+        ring = ProfileRing(self.profile_dir, size=1)
+        get_profiles = ring.get_profiles
+        # Another process deletes an old profile meanwhile
+        ring.get_profiles = lambda: ["0.000000-1-deleted.collapsed"] + get_profiles()
+        name = ring.write("test", {"a;b": 1})
+        self.assertEqual([name], get_profiles())
+
+    def test_signed_requests(self):
+        client = self.create_client(PROFILER_SECRET="secret")
+        self.assertNotIn(PROFILE_ID_HEADER, client.get(self.endpoint).headers)
+        self.assertNotIn(PROFILE_ID_HEADER, client.get(self.endpoint, headers={PROFILE_HEADER: "1:forged"}).headers)
+
+        token = sign_profile_request("secret", self.endpoint, time.time() + 60)
+        response = client.get(self.endpoint, headers={PROFILE_HEADER: token})
+        self.assertEqual(10., json.loads(response.data)["balance"])
+        self.assertIn("GET-userbalance", response.headers[PROFILE_ID_HEADER])
+        response = client.get(self.endpoint + "?{0}={1}".format(PROFILE_QUERY_ARG, token))
+        self.assertIn(PROFILE_ID_HEADER, response.headers)
+        self.assertEqual(2, len(ProfileRing(self.profile_dir).get_profiles()))
+
+    def test_one_in_n_requests(self):
+        client = self.create_client(PROFILE_EVERY=3)
+        profiled = [PROFILE_ID_HEADER in client.get(self.endpoint).headers for _ in range(6)]
+        self.assertEqual([False, False, True, False, False, True], profiled)
+
+    def test_disabled_with_greenlets(self):
+        gevent_monkey = sys.modules.get("gevent.monkey")
+        sys.modules["gevent.monkey"] = PatchedGeventMonkey
+        try:
+            self.assertTrue(profiler.threads_are_greenlets())
+            client = self.create_client(PROFILE_EVERY=1)
+            self.assertNotIn(PROFILE_ID_HEADER, client.get(self.endpoint).headers)
+        finally:
+            if gevent_monkey is None:
+                del sys.modules["gevent.monkey"]
+            else:
+                sys.modules["gevent.monkey"] = gevent_monkey
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,16 +1,22 @@
 import json
+import threading
+import time
 import unittest
 from flask.app import Flask
 from flask_api import status
 
 from miniverse.model.model import TransactionType, TransferType
 from miniverse.service.rest import v1
+from miniverse.control.cache import get_balance_cache
+from miniverse.control.groupcommit import start_group_committer, stop_group_committer, get_group_committer
+from miniverse.control.idempotency import get_response_cache
 from miniverse.control.operations import create_user, get_user_balance, create_transaction
 from miniverse.model.sessionsingleton import DbSessionHolder
 from miniverse.service.rest.api import setup_rest_api, gen_resource_url, API_PREFIX
-from miniverse.service.rest.tools import parse_status
-from miniverse.service.urldefines import USER_POST_URI, USER_GET_URI, USER_GET_BALANCE_URI, TRANSACTION_POST_URI, \
-    TRANSFER_POST_URI, USER_GET_TRANSACTIONS_URI, USER_GET_EXPANDED_TRANSACTIONS_URI
+from miniverse.service.rest.tools import parse_status, IDEMPOTENCY_KEY_HEADER, IDEMPOTENT_REPLAY_HEADER
+from miniverse.service.urldefines import USER_POST_URI, USER_BULK_POST_URI, USER_GET_URI, USER_GET_BALANCE_URI, TRANSACTION_POST_URI, \
+    TRANSFER_POST_URI, USER_GET_TRANSACTIONS_URI, USER_GET_EXPANDED_TRANSACTIONS_URI, TRANSFER_BATCH_POST_URI, \
+    GROUP_COMMIT_STATS_URI, USER_GET_BALANCE_STREAM_URI
 
 
 class TestV1API(unittest.TestCase):
@@ -18,6 +24,9 @@ class TestV1API(unittest.TestCase):
     REST_TEST_DB = "miniverse_rest_api_test.db"
 
     def setUp(self):
+        get_response_cache().clear()
+        # Balances cached by other tests are not in the DB anymore
+        get_balance_cache().clear()
         app = Flask(__name__)
         app.testing = True
         app.config["TESTING"] = True
@@ -50,6 +59,34 @@ class TestV1API(unittest.TestCase):
         }))
         self.assertEqual(status.HTTP_409_CONFLICT, parse_status(response.status))
 
+    def test_bulk_user_creation(self):
+        endpoint = gen_resource_url(API_PREFIX, v1, USER_BULK_POST_URI)
+        response = self.client().post(endpoint, data=json.dumps([
+            {"name": "susan", "phone_number": "0000", "pass_hash": "1111"},
+            {"name": "pep", "phone_number": "0001", "pass_hash": "2222", "funds": 10.},
+            {"name": "pep", "phone_number": "0000", "pass_hash": "3333"}
+        ]))
+        self.assertEqual(status.HTTP_200_OK, parse_status(response.status))
+        self.assertDictEqual({"created": 2, "duplicates": ["0000"]}, json.loads(response.data))
+
+        response = self.client().post(endpoint, data=json.dumps([{"name": "john"}]))
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, parse_status(response.status))
+
+    def test_sessions_are_closed(self):
+        create_user(DbSessionHolder(TestV1API.REST_TEST_DB).get_session(), "0000", "Finn", "1413434", 10.)
+        DbSessionHolder().remove_session()
+        checkouts = DbSessionHolder().get_pool_stats()["checkouts"]
+
+        self.client().get(gen_resource_url(API_PREFIX, v1, USER_GET_BALANCE_URI.format(user_id="0000")))
+        self.client().post(gen_resource_url(API_PREFIX, v1, TRANSACTION_POST_URI), data=json.dumps({
+            "user": "0000",
+            "amount": -300,
+            "type": TransactionType.FUNDS_WITHDRAWAL
+        }))
+        stats = DbSessionHolder().get_pool_stats()
+        self.assertEqual(checkouts + 2, stats["checkouts"])
+        self.assertEqual(0, stats["checked_out"])
+
     def test_balance(self):
         create_user(DbSessionHolder(TestV1API.REST_TEST_DB).get_session(),
                     "0000",
@@ -66,6 +103,101 @@ class TestV1API(unittest.TestCase):
 
         self.assertDictEqual(expected, json.loads(response.data))
 
+    def test_conditional_get(self):
+        session = DbSessionHolder(TestV1API.REST_TEST_DB).get_session()
+        create_user(session, "0000", "Finn", "1413434", 10.)
+        transaction_uri = create_transaction(session, "/user/0000", 5, TransactionType.FUNDS_DEPOSIT)
+        DbSessionHolder().remove_session()
+
+        for uri in [USER_GET_URI, USER_GET_BALANCE_URI]:
+            endpoint = gen_resource_url(API_PREFIX, v1, uri.format(user_id="0000"))
+            response = self.client().get(endpoint)
+            etag = response.headers["ETag"]
+            self.assertEqual("no-cache", response.headers["Cache-Control"])
+            self.assertEqual(15., json.loads(response.data).get("funds", json.loads(response.data).get("balance")))
+
+            # Nothing changed, so nothing is sent
+            response = self.client().get(endpoint, headers={"If-None-Match": etag})
+            self.assertEqual(status.HTTP_304_NOT_MODIFIED, parse_status(response.status))
+            self.assertEqual("", response.data)
+
+            # Any change of the funds changes the ETag
+            create_transaction(DbSessionHolder().get_session(), "/user/0000", 1, TransactionType.FUNDS_DEPOSIT)
+            DbSessionHolder().remove_session()
+            response = self.client().get(endpoint, headers={"If-None-Match": etag})
+            self.assertEqual(status.HTTP_200_OK if uri == USER_GET_URI else status.HTTP_201_CREATED,
+                             parse_status(response.status))
+            self.assertNotEqual(etag, response.headers["ETag"])
+            self.assertEqual(set(), {"pass_hash", "version"} & set(json.loads(response.data)))
+
+            create_transaction(DbSessionHolder().get_session(), "/user/0000", -1, TransactionType.FUNDS_WITHDRAWAL)
+            DbSessionHolder().remove_session()
+            self.assertNotEqual(etag, self.client().get(endpoint).headers["ETag"])
+
+        response = self.client().get(gen_resource_url(API_PREFIX, v1, USER_GET_URI.format(user_id="0001")))
+        self.assertEqual(status.HTTP_404_NOT_FOUND, parse_status(response.status))
+
+        # Transactions never change
+        endpoint = gen_resource_url(API_PREFIX, v1, transaction_uri)
+        response = self.client().get(endpoint)
+        self.assertEqual(status.HTTP_200_OK, parse_status(response.status))
+        self.assertEqual(5., json.loads(response.data)["amount"])
+        self.assertIn("immutable", response.headers["Cache-Control"])
+        response = self.client().get(endpoint, headers={"If-None-Match": response.headers["ETag"]})
+        self.assertEqual(status.HTTP_304_NOT_MODIFIED, parse_status(response.status))
+
+        response = self.client().get(gen_resource_url(API_PREFIX, v1, "/transaction/1000"))
+        self.assertEqual(status.HTTP_404_NOT_FOUND, parse_status(response.status))
+
+    def deposit_later(self, user_id, amount, delay=0.1):
+        def deposit():
+            time.sleep(delay)
+            create_transaction(DbSessionHolder().get_session(), USER_GET_URI.format(user_id=user_id), amount,
+                               TransactionType.FUNDS_DEPOSIT)
+            DbSessionHolder().remove_session()
+        depositor = threading.Thread(target=deposit)
+        depositor.start()
+        return depositor
+
+    def test_balance_long_poll(self):
+        create_user(DbSessionHolder(TestV1API.REST_TEST_DB).get_session(), "0000", "Finn", "1413434", 10.)
+        DbSessionHolder().remove_session()
+        endpoint = gen_resource_url(API_PREFIX, v1, USER_GET_BALANCE_URI.format(user_id="0000"))
+        version = self.client().get(endpoint).headers["ETag"]
+
+        # Nothing changes before the timeout
+        response = self.client().get(endpoint, query_string={"wait_for_version": version, "timeout": 0.05})
+        self.assertEqual(status.HTTP_304_NOT_MODIFIED, parse_status(response.status))
+        self.assertEqual(version, response.headers["ETag"])
+
+        # The response is sent as soon as the balance changes
+        depositor = self.deposit_later("0000", 5)
+        response = self.client().get(endpoint, query_string={"wait_for_version": version, "timeout": 10})
+        depositor.join()
+        self.assertEqual(15., json.loads(response.data)["balance"])
+        self.assertNotEqual(version, response.headers["ETag"])
+
+    def test_balance_stream(self):
+        create_user(DbSessionHolder(TestV1API.REST_TEST_DB).get_session(), "0000", "Finn", "1413434", 10.)
+        DbSessionHolder().remove_session()
+        endpoint = gen_resource_url(API_PREFIX, v1, USER_GET_BALANCE_STREAM_URI.format(user_id="0000"))
+
+        depositor = self.deposit_later("0000", 5)
+        response = self.client().get(endpoint, query_string={"timeout": 0.5})
+        depositor.join()
+        self.assertEqual("text/event-stream", response.mimetype)
+        events = [event for event in response.data.split("\n\n") if event.startswith("id:")]
+        self.assertEqual([10., 15.], [json.loads(event.split("data: ")[1])["balance"] for event in events])
+
+        # Reconnecting clients only get changes
+        last_event_id = events[-1].split("\n")[0][len("id: "):]
+        response = self.client().get(endpoint, query_string={"timeout": 0.05}, headers={"Last-Event-ID": last_event_id})
+        self.assertEqual(": keepalive\n\n", response.data)
+
+        endpoint = gen_resource_url(API_PREFIX, v1, USER_GET_BALANCE_STREAM_URI.format(user_id="0001"))
+        response = self.client().get(endpoint)
+        self.assertEqual(status.HTTP_404_NOT_FOUND, parse_status(response.status))
+
     def test_create_transaction(self):
         session = DbSessionHolder(TestV1API.REST_TEST_DB).get_session()
         create_user(session,
@@ -126,7 +258,131 @@ class TestV1API(unittest.TestCase):
         self.assertEqual("/transfer/1", response.headers["location"])
         finn_balance = get_user_balance(session, "0000")
         jake_balance = get_user_balance(session, "0001")
-        self.assertEqual((220.05, 73.0), (finn_balance, jake_balance))
+        self.assertEqual((220.0, 73.05), (finn_balance, jake_balance))
+
+    def test_idempotency_key(self):
+        session = DbSessionHolder(TestV1API.REST_TEST_DB).get_session()
+        finn_uri = create_user(session, "0000", "Finn", "1413434", 100.)
+        jake_uri = create_user(session, "0001", "Jake", "1413434", 0.)
+        transfer_data = {
+            "sender": finn_uri,
+            "receiver": jake_uri,
+            "amount": 40,
+            "comment": "Tree house rent.",
+            "type": TransferType.PUBLIC
+        }
+        endpoint = gen_resource_url(API_PREFIX, v1, TRANSFER_POST_URI)
+        headers = {IDEMPOTENCY_KEY_HEADER: "test-idempotency-transfer"}
+        response = self.client().post(endpoint, data=json.dumps(transfer_data), headers=headers)
+        self.assertEqual(status.HTTP_201_CREATED, parse_status(response.status))
+        self.assertNotIn(IDEMPOTENT_REPLAY_HEADER, response.headers)
+
+        # Retries get the same response, and the money is moved only once
+        for _ in range(2):
+            retry = self.client().post(endpoint, data=json.dumps(transfer_data), headers=headers)
+            self.assertEqual(status.HTTP_201_CREATED, parse_status(retry.status))
+            self.assertEqual("/transfer/1", retry.headers["location"])
+            self.assertEqual("true", retry.headers[IDEMPOTENT_REPLAY_HEADER])
+            self.assertDictEqual(json.loads(response.data), json.loads(retry.data))
+        self.assertEqual((60., 40.), (get_user_balance(session, "0000"), get_user_balance(session, "0001")))
+
+        # A key can not be reused for another request
+        retry = self.client().post(endpoint, data=json.dumps(dict(transfer_data, amount=30)), headers=headers)
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, parse_status(retry.status))
+
+        endpoint = gen_resource_url(API_PREFIX, v1, TRANSACTION_POST_URI)
+        headers = {IDEMPOTENCY_KEY_HEADER: "test-idempotency-transaction"}
+        transaction_data = {"user": "0000", "amount": 10, "type": TransactionType.FUNDS_DEPOSIT}
+        for _ in range(2):
+            response = self.client().post(endpoint, data=json.dumps(transaction_data), headers=headers)
+            self.assertEqual("/transaction/3", response.headers["location"])
+        self.assertEqual(70., get_user_balance(session, "0000"))
+
+    def test_group_commit(self):
+        session = DbSessionHolder(TestV1API.REST_TEST_DB).get_session()
+        create_user(session, "0000", "Finn", "1413434", 10.)
+        stats_endpoint = "/" + API_PREFIX + GROUP_COMMIT_STATS_URI
+        self.assertDictEqual({"enabled": False}, json.loads(self.client().get(stats_endpoint).data))
+
+        start_group_committer(max_delay=0.001)
+        try:
+            endpoint = gen_resource_url(API_PREFIX, v1, TRANSACTION_POST_URI)
+            response = self.client().post(endpoint, data=json.dumps({
+                "user": "0000", "amount": 5, "type": TransactionType.FUNDS_DEPOSIT}))
+            self.assertEqual(status.HTTP_201_CREATED, parse_status(response.status))
+            self.assertEqual("/transaction/1", response.headers["location"])
+
+            response = self.client().post(endpoint, data=json.dumps({
+                "user": "0000", "amount": -50, "type": TransactionType.FUNDS_WITHDRAWAL}))
+            self.assertEqual(status.HTTP_400_BAD_REQUEST, parse_status(response.status))
+            self.assertEqual(15., get_user_balance(session, "0000"))
+
+            stats = json.loads(self.client().get(stats_endpoint).data)
+            self.assertTrue(stats["enabled"])
+            self.assertEqual(2, stats["batch_size"]["count"])
+
+            # A committer that does not answer in time
+            committer = get_group_committer()
+            committer.wait_timeout = 0.01
+            commit_batch = committer.commit_batch
+            released = threading.Event()
+
+            def slow_commit_batch(batch):
+                released.wait(5)
+                commit_batch(batch)
+            committer.commit_batch = slow_commit_batch
+            response = self.client().post(endpoint, data=json.dumps({
+                "user": "0000", "amount": 5, "type": TransactionType.FUNDS_DEPOSIT}))
+            self.assertEqual(status.HTTP_503_SERVICE_UNAVAILABLE, parse_status(response.status))
+            released.set()
+        finally:
+            stop_group_committer()
+
+    def test_create_transfer_batch(self):
+        session = DbSessionHolder(TestV1API.REST_TEST_DB).get_session()
+        finn_uri = create_user(session, "0000", "Finn", "1413434", 100.)
+        jake_uri = create_user(session, "0001", "Jake", "1413434", 60.)
+
+        transfer_data = {
+            "sender": finn_uri,
+            "receiver": jake_uri,
+            "amount": 40,
+            "comment": "Tree house rent.",
+            "type": TransferType.PUBLIC
+        }
+        endpoint = gen_resource_url(API_PREFIX, v1, TRANSFER_BATCH_POST_URI)
+        self.assertEqual("/miniverse/v1/transfers:batch", endpoint)
+        response = self.client().post(endpoint + "?chunk_size=2", data=json.dumps([
+            transfer_data,
+            transfer_data,
+            dict(transfer_data, amount="forty"),
+            transfer_data
+        ]))
+        self.assertEqual(status.HTTP_200_OK, parse_status(response.status))
+        expected = [
+            {"status": 201, "location": "/transfer/1"},
+            {"status": 201, "location": "/transfer/2"},
+            {"status": 400, "error": "Amounts must be numbers."},
+            {"status": 400, "error": "Not enough money in your wallet!"}
+        ]
+        self.assertEqual(expected, json.loads(response.data))
+        self.assertEqual((20., 140.), (get_user_balance(session, "0000"), get_user_balance(session, "0001")))
+
+        response = self.client().post(endpoint, data=json.dumps(transfer_data))
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, parse_status(response.status))
+
+        # Malformed transfers after committed chunks only fail themselves
+        transfer_data["amount"] = 1
+        response = self.client().post(endpoint + "?chunk_size=1", data=json.dumps([
+            transfer_data,
+            transfer_data,
+            dict(transfer_data, type=None),
+            dict(transfer_data, sender=None),
+            "transfer"
+        ]))
+        self.assertEqual(status.HTTP_200_OK, parse_status(response.status))
+        self.assertEqual([201, 201, 400, 400, 400], [result["status"] for result in json.loads(response.data)])
+        self.assertEqual((18., 142.), (get_user_balance(session, "0000"), get_user_balance(session, "0001")))
 
     def test_get_user_transactions(self):
         session = DbSessionHolder(TestV1API.REST_TEST_DB).get_session()
@@ -155,6 +411,22 @@ class TestV1API(unittest.TestCase):
             del mov["created"]
         self.assertItemsEqual(expected, parsed_response)
 
+        # By pages
+        response = self.client().get(endpoint + "&limit=2")
+        self.assertEqual([1, 2], [mov["id"] for mov in json.loads(response.data)])
+        self.assertEqual("2", response.headers["X-Next-Cursor"])
+        self.assertEqual('<http://localhost/miniverse/v1/user/0000/transactions?after_id=2&limit=2&expand=true>; '
+                         'rel="next"', response.headers["Link"])
+        response = self.client().get(endpoint + "&limit=2&after_id=2")
+        self.assertEqual([3], [mov["id"] for mov in json.loads(response.data)])
+        self.assertNotIn("Link", response.headers)
+
+        # Streamed
+        response = self.client().get(endpoint + "&stream=true")
+        self.assertEqual("application/x-ndjson", response.mimetype)
+        lines = response.data.splitlines()
+        self.assertEqual([1, 2, 3], [json.loads(line)["id"] for line in lines])
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,94 @@
+import json
+import unittest
+from flask_api import status
+from sqlalchemy.engine import create_engine
+from miniverse.control.cache import get_balance_cache, set_balance_cache, LRUCache, NullCache
+from miniverse.control.notifications import get_balance_notifier, set_balance_notifier, LocalNotifier
+from miniverse.model.sessionsingleton import DbSessionHolder
+from miniverse.service.app import create_app
+from miniverse.service.rest.api import API_PREFIX
+from miniverse.service.rest.tools import parse_status
+from miniverse.service.test import test_v1_api
+from miniverse.service.urldefines import READINESS_URI
+from miniverse.model.migrations import upgrade, get_schema_version, MIGRATIONS
+from miniverse.service.wsgi import MiniverseApplication, on_starting, post_fork
+
+
+class FakeLog(object):
+
+    def __init__(self):
+        self.warnings = []
+
+    def warning(self, message):
+        self.warnings.append(message)
+
+
+class FakeServer(object):
+    """
+    The parts of the gunicorn arbiter post_fork uses.
+    """
+    def __init__(self, application, log):
+        self.app = application
+        self.cfg = application.cfg
+        self.log = log
+
+
+class TestWSGI(unittest.TestCase):
+
+    def setUp(self):
+        self.db_url = 'sqlite:///' + test_v1_api.TestV1API.REST_TEST_DB
+        DbSessionHolder(self.db_url).reset()
+        self.cache = get_balance_cache()
+        self.notifier = get_balance_notifier()
+
+    def tearDown(self):
+        set_balance_cache(self.cache)
+        set_balance_notifier(self.notifier)
+
+    def test_readiness(self):
+        client = create_app({"TESTING": True}).test_client
+        DbSessionHolder().pool_is_warm = False
+        response = client().get("/" + API_PREFIX + READINESS_URI)
+        self.assertEqual(status.HTTP_503_SERVICE_UNAVAILABLE, parse_status(response.status))
+        self.assertDictEqual({"ready": False}, json.loads(response.data))
+
+        DbSessionHolder().warm_up_pool(2)
+        response = client().get("/" + API_PREFIX + READINESS_URI)
+        self.assertEqual(status.HTTP_200_OK, parse_status(response.status))
+        self.assertDictEqual({"ready": True}, json.loads(response.data))
+
+    def test_application_config(self):
+        application = MiniverseApplication({"bind": "127.0.0.1:8000", "workers": 3, "threads": 8,
+                                            "preload_app": True, "timeout": None})
+        self.assertEqual(["127.0.0.1:8000"], application.cfg.bind)
+        self.assertEqual(3, application.cfg.workers)
+        self.assertEqual(8, application.cfg.threads)
+        self.assertTrue(application.cfg.preload_app)
+        self.assertEqual(on_starting, application.cfg.on_starting)
+        self.assertEqual(post_fork, application.cfg.post_fork)
+
+    def test_on_starting(self):
+        engine = create_engine(self.db_url)
+        upgrade(engine)
+        engine.execute("DROP TABLE schema_version")
+        application = MiniverseApplication({"workers": 2}, {"DB_URL": self.db_url})
+        on_starting(FakeServer(application, FakeLog()))
+        self.assertEqual(len(MIGRATIONS), get_schema_version(engine))
+
+    def test_post_fork(self):
+        set_balance_cache(LRUCache())
+        set_balance_notifier(LocalNotifier())
+        application = MiniverseApplication({"workers": 2},
+                                           {"DB_URL": self.db_url, "NOTIFIER_RECHECK_INTERVAL": 1.5})
+        log = FakeLog()
+        DbSessionHolder().pool_is_warm = False
+        post_fork(FakeServer(application, log), None)
+
+        # Workers do not share an in-process cache or notifier, and get a warm pool
+        self.assertIsInstance(get_balance_cache(), NullCache)
+        self.assertEqual(1.5, get_balance_notifier().max_wait)
+        self.assertEqual(2, len(log.warnings))
+        self.assertTrue(DbSessionHolder().pool_is_warm)
+
+if __name__ == "__main__":
+    unittest.main()
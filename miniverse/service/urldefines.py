@@ -1,10 +1,17 @@
 USER_GET_URI = "/user/{user_id}"
 USER_POST_URI = "/user"
+USER_BULK_POST_URI = "/user:bulk"
 USER_GET_BALANCE_URI = "/user/{user_id}/balance"
+USER_GET_BALANCE_STREAM_URI = "/user/{user_id}/balance/stream"
 USER_GET_TRANSACTIONS_URI = "/user/{user_id}/transactions"
 USER_GET_EXPANDED_TRANSACTIONS_URI = "/user/{user_id}/transactions?expand=true"
 TRANSACTION_GET_URI = "/transaction/{transaction_id}"
 TRANSACTION_POST_URI = "/transaction"
 TRANSFER_GET_URI = "/transfer/{transfer_id}"
 TRANSFER_POST_URI = "/transfer"
+TRANSFER_BATCH_POST_URI = "/transfers:batch"
 CREDIT_CARD_GET_URL = "/transfer/{card_number}"
+READINESS_URI = "/ready"
+GROUP_COMMIT_STATS_URI = "/stats/group_commit"
+METRICS_URI = "/metrics"
+SLOW_QUERIES_URI = "/stats/slow_queries"
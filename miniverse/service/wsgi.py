@@ -0,0 +1,109 @@
+"""
+Production launcher: serves the REST API with gunicorn, using several worker
+processes (each one with several threads, or greenlets with --worker-class gevent).
+
+    python -m miniverse.service.wsgi --workers 4 --threads 8 --preload
+
+With --preload the app is created once in the master process before forking.
+The schema of the DB is upgraded once, by the master, before forking. Either
+way each worker creates its own DB engine after the fork, so pooled
+connections are never shared between processes, and warms up its pool before
+/miniverse/ready reports it as ready.
+Send HUP to the master process to gracefully replace the workers (without
+--preload, they also load the new code), TERM for a graceful shutdown.
+"""
+import argparse
+import multiprocessing
+from gunicorn.app.base import BaseApplication
+from miniverse.control.cache import get_balance_cache, set_balance_cache, LRUCache, NullCache
+from miniverse.control.notifications import get_balance_notifier, ExternalNotifier
+from miniverse.model.sessionsingleton import DbSessionHolder
+from miniverse.service.app import create_app, init_db, upgrade_db, HOST, PORT
+
+THREADS = 4
+GRACEFUL_TIMEOUT = 30
+TIMEOUT = 30
+
+
+def default_workers():
+    return multiprocessing.cpu_count() * 2 + 1
+
+
+def on_starting(server):
+    """
+    Runs in the master before forking the workers: upgrades the schema of the DB,
+    so the workers do not upgrade it at the same time.
+    """
+    upgrade_db(create_app(server.app.app_config))
+
+
+def post_fork(server, worker):
+    """
+    Runs in each worker right after it is forked: creates the DB engine of the
+    worker (the master already upgraded the schema).
+    """
+    if DbSessionHolder.is_initialized():
+        # Connections opened by the master must not be used by the workers
+        DbSessionHolder().engine.dispose()
+
+    # Each process would have its own copy, and could not see the changes of the others
+    if server.cfg.workers > 1 and isinstance(get_balance_cache(), LRUCache):
+        server.log.warning("The in-process balance cache is disabled when running several workers.")
+        set_balance_cache(NullCache())
+
+    app = server.app.wsgi()
+    init_db(app, upgrade_schema=False)
+
+    # Notifications of the changes made by other workers need a shared channel
+    notifier = get_balance_notifier()
+    if server.cfg.workers > 1 and not isinstance(notifier, ExternalNotifier):
+        server.log.warning("Balance changes made by other workers are only seen every {0} s by long-polls and "
+                           "streams (set MINIVERSE_NOTIFIER_URL).".format(app.config["NOTIFIER_RECHECK_INTERVAL"]))
+        notifier.max_wait = app.config["NOTIFIER_RECHECK_INTERVAL"]
+
+
+class MiniverseApplication(BaseApplication):
+    """
+    Gunicorn application serving the flask app. 'options' are gunicorn settings
+    (ex. workers, threads, preload_app) and 'app_config' overrides the flask config.
+    """
+    def __init__(self, options=None, app_config=None):
+        self.options = options or {}
+        self.app_config = app_config
+        super(MiniverseApplication, self).__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            if key in self.cfg.settings and value is not None:
+                self.cfg.set(key, value)
+        self.cfg.set("on_starting", on_starting)
+        self.cfg.set("post_fork", post_fork)
+
+    def load(self):
+        return create_app(self.app_config)
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Serves the REST API with gunicorn.")
+    arg_parser.add_argument("--bind", default="{0}:{1}".format(HOST, PORT))
+    arg_parser.add_argument("--workers", type=int, default=default_workers())
+    arg_parser.add_argument("--threads", type=int, default=THREADS)
+    arg_parser.add_argument("--worker-class", default="sync",
+                            help="'sync' (threaded if --threads > 1) or 'gevent'.")
+    arg_parser.add_argument("--preload", action="store_true", help="Load the app before forking the workers.")
+    arg_parser.add_argument("--graceful-timeout", type=int, default=GRACEFUL_TIMEOUT)
+    arg_parser.add_argument("--timeout", type=int, default=TIMEOUT)
+    arg_parser.add_argument("--max-requests", type=int, default=0,
+                            help="Restart a worker after this many requests (0 means never).")
+    options = arg_parser.parse_args()
+
+    MiniverseApplication({
+        "bind": options.bind,
+        "workers": options.workers,
+        "threads": options.threads,
+        "worker_class": options.worker_class,
+        "preload_app": options.preload,
+        "graceful_timeout": options.graceful_timeout,
+        "timeout": options.timeout,
+        "max_requests": options.max_requests
+    }).run()
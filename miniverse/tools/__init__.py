@@ -0,0 +1,3 @@
+import os
+
+DEFAULT_DB_URL = os.environ.get("MINIVERSE_DB_URL", "sqlite:///miniverse_local.db")
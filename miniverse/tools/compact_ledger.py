@@ -0,0 +1,58 @@
+"""
+Ledger compactor (see control/ledger.py). Periodically folds the transactions
+into the balance snapshots of their users:
+
+    python -m miniverse.tools.compact_ledger --interval 10 --db-url mysql+pymysql://root:password@db:3306/miniverse
+
+Use --start to create the snapshots before enabling ledger mode, and --stop to
+store the balances back in the users after disabling it (no funds can be moved
+meanwhile).
+"""
+import argparse
+import time
+from sqlalchemy.engine import create_engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm.session import sessionmaker
+from miniverse.control.ledger import compact_ledger, start_ledger, stop_ledger, COMPACTION_GRACE
+from miniverse.model.migrations import upgrade
+from miniverse.tools import DEFAULT_DB_URL
+
+
+def run_compactor(session, interval, grace=COMPACTION_GRACE, runs=None):
+    """
+    Compacts the ledger every 'interval' seconds ('runs' times, or forever if None).
+    Failed runs (ex. deadlocks with withdrawals) are retried in the next one.
+    """
+    run = 0
+    while runs is None or run < runs:
+        try:
+            print "Compacted snapshots:", compact_ledger(session, grace)
+        except OperationalError, e:
+            session.rollback()
+            print "Compaction failed:", str(e)
+        run += 1
+        if runs is None or run < runs:
+            time.sleep(interval)
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Folds the ledger transactions into the balance snapshots.")
+    arg_parser.add_argument("--db-url", default=DEFAULT_DB_URL, help="SQLAlchemy url of the DB.")
+    arg_parser.add_argument("--interval", type=float, default=10, help="Seconds between compactions.")
+    arg_parser.add_argument("--grace", type=float, default=COMPACTION_GRACE,
+                            help="Only transactions older than this (in seconds) are folded.")
+    arg_parser.add_argument("--once", action="store_true", help="Compact only once.")
+    arg_parser.add_argument("--start", action="store_true", help="Create the missing snapshots and exit.")
+    arg_parser.add_argument("--stop", action="store_true", help="Store the balances in the users and exit.")
+    options = arg_parser.parse_args()
+
+    engine = create_engine(options.db_url)
+    upgrade(engine)
+    session = sessionmaker(bind=engine)()
+
+    if options.start:
+        print "Created snapshots:", start_ledger(session)
+    elif options.stop:
+        print "Updated users:", stop_ledger(session)
+    else:
+        run_compactor(session, options.interval, options.grace, runs=1 if options.once else None)
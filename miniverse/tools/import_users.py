@@ -0,0 +1,50 @@
+"""
+Imports users from a file with one json user per line (the same fields 'POST /user'
+accepts, plus optional 'funds'). The file is streamed, so it can be as big as needed.
+
+    python -m miniverse.tools.import_users users.jsonl --db-url mysql+pymysql://root:password@db:3306/miniverse
+"""
+import argparse
+import json
+from sqlalchemy.engine import create_engine
+from sqlalchemy.orm.session import sessionmaker
+from miniverse.control.operations import bulk_create_users
+from miniverse.model.migrations import upgrade
+from miniverse.tools import DEFAULT_DB_URL
+
+
+def read_users(users_file):
+    """
+    Yields the users of a json lines file, skipping empty lines.
+    """
+    for line in users_file:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def import_users(session, users_file, chunk_size=1000):
+    """
+    Stores all the users in the file. Returns the number of created users and
+    the phone numbers that were already in use.
+    """
+    return bulk_create_users(session, read_users(users_file), chunk_size=chunk_size)
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Imports users from a json lines file.")
+    arg_parser.add_argument("users_file", help="File with one json user per line.")
+    arg_parser.add_argument("--db-url", default=DEFAULT_DB_URL, help="SQLAlchemy url of the DB.")
+    arg_parser.add_argument("--chunk-size", type=int, default=1000, help="Users inserted per statement.")
+    options = arg_parser.parse_args()
+
+    engine = create_engine(options.db_url)
+    upgrade(engine)
+    session = sessionmaker(bind=engine)()
+
+    with open(options.users_file) as users_file:
+        created, duplicates = import_users(session, users_file, options.chunk_size)
+
+    print "Created users:", created
+    if duplicates:
+        print "Phone numbers already in use:", ", ".join(duplicates)
@@ -0,0 +1,298 @@
+"""
+Load generator for the REST API. Threads run a mix of scenarios (balance polls,
+transfers between users picked with a Zipf distribution, so a few users get most
+of the traffic, and expanded transaction history reads) and the throughput and
+latency percentiles of each one are reported:
+
+    python -m miniverse.tools.load_test --url http://127.0.0.1:5000 --threads 32 --duration 30 \
+        --mix balance=70,transfer=20,history=10
+
+Without --url the API is served in-process (no network) from a sqlite DB, which
+is dropped and recreated:
+
+    python -m miniverse.tools.load_test --db-url sqlite:///load_test.db --requests 2000
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from bisect import bisect_left
+import requests
+from requests.adapters import HTTPAdapter
+from tabulate import tabulate
+from miniverse.model.model import TransferType
+from miniverse.service.rest import v1
+from miniverse.service.rest.api import API_PREFIX, get_version
+from miniverse.service.urldefines import USER_BULK_POST_URI, USER_GET_BALANCE_URI, TRANSFER_POST_URI, \
+    USER_GET_EXPANDED_TRANSACTIONS_URI, USER_GET_URI
+
+API_ROOT = "/" + API_PREFIX + "/" + get_version(v1)
+
+DEFAULT_MIX = "balance=70,transfer=20,history=10"
+USER_FUNDS = 1000000.
+USERS_PER_REQUEST = 1000
+
+
+class HttpTransport(object):
+    """
+    Sends the requests to a running server through a pool of keep-alive connections.
+    """
+    def __init__(self, url, pool_size=10):
+        self.url = url.rstrip("/") + API_ROOT
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def request(self, method, path, data=None):
+        """
+        Returns the status code and the body of the response.
+        """
+        response = self.session.request(method, self.url + path,
+                                         data=json.dumps(data) if data is not None else None)
+        return response.status_code, response.content
+
+
+class AppTransport(object):
+    """
+    Sends the requests to a flask app in this process (without network).
+    """
+    def __init__(self, app):
+        self.app = app
+        self.clients = threading.local()
+
+    def request(self, method, path, data=None):
+        if not hasattr(self.clients, "client"):
+            self.clients.client = self.app.test_client()
+        response = self.clients.client.open(API_ROOT + path, method=method,
+                                            data=json.dumps(data) if data is not None else None)
+        return response.status_code, response.data
+
+
+class ZipfUsers(object):
+    """
+    Picks users with a Zipf distribution: the k-th user is picked with a
+    probability proportional to 1 / k^exponent.
+    """
+    def __init__(self, user_ids, exponent=1.1):
+        self.user_ids = user_ids
+        self.cumulative = []
+        total = 0.
+        for k in range(1, len(user_ids) + 1):
+            total += 1. / k ** exponent
+            self.cumulative.append(total)
+
+    def pick(self, rand):
+        position = bisect_left(self.cumulative, rand.random() * self.cumulative[-1])
+        return self.user_ids[min(position, len(self.user_ids) - 1)]
+
+    def pick_pair(self, rand):
+        """
+        Picks two different users.
+        """
+        if len(self.user_ids) < 2:
+            raise ValueError("Two different users can not be picked from fewer than two users.")
+        first = self.pick(rand)
+        second = self.pick(rand)
+        while second == first:
+            second = self.pick(rand)
+        return first, second
+
+
+def balance(transport, users, rand):
+    return transport.request("GET", USER_GET_BALANCE_URI.format(user_id=users.pick(rand)))
+
+
+def transfer(transport, users, rand):
+    sender, receiver = users.pick_pair(rand)
+    return transport.request("POST", TRANSFER_POST_URI, {
+        "sender": USER_GET_URI.format(user_id=sender),
+        "receiver": USER_GET_URI.format(user_id=receiver),
+        "amount": 1,
+        "comment": "Load test",
+        "type": TransferType.PUBLIC
+    })
+
+
+def history(transport, users, rand):
+    return transport.request("GET", USER_GET_EXPANDED_TRANSACTIONS_URI.format(user_id=users.pick(rand)))
+
+
+SCENARIOS = {
+    "balance": balance,
+    "transfer": transfer,
+    "history": history
+}
+
+
+def parse_mix(mix):
+    """
+    Parses a "scenario=weight,..." string into a dictionary.
+    """
+    weights = {}
+    for item in mix.split(","):
+        if item.strip():
+            scenario, weight = item.split("=")
+            if scenario.strip() not in SCENARIOS:
+                raise ValueError("Unknown scenario: " + scenario.strip())
+            weights[scenario.strip()] = float(weight)
+    return weights
+
+
+def create_users(transport, users, funds=USER_FUNDS):
+    """
+    Creates the users of the test (the ones already created are reused) and
+    returns their ids.
+    """
+    user_ids = ["lt%06d" % i for i in range(users)]
+    for start in range(0, users, USERS_PER_REQUEST):
+        code, body = transport.request("POST", USER_BULK_POST_URI, [
+            {"name": user_id, "phone_number": user_id, "pass_hash": "-", "funds": funds}
+            for user_id in user_ids[start:start + USERS_PER_REQUEST]
+        ])
+        if code != 200:
+            raise RuntimeError("Users could not be created: " + body)
+    return user_ids
+
+
+def percentile(sorted_values, percent):
+    if not sorted_values:
+        return 0.
+    return sorted_values[min(int(len(sorted_values) * percent / 100.), len(sorted_values) - 1)]
+
+
+class LoadStats(object):
+    """
+    Latencies (in ms) and errors (non 2xx responses or exceptions) of each scenario.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+        self.elapsed = 0.
+
+    def add(self, scenario, latency, error):
+        with self.lock:
+            self.latencies.setdefault(scenario, []).append(latency)
+            self.errors[scenario] = self.errors.get(scenario, 0) + (1 if error else 0)
+
+    def summary(self):
+        """
+        Returns a row per scenario (plus the total) with the number of requests,
+        errors, requests per second and the p50, p95 and p99 latencies.
+        """
+        rows = []
+        everything = []
+        for scenario in sorted(self.latencies):
+            latencies = sorted(self.latencies[scenario])
+            everything.extend(latencies)
+            rows.append(self.row(scenario, latencies, self.errors[scenario]))
+        rows.append(self.row("total", sorted(everything), sum(self.errors.values())))
+        return rows
+
+    def row(self, name, latencies, errors):
+        return {
+            "scenario": name,
+            "requests": len(latencies),
+            "errors": errors,
+            "rps": len(latencies) / self.elapsed if self.elapsed else 0.,
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99)
+        }
+
+
+def run_load(transport, user_ids, mix, threads=8, total_requests=None, duration=None, exponent=1.1, seed=None):
+    """
+    Runs the scenarios of 'mix' (scenario weights) from 'threads' threads until
+    'total_requests' requests have been sent or 'duration' seconds have passed.
+    """
+    if total_requests is None and duration is None:
+        raise ValueError("Either the number of requests or the duration must be given.")
+    scenarios = sorted(mix)
+    cumulative = []
+    for scenario in scenarios:
+        cumulative.append((cumulative[-1] if cumulative else 0.) + mix[scenario])
+    users = ZipfUsers(user_ids, exponent)
+    stats = LoadStats()
+    remaining = [total_requests]
+    lock = threading.Lock()
+    deadline = time.time() + duration if duration is not None else None
+
+    def next_request():
+        if deadline is not None and time.time() > deadline:
+            return False
+        if total_requests is not None:
+            with lock:
+                if remaining[0] <= 0:
+                    return False
+                remaining[0] -= 1
+        return True
+
+    def worker(worker_seed):
+        rand = random.Random(worker_seed)
+        while next_request():
+            scenario = scenarios[bisect_left(cumulative, rand.random() * cumulative[-1])]
+            start = time.time()
+            try:
+                code, _ = SCENARIOS[scenario](transport, users, rand)
+                error = not 200 <= code < 300
+            except Exception:
+                error = True
+            stats.add(scenario, (time.time() - start) * 1000, error)
+
+    seeds = random.Random(seed)
+    workers = [threading.Thread(target=worker, args=(seeds.random(),)) for _ in range(threads)]
+    start = time.time()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    stats.elapsed = time.time() - start
+    return stats
+
+
+def create_local_transport(db_url):
+    """
+    Serves the API in-process from an empty DB.
+    """
+    from miniverse.model.sessionsingleton import DbSessionHolder
+    from miniverse.service.app import create_app, init_db
+    app = create_app({"DB_URL": db_url})
+    init_db(app)
+    DbSessionHolder().reset()
+    return AppTransport(app)
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Generates load on the REST API.")
+    arg_parser.add_argument("--url", help="Base url of the server (ex. http://127.0.0.1:5000). "
+                                          "If not given, the API is served in-process.")
+    arg_parser.add_argument("--db-url", default="sqlite:///load_test.db",
+                            help="SQLAlchemy url of the DB for the in-process API (it will be dropped).")
+    arg_parser.add_argument("--mix", default=DEFAULT_MIX, help="Weights of the scenarios: " + ", ".join(SCENARIOS))
+    arg_parser.add_argument("--users", type=int, default=1000)
+    arg_parser.add_argument("--zipf", type=float, default=1.1, help="Exponent of the Zipf distribution of users.")
+    arg_parser.add_argument("--threads", type=int, default=8)
+    arg_parser.add_argument("--requests", type=int, help="Total requests to send.")
+    arg_parser.add_argument("--duration", type=float, help="Seconds to send requests for (default 10).")
+    arg_parser.add_argument("--seed", type=int)
+    options = arg_parser.parse_args()
+    if options.users < 2:
+        arg_parser.error("--users must be at least 2, as transfers need two different users.")
+
+    if options.url:
+        load_transport = HttpTransport(options.url, pool_size=options.threads)
+    else:
+        load_transport = create_local_transport(options.db_url)
+    if options.requests is None and options.duration is None:
+        options.duration = 10
+
+    load_user_ids = create_users(load_transport, options.users)
+    load_stats = run_load(load_transport, load_user_ids, parse_mix(options.mix), options.threads,
+                          options.requests, options.duration, options.zipf, options.seed)
+    columns = ["scenario", "requests", "errors", "rps", "p50", "p95", "p99"]
+    print tabulate([[row[column] for column in columns] for row in load_stats.summary()],
+                   ["scenario", "requests", "errors", "req/s", "p50 (ms)", "p95 (ms)", "p99 (ms)"],
+                   floatfmt=".1f")
@@ -0,0 +1,20 @@
+"""
+Brings the schema of an existing DB up to date (creating it if needed) without
+losing any data.
+
+    python -m miniverse.tools.migrate_db --db-url mysql+pymysql://root:password@db:3306/miniverse
+"""
+import argparse
+from sqlalchemy.engine import create_engine
+from miniverse.model.migrations import upgrade, get_schema_version
+from miniverse.tools import DEFAULT_DB_URL
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Applies the pending schema migrations.")
+    arg_parser.add_argument("--db-url", default=DEFAULT_DB_URL, help="SQLAlchemy url of the DB.")
+    options = arg_parser.parse_args()
+
+    engine = create_engine(options.db_url)
+    upgrade(engine)
+    print "Schema version:", get_schema_version(engine)
@@ -0,0 +1,26 @@
+"""
+Deletes the responses stored for idempotency keys older than their TTL
+(see control/idempotency.py). Meant to be run periodically (ex. from cron):
+
+    python -m miniverse.tools.purge_idempotency_keys --db-url mysql+pymysql://root:password@db:3306/miniverse
+"""
+import argparse
+from sqlalchemy.engine import create_engine
+from sqlalchemy.orm.session import sessionmaker
+from miniverse.control.idempotency import purge_idempotency_keys, IDEMPOTENCY_KEY_TTL
+from miniverse.model.migrations import upgrade
+from miniverse.tools import DEFAULT_DB_URL
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Deletes the expired idempotency keys.")
+    arg_parser.add_argument("--db-url", default=DEFAULT_DB_URL, help="SQLAlchemy url of the DB.")
+    arg_parser.add_argument("--ttl", type=float, default=IDEMPOTENCY_KEY_TTL,
+                            help="Keys older than this (in seconds) are deleted.")
+    arg_parser.add_argument("--chunk-size", type=int, default=10000, help="Keys deleted per DB transaction.")
+    options = arg_parser.parse_args()
+
+    engine = create_engine(options.db_url)
+    upgrade(engine)
+    session = sessionmaker(bind=engine)()
+    print "Deleted keys:", purge_idempotency_keys(session, options.ttl, options.chunk_size)
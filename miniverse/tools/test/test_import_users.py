@@ -0,0 +1,34 @@
+import json
+import unittest
+from StringIO import StringIO
+from sqlalchemy.engine import create_engine
+from sqlalchemy.orm.session import sessionmaker
+from miniverse.control.operations import get_user_balance
+from miniverse.model.model import Base
+from miniverse.tools.import_users import import_users, read_users
+
+
+class TestImportUsers(unittest.TestCase):
+
+    def setUp(self):
+        engine = create_engine('sqlite://')
+        Base.metadata.create_all(bind=engine)
+        self.session = sessionmaker(bind=engine)()
+        self.users_file = StringIO("\n".join([
+            json.dumps({"name": "susan", "phone_number": "0000", "pass_hash": "1111", "funds": 5.}),
+            "",
+            json.dumps({"name": "pep", "phone_number": "0001", "pass_hash": "2222"}),
+            json.dumps({"name": "john", "phone_number": "0000", "pass_hash": "3333"})
+        ]))
+
+    def test_read_users(self):
+        self.assertEqual(["susan", "pep", "john"], [user["name"] for user in read_users(self.users_file)])
+
+    def test_import_users(self):
+        created, duplicates = import_users(self.session, self.users_file, chunk_size=2)
+        self.assertEqual(2, created)
+        self.assertEqual(["0000"], duplicates)
+        self.assertEqual(5., get_user_balance(self.session, "0000"))
+
+if __name__ == "__main__":
+    unittest.main()
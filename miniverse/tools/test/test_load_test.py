@@ -0,0 +1,58 @@
+import random
+import unittest
+from flask.app import Flask
+from miniverse.control.operations import get_user_balance
+from miniverse.model.sessionsingleton import DbSessionHolder
+from miniverse.service.rest.api import setup_rest_api
+from miniverse.tools.load_test import AppTransport, ZipfUsers, create_users, parse_mix, run_load, percentile
+
+
+class TestLoadTest(unittest.TestCase):
+    TEST_DB = "test_miniverse_load_test.db"
+
+    def setUp(self):
+        app = Flask(__name__)
+        app.testing = True
+        setup_rest_api(app)
+        DbSessionHolder('sqlite:///' + TestLoadTest.TEST_DB).reset()
+        self.transport = AppTransport(app)
+
+    def test_parse_mix(self):
+        self.assertEqual({"balance": 3., "transfer": 1.}, parse_mix("balance=3, transfer=1"))
+        with self.assertRaises(ValueError):
+            parse_mix("balance=3,deposit=1")
+
+    def test_zipf_users(self):
+        users = ZipfUsers(["a", "b", "c", "d"], exponent=2)
+        rand = random.Random(0)
+        picks = [users.pick(rand) for _ in range(1000)]
+        self.assertGreater(picks.count("a"), picks.count("b"))
+        self.assertGreater(picks.count("b"), picks.count("d"))
+        first, second = users.pick_pair(rand)
+        self.assertNotEqual(first, second)
+        with self.assertRaises(ValueError):
+            ZipfUsers(["a"]).pick_pair(rand)
+
+    def test_percentile(self):
+        latencies = range(1, 101)
+        self.assertEqual((51, 96, 100), (percentile(latencies, 50), percentile(latencies, 95),
+                                         percentile(latencies, 99)))
+        self.assertEqual(0., percentile([], 50))
+
+    def test_run_load(self):
+        user_ids = create_users(self.transport, 10, funds=100.)
+        stats = run_load(self.transport, user_ids, parse_mix("balance=1,transfer=1,history=1"),
+                         threads=4, total_requests=60, seed=0)
+
+        rows = dict((row["scenario"], row) for row in stats.summary())
+        self.assertEqual(60, rows["total"]["requests"])
+        self.assertEqual(0, rows["total"]["errors"])
+        self.assertEqual(rows["total"]["requests"], sum(rows[scenario]["requests"]
+                                                        for scenario in ["balance", "transfer", "history"]))
+        # Transfers only move money between the users
+        session = DbSessionHolder().get_session()
+        self.assertEqual(1000., sum(get_user_balance(session, user_id) for user_id in user_ids))
+        DbSessionHolder().remove_session()
+
+if __name__ == "__main__":
+    unittest.main()